@@ -0,0 +1,255 @@
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+
+"""Triangle meshes of DTM (Digital Terrain Model) height grids
+"""
+
+import numpy
+
+
+def grid_vertices(heights, geo_transform, cols=None, rows=None):
+    """World coordinates of the samples of a height grid.
+
+    heights[j, i] is the height at pixel (cols[i], rows[j]) of the raster
+    with the given GDAL geotransform. cols and rows default to the pixel
+    indices of heights. Returns a (rows * cols, 3) array in row major order.
+    """
+    heights = numpy.asarray(heights)
+    if cols is None:
+        cols = numpy.arange(heights.shape[1])
+    if rows is None:
+        rows = numpy.arange(heights.shape[0])
+    u, v = numpy.meshgrid(numpy.asarray(cols, dtype=numpy.float64),
+                          numpy.asarray(rows, dtype=numpy.float64))
+    x = u * geo_transform[1] + geo_transform[0]
+    y = v * geo_transform[5] + geo_transform[3]
+    if geo_transform[2] or geo_transform[4]:
+        x += v * geo_transform[2]
+        y += u * geo_transform[4]
+    return numpy.stack((x.ravel(), y.ravel(), heights.ravel()), axis=1)
+
+
+def grid_faces(shape):
+    """Two triangles per cell of a grid of the given (rows, cols) shape.
+
+    Cell (j, i) with top left vertex k = j * cols + i gives the triangles
+    (k, k + cols, k + 1) and (k + cols, k + cols + 1, k + 1), in the cell
+    order of a row major scan.
+    """
+    nb_v, nb_u = shape
+    if nb_v < 2 or nb_u < 2:
+        return numpy.zeros((0, 3), dtype=numpy.int64)
+    id0 = (numpy.arange(nb_v - 1)[:, None] * nb_u + numpy.arange(nb_u - 1)).ravel()
+    id1 = id0 + 1
+    id2 = id0 + nb_u
+    id3 = id2 + 1
+    faces = numpy.empty((len(id0), 2, 3), dtype=numpy.int64)
+    faces[:, 0] = numpy.stack((id0, id2, id1), axis=1)
+    faces[:, 1] = numpy.stack((id2, id3, id1), axis=1)
+    return faces.reshape(-1, 3)
+
+
+def grid_mesh(heights, geo_transform, cols=None, rows=None, nodata=None):
+    """Triangle mesh of a height grid.
+
+    Vertices whose height is nodata or NaN are removed together with the
+    triangles that use them, and the remaining vertices are renumbered.
+    Returns (V, 3) world coordinates and (F, 3) 0-based vertex indices,
+    ready for a bulk OBJ writer.
+    """
+    heights = numpy.asarray(heights)
+    vertices = grid_vertices(heights, geo_transform, cols, rows)
+    faces = grid_faces(heights.shape)
+    valid = ~numpy.isnan(heights.ravel())
+    if nodata is not None:
+        valid &= heights.ravel() != nodata
+    if not valid.all():
+        faces = faces[valid[faces].all(axis=1)]
+        index = numpy.cumsum(valid) - 1
+        vertices = vertices[valid]
+        faces = index[faces]
+    return vertices, faces
+
+
+def _triangle_template(left, right):
+    """Integer points of the triangle with its apex at the origin and its
+    other vertices at left and right, with their barycentric weights.
+    """
+    corners = numpy.array([[0, 0], left, right])
+    lo = corners.min(axis=0)
+    hi = corners.max(axis=0)
+    r, c = numpy.mgrid[lo[0]:hi[0] + 1, lo[1]:hi[1] + 1]
+    points = numpy.stack((r.ravel(), c.ravel()), axis=1)
+    weights = numpy.linalg.solve(numpy.array([left, right], dtype=numpy.float64).T,
+                                 points.T.astype(numpy.float64)).T
+    weights = numpy.concatenate((1 - weights.sum(axis=1, keepdims=True), weights), axis=1)
+    inside = (weights > -1e-9).all(axis=1)
+    return points[inside], weights[inside]
+
+
+def _triangle_errors(padded, apexes, left, right, chunk_size=1 << 22):
+    """Largest vertical distance between the samples inside congruent
+    triangles and the plane through their vertices.
+
+    The triangles have their apex at apexes and their other vertices at the
+    left and right offsets from it. A triangle with some NaN samples gets an
+    infinite error so that it is split down to the grid cells, one with
+    only NaN samples gets 0.
+    """
+    offsets, weights = _triangle_template(left, right)
+    corner_index = [numpy.flatnonzero((offsets == corner).all(axis=1))[0]
+                    for corner in ((0, 0), left, right)]
+    samples = padded.ravel()
+    offsets = offsets[:, 0] * padded.shape[1] + offsets[:, 1]
+    apexes = apexes[:, 0] * padded.shape[1] + apexes[:, 1]
+    errors = numpy.empty(len(apexes))
+    step = max(1, chunk_size // len(offsets))
+    for i in range(0, len(apexes), step):
+        z = samples.take(apexes[i:i + step, None] + offsets)
+        error = numpy.abs(z - z[:, corner_index].dot(weights.T)).max(axis=1)
+        missing = numpy.isnan(error)
+        error[missing] = numpy.where(numpy.isnan(z[missing]).all(axis=1), 0, numpy.inf)
+        errors[i:i + step] = error
+    return errors
+
+
+def _level_triangles(shape, s):
+    """Triangles of the bintree of a (rows, cols) grid at level s, as
+    (apexes, left offset, right offset, hypotenuse midpoints) groups of
+    congruent triangles.
+
+    The two halves of each square of side s and, when s > 1, the triangles
+    with an edge of such a square as hypotenuse and a square center as apex.
+    Squares with even i + j, for square indices (i, j), are split along
+    their main diagonal, the others along their anti-diagonal.
+    """
+    nb_r, nb_c = shape
+    h = s // 2
+    groups = []
+    r0, c0 = numpy.meshgrid(numpy.arange(0, nb_r - 1, s), numpy.arange(0, nb_c - 1, s),
+                            indexing='ij')
+    main = (r0 // s + c0 // s) % 2 == 0
+    corner = numpy.stack((r0.ravel(), c0.ravel()), axis=1)
+    center = corner + h
+    for selection, apex, left, right in [
+            (main, (s, 0), (-s, 0), (0, s)),
+            (main, (0, s), (0, -s), (s, 0)),
+            (~main, (0, 0), (0, s), (s, 0)),
+            (~main, (s, s), (0, -s), (-s, 0))]:
+        selection = selection.ravel()
+        groups.append((corner[selection] + apex, left, right, center[selection]))
+    if s < 2:
+        return groups
+
+    r, c = numpy.meshgrid(numpy.arange(0, nb_r, s), numpy.arange(h, nb_c, s),
+                          indexing='ij')
+    horizontal = numpy.stack((r.ravel(), c.ravel()), axis=1)
+    r, c = numpy.meshgrid(numpy.arange(h, nb_r, s), numpy.arange(0, nb_c, s),
+                          indexing='ij')
+    vertical = numpy.stack((r.ravel(), c.ravel()), axis=1)
+    for mid, side, apex, left, right in [
+            (horizontal, horizontal[:, 0] > 0, (-h, 0), (h, -h), (h, h)),
+            (horizontal, horizontal[:, 0] < nb_r - 1, (h, 0), (-h, -h), (-h, h)),
+            (vertical, vertical[:, 1] > 0, (0, -h), (-h, h), (h, h)),
+            (vertical, vertical[:, 1] < nb_c - 1, (0, h), (-h, -h), (h, -h))]:
+        groups.append((mid[side] + apex, left, right, mid[side]))
+    return groups
+
+
+def simplified_grid_mesh(heights, geo_transform, max_error, cols=None, rows=None,
+                         nodata=None, max_size=256):
+    """Adaptive triangle mesh of a height grid.
+
+    The grid is covered by squares of max_size samples that are refined by
+    longest edge bisection of right triangles (a restricted quadtree). A
+    triangle is kept when no sample inside it is more than max_error away
+    from its plane. The error of a triangle is also charged to the
+    triangles it depends on, which keeps the mesh free of cracks. Nodata
+    and NaN samples are left out like in grid_mesh. Returns vertices and
+    faces like grid_mesh, the vertices being a subset of its vertices.
+    """
+    heights = numpy.asarray(heights)
+    if min(heights.shape) < 2:
+        return grid_mesh(heights, geo_transform, cols, rows, nodata)
+    z = heights.astype(numpy.float64)
+    if nodata is not None:
+        z[heights == nodata] = numpy.nan
+
+    # squares of side 2^k, padded with NaN samples to whole squares
+    size = 1
+    while size < min(max_size, min(z.shape) - 1):
+        size *= 2
+    shape = tuple(-(-(n - 1) // size) * size + 1 for n in z.shape)
+    padded = numpy.full(shape, numpy.nan)
+    padded[:z.shape[0], :z.shape[1]] = z
+
+    # error of each vertex: the largest error of the triangles it splits,
+    # and of the vertices of its children, from the finest level up.
+    # err is padded by size so that neighbor lookups stay in bounds
+    err = numpy.zeros((shape[0] + 2 * size, shape[1] + 2 * size))
+    view = err[size:-size, size:-size]
+    s = 2
+    while s <= size:
+        h = s // 2
+        groups = _level_triangles(shape, s)
+        for apexes, left, right, mid in groups[4:]:
+            errors = _triangle_errors(padded, apexes, left, right)
+            numpy.maximum.at(view, (mid[:, 0], mid[:, 1]), errors)
+        if h > 1:
+            q = h // 2
+            for rs, cs in [(slice(0, None, s), slice(h, None, s)),
+                           (slice(h, None, s), slice(0, None, s))]:
+                edges = view[rs, cs]
+                for dr, dc in [(-q, -q), (-q, q), (q, -q), (q, q)]:
+                    numpy.maximum(edges, _shifted(err, size, rs, cs, dr, dc, shape),
+                                  out=edges)
+        for apexes, left, right, mid in groups[:4]:
+            errors = _triangle_errors(padded, apexes, left, right)
+            numpy.maximum.at(view, (mid[:, 0], mid[:, 1]), errors)
+        rs = cs = slice(h, None, s)
+        centers = view[rs, cs]
+        for dr, dc in [(-h, 0), (h, 0), (0, -h), (0, h)]:
+            numpy.maximum(centers, _shifted(err, size, rs, cs, dr, dc, shape),
+                          out=centers)
+        s *= 2
+
+    # split the triangles from the roots down while their midpoint error
+    # is larger than max_error
+    leaves = []
+    active = [numpy.concatenate(a) for a in zip(*[
+        (apexes, numpy.broadcast_to(left, apexes.shape) + apexes,
+         numpy.broadcast_to(right, apexes.shape) + apexes)
+        for apexes, left, right, mid in _level_triangles(shape, size)[:4]])]
+    while len(active[0]):
+        apex, left, right = active
+        total = left + right
+        splittable = (total % 2 == 0).all(axis=1)
+        mid = total // 2
+        split = splittable & (view[mid[:, 0], mid[:, 1]] > max_error)
+        leaves.append(numpy.stack((apex[~split], left[~split], right[~split]), axis=1))
+        apex, left, right, mid = apex[split], left[split], right[split], mid[split]
+        active = [numpy.concatenate((mid, mid)),
+                  numpy.concatenate((left, apex)),
+                  numpy.concatenate((apex, right))]
+
+    # drop the triangles with a missing sample, wind the others like
+    # grid_faces and index the grid_mesh vertices
+    leaves = numpy.concatenate(leaves)
+    leaves = leaves[~numpy.isnan(padded[leaves[..., 0], leaves[..., 1]]).any(axis=1)]
+    a, b, c = leaves[:, 0], leaves[:, 1], leaves[:, 2]
+    cross = ((b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0]) -
+             (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]))
+    leaves[cross > 0, 1:] = leaves[cross > 0, :0:-1]
+    flat = leaves[..., 0] * z.shape[1] + leaves[..., 1]
+    used, faces = numpy.unique(flat, return_inverse=True)
+    vertices = grid_vertices(heights, geo_transform, cols, rows)[used]
+    return vertices, faces.reshape(-1, 3)
+
+
+def _shifted(err, size, rs, cs, dr, dc, shape):
+    # view of the padded err array at the rs, cs samples shifted by (dr, dc)
+    return err[size + dr:size + dr + shape[0], size + dc:size + dc + shape[1]][rs, cs]
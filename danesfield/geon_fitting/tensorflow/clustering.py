@@ -0,0 +1,156 @@
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+'''
+Euclidean clustering of building point clouds as one label array.
+Uses pcl's EuclideanClusterExtraction when pcl is installed, otherwise
+the connected components of the cKDTree neighbour graph, which give the
+same clusters.
+'''
+import numpy as np
+import scipy.sparse
+import scipy.sparse.csgraph
+from scipy.spatial import cKDTree
+
+try:
+    import pcl
+except ImportError:
+    pcl = None
+
+
+def pcl_cluster_labels(points, tolerance, min_size, max_size):
+    cloud = pcl.PointCloud()
+    cloud.from_array(np.ascontiguousarray(points, dtype=np.float32))
+    ec = cloud.make_EuclideanClusterExtraction()
+    ec.set_ClusterTolerance(tolerance)
+    ec.set_MinClusterSize(min_size)
+    ec.set_MaxClusterSize(max_size)
+    ec.set_SearchMethod(cloud.make_kdtree())
+    labels = np.full(points.shape[0], -1, dtype=np.int32)
+    for j, indices in enumerate(ec.Extract()):
+        labels[np.asarray(indices, dtype=np.int64)] = j
+    return labels
+
+
+def _roots(parent, nodes):
+    # union-find roots of nodes, following parent links
+    roots = parent[nodes]
+    while True:
+        up = parent[roots]
+        if (up == roots).all():
+            return roots
+        roots = up
+
+
+def kdtree_components(points, tolerance, chunk_size=1 << 14):
+    '''
+    connected component of every point in the graph linking points closer
+    than tolerance, numbered by their smallest point index like
+    scipy.sparse.csgraph.connected_components. Neighbour pairs are found
+    chunk_size points at a time and merged into a union-find forest, so
+    memory stays bounded by the pairs of one chunk.
+    '''
+    n = points.shape[0]
+    tree = cKDTree(points)
+    # chunks are compact groups of points: those of a cell of a grid with
+    # about chunk_size points per cell
+    xy = np.asarray(points, dtype=np.float64)[:, :2]
+    lo = xy.min(axis=0) if n else np.zeros(2)
+    extent = np.maximum(xy.max(axis=0) - lo, tolerance) if n else np.ones(2)
+    cell = np.sqrt(extent.prod() * chunk_size / max(n, 1))
+    cells = ((xy - lo) // cell).astype(np.int64)
+    order = np.lexsort((cells[:, 1], cells[:, 0]))
+
+    # every root is the smallest point index of its tree
+    parent = np.arange(n)
+    for start in range(0, n, chunk_size):
+        chunk = order[start:start + chunk_size]
+        pairs = cKDTree(points[chunk]).sparse_distance_matrix(tree, tolerance,
+                                                               output_type='ndarray')
+        i = chunk[pairs['i']]
+        j = pairs['j']
+        keep = i < j
+        i, j = _roots(parent, i[keep]), _roots(parent, j[keep])
+        keep = i != j
+        if not keep.any():
+            continue
+        # merge the trees linked by this chunk under their smallest root
+        nodes, edges = np.unique(np.concatenate((i[keep], j[keep])), return_inverse=True)
+        edges = edges.reshape(2, -1)
+        graph = scipy.sparse.coo_matrix(
+            (np.ones(edges.shape[1], dtype=np.int8), (edges[0], edges[1])),
+            shape=(len(nodes), len(nodes)))
+        _, merged = scipy.sparse.csgraph.connected_components(graph, directed=False)
+        smallest = np.full(merged.max() + 1, n)
+        np.minimum.at(smallest, merged, nodes)
+        parent[nodes] = smallest[merged]
+
+    # flatten the forest, then number the components
+    while True:
+        up = parent[parent]
+        if (up == parent).all():
+            break
+        parent = up
+    return np.unique(parent, return_inverse=True)[1]
+
+
+def kdtree_cluster_labels(points, tolerance, min_size, max_size):
+    components = kdtree_components(points, tolerance)
+
+    # keep the clusters pcl keeps, numbered like pcl: largest first
+    sizes = np.bincount(components)
+    kept = np.nonzero((sizes >= min_size) & (sizes <= max_size))[0]
+    kept = kept[np.argsort(-sizes[kept], kind='stable')]
+    relabel = np.full(sizes.shape[0], -1, dtype=np.int32)
+    relabel[kept] = np.arange(len(kept), dtype=np.int32)
+    return relabel[components]
+
+
+def euclidean_cluster_labels(points, tolerance=2, min_size=100, max_size=550000, use_pcl=None):
+    '''
+    int32 cluster id of every point, -1 for points in clusters smaller
+    than min_size or larger than max_size. Clusters are numbered by
+    decreasing size.
+    '''
+    points = np.asarray(points)
+    if use_pcl is None:
+        use_pcl = pcl is not None
+    if use_pcl:
+        return pcl_cluster_labels(points, tolerance, min_size, max_size)
+    return kdtree_cluster_labels(points, tolerance, min_size, max_size)
+
+
+def cluster_subsets(labels):
+    ''' point indices of each cluster 0..max(labels), from one argsort '''
+    labels = np.asarray(labels)
+    order = np.argsort(labels, kind='stable')
+    counts = np.bincount(labels[labels >= 0])
+    start = np.count_nonzero(labels < 0)
+    return np.split(order[start:], np.cumsum(counts)[:-1])
+
+
+def cluster_stats(points, labels):
+    '''
+    per cluster point count, centroid and bounding box (min and max
+    corners) of the points with labels >= 0
+    '''
+    points = np.asarray(points)
+    labels = np.asarray(labels)
+    valid = labels >= 0
+    counts = np.bincount(labels[valid])
+    centroids = np.stack([np.bincount(labels[valid], weights=points[valid, i],
+                                      minlength=len(counts))
+                          for i in range(points.shape[1])], axis=1)
+    centroids /= np.maximum(counts, 1)[:, None]
+
+    order = np.argsort(labels, kind='stable')[np.count_nonzero(~valid):]
+    starts = np.cumsum(counts) - counts
+    nonempty = counts > 0
+    mins = np.full((len(counts), points.shape[1]), np.nan)
+    maxs = np.full((len(counts), points.shape[1]), np.nan)
+    mins[nonempty] = np.minimum.reduceat(points[order], starts[nonempty], axis=0)
+    maxs[nonempty] = np.maximum.reduceat(points[order], starts[nonempty], axis=0)
+    return counts, centroids, mins, maxs
@@ -0,0 +1,93 @@
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+'''
+Batched roof type inference over all building clusters of a cloud.
+Every cluster is resampled to the model's fixed point count in one
+vectorized step, the samples are packed into full batches (one model
+call each) and the per-sample labels are scattered back to all points
+through the nearest sample of the same cluster.
+'''
+import time
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from . import clustering
+
+
+def sample_clusters(points, labels, num_point, rng=np.random):
+    '''
+    draws num_point points with replacement from each cluster.
+    Returns their indices (C, num_point) and the samples normalized like
+    the training data: centered on the cluster centroid and scaled so the
+    largest bounding box side spans [-1, 1].
+    '''
+    points = np.asarray(points)
+    counts, centers, mins, maxs = clustering.cluster_stats(points, labels)
+    order = np.argsort(labels, kind='stable')[np.count_nonzero(np.asarray(labels) < 0):]
+    starts = np.cumsum(counts) - counts
+
+    draw = (rng.random_sample((len(counts), num_point)) * counts[:, None]).astype(np.int64)
+    draw = np.minimum(draw, np.maximum(counts - 1, 0)[:, None])
+    sample_index = order[starts[:, None] + draw]
+
+    scales = np.max(maxs - mins, axis=1)
+    scales[~(scales > 0)] = 1
+    normed = (points[sample_index] - centers[:, None, :]) / scales[:, None, None] * 2
+    return sample_index, normed.astype(np.float32)
+
+
+def predict_batches(predict, samples, batch_size):
+    '''
+    argmax labels of predict over the samples, batch_size samples per
+    call; the last batch is padded with copies of its last sample
+    '''
+    labels = np.zeros(samples.shape[:2], dtype=np.int32)
+    for start in range(0, samples.shape[0], batch_size):
+        batch = samples[start:start + batch_size]
+        n = batch.shape[0]
+        if n < batch_size:
+            batch = np.concatenate([batch, np.repeat(batch[-1:], batch_size - n, axis=0)])
+        labels[start:start + n] = np.argmax(predict(batch), axis=2)[:n]
+    return labels
+
+
+def scatter_labels(points, labels, sample_index, sample_labels):
+    '''
+    label of every point from its nearest sample in the same cluster,
+    -1 for points outside the clusters. The cluster id is added as a far
+    apart fourth coordinate so one KD-tree serves all clusters.
+    '''
+    points = np.asarray(points, dtype=np.float64)
+    labels = np.asarray(labels)
+    valid = labels >= 0
+    point_labels = np.full(points.shape[0], -1, dtype=np.int32)
+    if sample_index.size == 0:
+        return point_labels
+    offset = 4 * (np.max(np.ptp(points, axis=0)) + 1) if len(points) else 1
+    sample_cluster = np.repeat(np.arange(sample_index.shape[0]), sample_index.shape[1])
+    tree = cKDTree(np.column_stack([points[sample_index.reshape(-1)],
+                                    sample_cluster * offset]))
+    _, nearest = tree.query(np.column_stack([points[valid], labels[valid] * offset]))
+    point_labels[valid] = sample_labels.reshape(-1)[nearest]
+    return point_labels
+
+
+def classify_clusters(predict, points, labels, num_point, batch_size, rng=np.random):
+    '''
+    roof type of every point of the clustered cloud.
+    predict maps a (batch_size, num_point, 3) array to per point class
+    scores. Returns the point labels, the sample indices and labels, and
+    the throughput in clustered points per second.
+    '''
+    start = time.time()
+    sample_index, samples = sample_clusters(points, labels, num_point, rng)
+    sample_labels = predict_batches(predict, samples, batch_size)
+    point_labels = scatter_labels(points, labels, sample_index, sample_labels)
+    elapsed = time.time() - start
+    points_per_second = np.count_nonzero(np.asarray(labels) >= 0) / max(elapsed, 1e-9)
+    return point_labels, sample_index, sample_labels, points_per_second
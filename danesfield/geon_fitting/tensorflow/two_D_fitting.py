@@ -34,19 +34,22 @@ def fit_2D_curve(n, points, fit_type='poly2', dist_threshold=0.05):
 
 
 def get_z_length(points_z, fitted_indices):
+    points_z = np.asarray(points_z)
+    start = int(np.floor(np.min(points_z)))
     hist, bin_edges = np.histogram(points_z, bins=range(
-        int(np.floor(min(points_z))), int(np.ceil(max(points_z))), 5))
-    points_z_survivor_indices = np.asarray([i for i in range(len(points_z))
-                                            if survive(points_z[i], hist, bin_edges, int(np.floor(min(points_z))), 5, cut_threshold_ratio=0.1)])
-    indices_lst = interval_cluster_1d(points_z[points_z_survivor_indices], 10)
+        start, int(np.ceil(np.max(points_z))), 5))
+    points_z_survivor_indices = np.nonzero(survive_mask(
+        points_z, hist, start, 5, cut_threshold_ratio=0.1))[0]
+    survivor_z = points_z[points_z_survivor_indices]
+    indices_lst = interval_cluster_1d(survivor_z, 10)
     min_lst = []
     max_lst = []
     fitted_indices_lst = []
 
-    for i in range(len(indices_lst)):
-        indices = indices_lst[i]
-        min_lst.append(min(points_z[points_z_survivor_indices[indices]]))
-        max_lst.append(max(points_z[points_z_survivor_indices[indices]]))
+    for indices in indices_lst:
+        cluster_z = survivor_z[indices]
+        min_lst.append(cluster_z.min())
+        max_lst.append(cluster_z.max())
         fitted_indices_lst.append(
             fitted_indices[points_z_survivor_indices[indices]])
     return min_lst, max_lst, fitted_indices_lst
@@ -55,7 +58,7 @@ def get_z_length(points_z, fitted_indices):
 def check_2D_curve(ex, ey, ez, coefficients, centroid, points, min_axis_z, max_axis_z, fit_type='poly2', dist_threshold=0.05):
     #centroid = get_centroid(points)
     # points_2d has been move to centroid and e1, e2 as axes
-    projection_matrix = np.zeros((3, 3), dtype=np.float)
+    projection_matrix = np.zeros((3, 3), dtype=np.float64)
     projection_matrix[:, 0] = ex
     projection_matrix[:, 1] = ey
     projection_matrix[:, 2] = ez
@@ -81,17 +84,11 @@ def check_2D_curve(ex, ey, ez, coefficients, centroid, points, min_axis_z, max_a
     hist, bin_edges = np.histogram(x_val, bins = bin_num)
     max_val = np.max(hist)
 
-    min_index = 0
-    for i in range(hist.shape[0]):
-        if hist[i]>0.2*max_val:
-            min_index = i
-            break
-
-    max_index = hist.shape[0]
-    for i in range(hist.shape[0]-1, 0, -1):
-        if hist[i]>0.2*max_val:
-            max_index = i
-            break
+    # first and last bins above 20% of the peak; bin 0 is never taken as max
+    dense_bins = np.nonzero(hist > 0.2*max_val)[0]
+    min_index = dense_bins[0] if len(dense_bins) > 0 else 0
+    dense_bins = dense_bins[dense_bins > 0]
+    max_index = dense_bins[-1] if len(dense_bins) > 0 else hist.shape[0]
 
     real_x_max = ortho_x_min+ (ortho_x_max-ortho_x_min)/bin_num*max_index
     real_x_min = ortho_x_min+ (ortho_x_max-ortho_x_min)/bin_num*min_index
@@ -128,16 +125,19 @@ def survive(point_z, hist, edges, start, bin_size, cut_threshold_ratio=0.1):
     return hist[bin_num] > cut_threshold
 
 
+def survive_mask(points_z, hist, start, bin_size, cut_threshold_ratio=0.1):
+    ''' survive() for all points at once, returns a boolean mask '''
+    bin_num = np.floor(np.asarray(points_z) - start).astype(np.int64) // bin_size
+    bin_num = np.minimum(bin_num, len(hist) - 1)
+    cut_threshold = cut_threshold_ratio * np.max(hist)
+    return hist[bin_num] > cut_threshold
+
+
 def interval_cluster_1d(points_1d, max_interval):
+    points_1d = np.asarray(points_1d)
     sorted_index = np.argsort(points_1d)
-    indices_list = []
-    start = 0
-    for i in range(1, sorted_index.shape[0]):
-        if abs(points_1d[sorted_index[i]] - points_1d[sorted_index[i-1]]) > max_interval:
-            indices_list.append(sorted_index[start:i])
-            start = i
-    indices_list.append(sorted_index[start:len(points_1d)])
-    return indices_list
+    gaps = np.abs(np.diff(points_1d[sorted_index])) > max_interval
+    return np.split(sorted_index, np.nonzero(gaps)[0] + 1)
 
 
 def get_z_along_axis(points, centroid, n):
@@ -234,16 +234,8 @@ def fit2Dshapes(points_2d, fit_type="poly2", dist_threshold=0.05):
         ellipse_center, ellipse_width, ellipse_height, ellipse_phi = lsqe.parameters()
         # print ellipse_center, ellipse_width, ellipse_height, ellipse_phi
 
-        def elip(X, P):
-            P_cond = (P[0] - ellipse_center[0]) ** 2 / ellipse_width ** 2 + \
-                (P[1] - ellipse_center[1]) ** 2 / ellipse_height ** 2 - 1
-            X_cond = (X[0] - ellipse_center[0]) ** 2 / ellipse_width ** 2 + \
-                (X[1] - ellipse_center[1]) ** 2 / ellipse_height ** 2 - 1
-            if P_cond >= 0:
-                return -1 * X_cond
-            return X_cond
-        residuals, fitted_indices = find_min_dist_residual(
-            elip, points_2d, dist_threshold)
+        dist = ellipse_distance(points_2d, ellipse_center, ellipse_width, ellipse_height)
+        residuals, fitted_indices = dist_residual(dist, dist_threshold)
         return fitted_indices, [ellipse_center, ellipse_width, ellipse_height, ellipse_phi], residuals
     # poly curve
     if fit_type == "poly2":
@@ -260,7 +252,8 @@ def fit2Dshapes(points_2d, fit_type="poly2", dist_threshold=0.05):
         #    if P_cond >= 0:
         #        return -1 * X_cond
         #    return X_cond
-        #residuals, fitted_indices = find_min_dist_residual(poly, points_2d, dist_threshold)
+        # residuals, fitted_indices = dist_residual(
+        #    parabola_distance(points_2d, poly_coefficients), dist_threshold)
         # print(residuals)
         # print(residuals/len(fitted_indices))
         return fitted_indices, poly_coefficients, error
@@ -275,16 +268,8 @@ def check2Dshapes(points_2d, coefficients, fit_type="poly2",  dist_threshold=0.0
         ellipse_center, ellipse_width, ellipse_height, ellipse_phi = coefficients
         # print ellipse_center, ellipse_width, ellipse_height, ellipse_phi
 
-        def elip(X, P):
-            P_cond = (P[0] - ellipse_center[0]) ** 2 / ellipse_width ** 2 + \
-                (P[1] - ellipse_center[1]) ** 2 / ellipse_height ** 2 - 1
-            X_cond = (X[0] - ellipse_center[0]) ** 2 / ellipse_width ** 2 + \
-                (X[1] - ellipse_center[1]) ** 2 / ellipse_height ** 2 - 1
-            if P_cond >= 0:
-                return -1 * X_cond
-            return X_cond
-        residuals, fitted_indices = find_min_dist_residual(
-            elip, points_2d, dist_threshold)
+        dist = ellipse_distance(points_2d, ellipse_center, ellipse_width, ellipse_height)
+        residuals, fitted_indices = dist_residual(dist, dist_threshold)
         return fitted_indices, residuals
     # poly curve
     if fit_type == "poly2":
@@ -317,7 +302,7 @@ def find_min_dist_residual(f, points, dis_threshold):
     for i in range(points.shape[0]):
         P = points[i, :]
         # print "point of cloud:", P
-        X = fmin_cobyla(objective, x0=[P], cons=[
+        X = fmin_cobyla(objective, x0=P, cons=[
                         c1], args=([P]), consargs=([P]))
         # print objective(X, P)
         dist = objective(X, P)
@@ -325,3 +310,94 @@ def find_min_dist_residual(f, points, dis_threshold):
             summation += objective(X, P)
             indices.append(i)
     return summation / points.shape[0], indices
+
+
+def dist_residual(dist, dis_threshold):
+    ''' same result as find_min_dist_residual, from precomputed distances '''
+    dist = np.asarray(dist)
+    fitted = dist <= dis_threshold
+    return np.sum(dist[fitted]) / dist.shape[0], np.nonzero(fitted)[0]
+
+
+def ellipse_distance(points, center, width, height, iterations=100):
+    '''
+    distance of every 2d point to the axis aligned ellipse
+    ((x - cx) / width)^2 + ((y - cy) / height)^2 = 1 around center (cx, cy).
+    Eberly's method: by symmetry work in the first quadrant, then bisect
+    the root of F(s) = (r0*z0/(s+r0))^2 + (z1/(s+1))^2 - 1 for all points.
+    '''
+    points = np.asarray(points, dtype=np.float64) - np.asarray(center, dtype=np.float64)
+    y0 = np.abs(points[:, 0])
+    y1 = np.abs(points[:, 1])
+    e0 = float(abs(width))
+    e1 = float(abs(height))
+    if e0 < e1:
+        y0, y1 = y1, y0
+        e0, e1 = e1, e0
+
+    x0 = np.zeros_like(y0)
+    x1 = np.zeros_like(y1)
+
+    # generic case, the point is off both axes
+    both = (y0 > 0) & (y1 > 0)
+    z0 = y0[both] / e0
+    z1 = y1[both] / e1
+    r0 = (e0 / e1) ** 2
+    s0 = z1 - 1
+    s1 = np.where(z0 ** 2 + z1 ** 2 < 1, 0, np.hypot(r0 * z0, z1) - 1)
+    for _ in range(iterations):
+        s = 0.5 * (s0 + s1)
+        g = (r0 * z0 / (s + r0)) ** 2 + (z1 / (s + 1)) ** 2 - 1
+        s0 = np.where(g > 0, s, s0)
+        s1 = np.where(g > 0, s1, s)
+    s = 0.5 * (s0 + s1)
+    x0[both] = r0 * y0[both] / (s + r0)
+    x1[both] = y1[both] / (s + 1)
+
+    # on the major axis, the nearest point may lie off the axis
+    major = (y1 == 0)
+    numer = e0 * y0[major]
+    denom = e0 ** 2 - e1 ** 2
+    inside = numer < denom
+    ratio = np.where(inside, numer / denom if denom > 0 else 1, 1)
+    x0[major] = e0 * ratio
+    x1[major] = e1 * np.sqrt(np.maximum(1 - ratio ** 2, 0))
+
+    # on the minor axis
+    minor = (y0 == 0) & (y1 > 0)
+    x1[minor] = e1
+
+    return np.hypot(x0 - y0, x1 - y1)
+
+
+def parabola_distance(points, coefficients):
+    '''
+    distance of every 2d point to y = a*x^2 + b*x + c. The foot points are
+    the real roots of the cubic
+        2a^2 x^3 + 3ab x^2 + (b^2 + 2a(c - py) + 1) x + b(c - py) - px = 0,
+    found for all points at once from the companion matrices and polished
+    with a few Newton steps.
+    '''
+    points = np.asarray(points, dtype=np.float64)
+    a, b, c = [float(v) for v in coefficients]
+    px = points[:, 0]
+    py = points[:, 1] - c
+    if a == 0:
+        return np.abs(b * px - py) / np.sqrt(b ** 2 + 1)
+
+    # monic cubic x^3 + k2 x^2 + k1 x + k0
+    k2 = np.full(px.shape, 1.5 * b / a)
+    k1 = (b ** 2 - 2 * a * py + 1) / (2 * a ** 2)
+    k0 = (-b * py - px) / (2 * a ** 2)
+    companion = np.zeros((px.shape[0], 3, 3))
+    companion[:, 0, :] = -np.stack([k2, k1, k0], axis=1)
+    companion[:, 1, 0] = 1
+    companion[:, 2, 1] = 1
+    # real parts of complex roots are just extra candidate foot points
+    x = np.linalg.eigvals(companion).real
+    for _ in range(3):
+        f = ((x + k2[:, None]) * x + k1[:, None]) * x + k0[:, None]
+        df = (3 * x + 2 * k2[:, None]) * x + k1[:, None]
+        x = x - np.where(df != 0, f / np.where(df != 0, df, 1), 0)
+    dist = np.hypot(x - px[:, None], (a * x + b) * x - py[:, None])
+    return np.min(dist, axis=1)
@@ -32,17 +32,117 @@ def BackProjectPoint(model, pt):
     return [px, py]
 
 
+def project_points(model, points):
+    ''' ProjectPoint for (N, 2+) points at once, (N, 2) int64 pixels '''
+    points = np.asarray(points, dtype=np.float64)
+    px = (points[:, 0]-model['corners'][0])/model['project_model'][1]*model['scale']
+    py = (points[:, 1]-model['corners'][1])/model['project_model'][5]*model['scale']
+    # int() truncates toward zero, so does astype
+    return np.stack([px, py], axis=1).astype(np.int64)
+
+
+def back_project_points(model, pixels):
+    ''' BackProjectPoint for (N, 2) pixels at once '''
+    pixels = np.asarray(pixels, dtype=np.float64)
+    px = pixels[:, 0]/model['scale'] * model['project_model'][1] + model['corners'][0]
+    py = pixels[:, 1]/model['scale'] * model['project_model'][5] + model['corners'][1]
+    return np.stack([px, py], axis=1)
+
+
+def sample_image(model, image, points):
+    ''' image value under each point, pixels clamped to the image '''
+    pixels = project_points(model, points)
+    cols = np.clip(pixels[:, 0], 0, image.shape[1] - 1)
+    rows = np.clip(pixels[:, 1], 0, image.shape[0] - 1)
+    return image[rows, cols]
+
+
 def label_point_shape(model, image, pc):
-    label = np.zeros((pc.shape[0]), dtype=np.int32)
-    for idx in range(pc.shape[0]):
-        projected_point = ProjectPoint(model, [pc[idx, 0], pc[idx, 1]])
-        projected_point[0] = int(projected_point[0]+0.5)
-        projected_point[1] = int(projected_point[1]+0.5)
-        label[idx] = image[projected_point[1], projected_point[0]]
-    return label
+    pixels = project_points(model, pc)
+    pixels = (pixels + 0.5).astype(np.int64)
+    return image[pixels[:, 1], pixels[:, 0]].astype(np.int32)
+
+
+def poly_grid(centroid, ex, ey, coefficients, ortho_grid_x, ortho_grid_z):
+    '''
+    points of the extruded parabola y = a*x^2 + b*x + c of a poly_cylinder
+    geon, (len(ortho_grid_x), len(ortho_grid_z), 3) in world axes
+    '''
+    ez = np.cross(ex, ey)
+    inverse_matrix = np.zeros((3, 3), np.float32)
+    inverse_matrix[0, :] = ex
+    inverse_matrix[1, :] = ez
+    inverse_matrix[2, :] = ey
+    ortho_grid_y = coefficients[0]*ortho_grid_x*ortho_grid_x + \
+        coefficients[1]*ortho_grid_x + coefficients[2]
+
+    grid_x, grid_z = np.meshgrid(ortho_grid_x, ortho_grid_z, indexing='ij')
+    grid_y = np.broadcast_to(ortho_grid_y[:, None], grid_x.shape)
+    grid_point = np.stack([grid_x, grid_z, grid_y], axis=-1).astype(np.float32).reshape(-1, 3)
+
+    original_grid_point = np.matmul(grid_point, inverse_matrix) + centroid
+    return np.reshape(original_grid_point, (ortho_grid_x.shape[0], ortho_grid_z.shape[0], 3))
+
+
+def strip_faces(start_point, rows, step, flip=False):
+    '''
+    white faces of the (rows - 1) quads of a strip whose row i starts at
+    vertex start_point + step*i, as in the ply helpers below
+    '''
+    i = np.arange(1, rows)
+    if step == 2:
+        first = np.stack([start_point+(i-1)*2, start_point+2*i-1, start_point+2*i], axis=1)
+        second = np.stack([start_point+2*i+1, start_point+2*i-1, start_point+2*i], axis=1)
+    elif flip:
+        first = np.stack([start_point+4*i-4, start_point+4*i, start_point+4*i-2], axis=1)
+        second = np.stack([start_point+4*i, start_point+4*i+2, start_point+4*i-2], axis=1)
+    else:
+        first = np.stack([start_point+4*i, start_point+4*i-4, start_point+4*i-2], axis=1)
+        second = np.stack([start_point+4*i+2, start_point+4*i, start_point+4*i-2], axis=1)
+    faces = np.stack([first, second], axis=1).reshape(-1, 3)
+    return [(list(f), 255, 255, 255) for f in faces.tolist()]
+
+
+# binary interchange format of the roof pipeline: structured .npy (or the
+# same columns in an .npz), -1 where a stage has no cluster id or label yet
+POINT_CLOUD_DTYPE = np.dtype([('x', '<f8'), ('y', '<f8'), ('z', '<f8'),
+                              ('cluster', '<i4'), ('label', '<i4')])
+
+
+def is_binary_pc(filename):
+    return os.path.splitext(str(filename))[1].lower() in ('.npy', '.npz')
+
+
+def write_binary_pc(filename, points, cluster=None, label=None):
+    points = np.asarray(points)
+    pc = np.empty(points.shape[0], dtype=POINT_CLOUD_DTYPE)
+    pc['x'] = points[:, 0]
+    pc['y'] = points[:, 1]
+    pc['z'] = points[:, 2]
+    pc['cluster'] = -1 if cluster is None else cluster
+    pc['label'] = -1 if label is None else label
+    if str(filename).lower().endswith('.npz'):
+        with open(filename, 'wb') as f:
+            np.savez(f, **dict((name, pc[name]) for name in POINT_CLOUD_DTYPE.names))
+    else:
+        with open(filename, 'wb') as f:
+            np.save(f, pc)
+
+
+def read_binary_pc(filename):
+    ''' returns the (N, 3) float64 points, cluster ids and labels '''
+    if str(filename).lower().endswith('.npz'):
+        with np.load(filename) as pc:
+            points = np.stack([pc['x'], pc['y'], pc['z']], axis=1)
+            return points, pc['cluster'].astype(np.int32), pc['label'].astype(np.int32)
+    pc = np.load(filename, mmap_mode='r')
+    points = np.stack([pc['x'], pc['y'], pc['z']], axis=1)
+    return points, np.array(pc['cluster'], dtype=np.int32), np.array(pc['label'], dtype=np.int32)
 
 
 def read_txt_pc(filename):
+    if is_binary_pc(filename):
+        return read_binary_pc(filename)[0]
     point_list = []
     with open(filename, 'r') as pc_file:
         print('opened')
@@ -54,6 +154,8 @@ def read_txt_pc(filename):
 
 
 def read_geon_type_pc(filename):
+    if is_binary_pc(filename):
+        return read_binary_pc(filename)
     point_list = []
     geon_label = []
     building_label = []
@@ -68,6 +170,26 @@ def read_geon_type_pc(filename):
     return np.array(point_list), np.array(building_label), np.array(geon_label)
 
 
+def write_geon_type_pc(filename, points, building_label, geon_label):
+    ''' counterpart of read_geon_type_pc, binary for .npy/.npz names '''
+    if is_binary_pc(filename):
+        write_binary_pc(filename, points, building_label, geon_label)
+        return
+    with open(filename, 'w') as pc_file:
+        for point, building, geon in zip(points, building_label, geon_label):
+            pc_file.write('{} {} {} {} {}\n'.format(point[0], point[1], point[2], building, geon))
+
+
+def write_label_pc(filename, points, label):
+    ''' las text (x y z class) or binary for .npy/.npz names '''
+    if is_binary_pc(filename):
+        write_binary_pc(filename, points, label=label)
+        return
+    with open(filename, 'w') as pc_file:
+        for point, point_label in zip(points, label):
+            pc_file.write('{} {} {} {}\n'.format(point[0], point[1], point[2], point_label))
+
+
 def write_txt_pc(filename, pc):
     with open(filename, 'w') as pc_file:
         for point in pc:
@@ -86,33 +208,13 @@ def axisEqual3D(ax):
 
 
 def draw_poly_curve(ax, centroid, ex, ey, fitted_points, coefficients, min_axis_z, max_axis_z, color='y'):
-    np.array([0, 0, 0])
-    ez = np.cross(ex, ey)
     ortho_x = np.matmul(fitted_points - centroid, ex)
     ortho_x_max = np.max(ortho_x)
     ortho_x_min = np.min(ortho_x)
 
-    inverse_matrix = np.zeros((3, 3), np.float32)
-    inverse_matrix[0, :] = ex
-    inverse_matrix[1, :] = ez
-    inverse_matrix[2, :] = ey
-
     ortho_grid_x = np.arange(ortho_x_min, ortho_x_max, 10.0)
     ortho_grid_z = np.arange(min_axis_z, max_axis_z,  10.0)
-    ortho_grid_y = coefficients[0]*ortho_grid_x*ortho_grid_x + \
-        coefficients[1]*ortho_grid_x + coefficients[2]
-    grid_point = np.zeros(
-        (ortho_grid_x.shape[0] * ortho_grid_z.shape[0], 3), dtype=np.float32)
-
-    for i in range(ortho_grid_x.shape[0]):
-        for j in range(ortho_grid_z.shape[0]):
-            grid_point[i*ortho_grid_z.shape[0] + j,
-                       :] = np.array([ortho_grid_x[i], ortho_grid_z[j], ortho_grid_y[i]])
-
-    original_grid_point = np.matmul(grid_point, inverse_matrix) + centroid
-    original_grid_point = np.reshape(
-        original_grid_point, (ortho_grid_x.shape[0], ortho_grid_z.shape[0], 3))
-    # print(grid_point.shape)
+    original_grid_point = poly_grid(centroid, ex, ey, coefficients, ortho_grid_x, ortho_grid_z)
     ax.plot_wireframe(original_grid_point[:, :, 0], original_grid_point[:,
                                                                         :, 1], original_grid_point[:, :, 2], color=color, alpha=0.8)
     return original_grid_point
@@ -120,163 +222,39 @@ def draw_poly_curve(ax, centroid, ex, ey, fitted_points, coefficients, min_axis_
 
 
 def get_poly_ply(centroid, ex, ey, fitted_points, coefficients, min_axis_z, max_axis_z, start_point):
-    np.array([0, 0, 0])
-    ez = np.cross(ex, ey)
     ortho_x = np.matmul(fitted_points - centroid, ex)
     ortho_x_max = np.max(ortho_x)
     ortho_x_min = np.min(ortho_x)
 
-    inverse_matrix = np.zeros((3, 3), np.float32)
-    inverse_matrix[0, :] = ex
-    inverse_matrix[1, :] = ez
-    inverse_matrix[2, :] = ey
-
     ortho_grid_x = np.linspace(ortho_x_min, ortho_x_max, 30)
     ortho_grid_z = np.array([min_axis_z, max_axis_z])
-    ortho_grid_y = coefficients[0]*ortho_grid_x*ortho_grid_x + \
-        coefficients[1]*ortho_grid_x + coefficients[2]
-
-    vertex = []
-    face = []  # setting an array element with a sequence
-    grid_point = np.zeros(
-        (ortho_grid_x.shape[0] * ortho_grid_z.shape[0], 3), dtype=np.float32)
-
-    for i in range(ortho_grid_x.shape[0]):
-        for j in range(ortho_grid_z.shape[0]):
-            grid_point[i*ortho_grid_z.shape[0] + j,
-                       :] = np.array([ortho_grid_x[i], ortho_grid_z[j], ortho_grid_y[i]])
-
-    original_grid_point = np.matmul(grid_point, inverse_matrix) + centroid
-
-    original_grid_point = np.reshape(
-        original_grid_point, (ortho_grid_x.shape[0], ortho_grid_z.shape[0], 3))
-
-    for i in range(ortho_grid_x.shape[0]):
-        for j in range(ortho_grid_z.shape[0]):
-            vertex.append(
-                (original_grid_point[i, j, 0], original_grid_point[i, j, 1], original_grid_point[i, j, 2]))
-        if i != 0:
-            face.append(([start_point+(i-1)*2, start_point+2 *
-                          i-1, start_point+2*i], 255, 255, 255))
-            face.append(([start_point+2*i+1, start_point+2 *
-                          i-1, start_point+2*i], 255, 255, 255))
+    original_grid_point = poly_grid(centroid, ex, ey, coefficients, ortho_grid_x, ortho_grid_z)
 
+    vertex = [tuple(v) for v in original_grid_point.reshape(-1, 3)]
+    face = strip_faces(start_point, ortho_grid_x.shape[0], 2)
     return vertex, face, ortho_x_min, ortho_x_max
 
 
 def get_poly_ply_volume(dtm, projection_model, centroid, ex, ey, coefficients,
                         min_axis_z, max_axis_z, ortho_x_min, ortho_x_max, start_point, center_of_mess):
 
-    np.array([0, 0, 0])
-    ez = np.cross(ex, ey)
-
-    inverse_matrix = np.zeros((3, 3), np.float32)
-    inverse_matrix[0, :] = ex
-    inverse_matrix[1, :] = ez
-    inverse_matrix[2, :] = ey
-
     ortho_grid_x = np.linspace(ortho_x_min, ortho_x_max, 30)
     ortho_grid_z = np.array([min_axis_z, max_axis_z])
-    ortho_grid_y = coefficients[0]*ortho_grid_x*ortho_grid_x + \
-        coefficients[1]*ortho_grid_x + coefficients[2]
-
-    vertex = []
-    face = []  # setting an array element with a sequence
-    grid_point = np.zeros(
-        (ortho_grid_x.shape[0] * ortho_grid_z.shape[0], 3), dtype=np.float32)
-
-    for i in range(ortho_grid_x.shape[0]):
-        for j in range(ortho_grid_z.shape[0]):
-            grid_point[i*ortho_grid_z.shape[0] + j,
-                       :] = np.array([ortho_grid_x[i], ortho_grid_z[j], ortho_grid_y[i]])
-
-    original_grid_point = np.matmul(grid_point, inverse_matrix) + centroid
-
-    original_grid_point = np.reshape(
-        original_grid_point, (ortho_grid_x.shape[0], ortho_grid_z.shape[0], 3))
+    original_grid_point = poly_grid(centroid, ex, ey, coefficients, ortho_grid_x, ortho_grid_z)
 
     flag = False
     if original_grid_point[0, 0, 0] < original_grid_point[0, 1, 0]:
         flag = True
 
-    for i in range(ortho_grid_x.shape[0]):
-        for j in range(ortho_grid_z.shape[0]):
-            vertex.append(
-                (original_grid_point[i, j, 0], original_grid_point[i, j, 1], original_grid_point[i, j, 2]))
-            image_point = ProjectPoint(projection_model,
-                                       [original_grid_point[i, j, 0] + center_of_mess[0],
-                                        original_grid_point[i, j, 1] + center_of_mess[1]])
-            image_point[1] = min(max(image_point[1], 0), dtm.shape[0] - 1)
-            image_point[0] = min(max(image_point[0], 0), dtm.shape[1] - 1)
-            height = dtm[image_point[1], image_point[0]] - center_of_mess[2]
-            vertex.append(
-                (original_grid_point[i, j, 0], original_grid_point[i, j, 1], height))
-        if i != 0:
-            if flag:
-                face.append(([start_point+4*i - 4,
-                              start_point+4*i,  start_point+4*i-2], 255, 255, 255))
-                face.append(([start_point+4 *
-                              i, start_point+4*i+2,  start_point+4*i-2], 255, 255, 255))
-
-                #face.append(([start_point+4*i -
-                #              3, start_point+4*i-1,  start_point+4*i+3], 255, 255, 255))
-                #face.append(([start_point+4*i +
-                #              3, start_point+4*i+1,  start_point+4*i-3], 255, 255, 255))
-
-                #face.append(([start_point+4 *
-                #              i-4, start_point+4*i-3,  start_point+4*i], 255, 255, 255))
-                #face.append(([start_point+4 *
-                #              i, start_point+4*i-3,  start_point+4*i+1], 255, 255, 255))
-                #face.append(([start_point+4*i -
-                #              2, start_point+4*i+2,  start_point+4*i-1], 255, 255, 255))
-                #face.append(([start_point+4*i +
-                #              2, start_point+4*i+3,  start_point+4*i-1], 255, 255, 255))
-
-            else:
-                face.append(([start_point+4*i, start_point+4*i -
-                              4, start_point+4*i-2], 255, 255, 255))
-                face.append(([start_point+4*i+2, start_point+4 *
-                              i, start_point+4*i-2], 255, 255, 255))
-
-                #face.append(([start_point+4*i-1, start_point+4*i -
-                #              3, start_point+4*i+3], 255, 255, 255))
-                #face.append(([start_point+4*i+1, start_point+4*i +
-                #              3, start_point+4*i-3], 255, 255, 255))
-
-                #face.append(([start_point+4*i-3, start_point+4 *
-                #              i-4, start_point+4*i], 255, 255, 255))
-                #face.append(([start_point+4*i-3, start_point+4 *
-                #              i, start_point+4*i+1], 255, 255, 255))
-                #face.append(([start_point+4*i+2, start_point+4*i -
-                #              2, start_point+4*i-1], 255, 255, 255))
-                #face.append(([start_point+4*i+3, start_point+4*i +
-                #              2, start_point+4*i-1], 255, 255, 255))
-
-    #if flag:
-    #    face.append(
-    #        ([start_point+0, start_point+3,  start_point+1], 255, 255, 255))
-    #    face.append(
-    #        ([start_point+3, start_point+0, start_point+2], 255, 255, 255))
-
-    #    final = len(vertex)-1
-
-    #    face.append(([start_point+final, start_point+final -
-    #                  3, start_point+final-2], 255, 255, 255))
-    #    face.append(([start_point+final -
-    #                  3, start_point+final,  start_point+final-1], 255, 255, 255))
-
-    #else:
-    #    face.append(
-    #        ([start_point+3, start_point+0, start_point+1], 255, 255, 255))
-    #    face.append(
-    #        ([start_point+0, start_point+3, start_point+2], 255, 255, 255))
-
-    #    final = len(vertex)-1
-
-    #    face.append(([start_point+final-3, start_point+final,
-    #                  start_point+final-2], 255, 255, 255))
-    #    face.append(([start_point+final, start_point+final -
-    #                  3, start_point+final-1], 255, 255, 255))
+    # every surface vertex is followed by its footprint on the DTM
+    surface = original_grid_point.reshape(-1, 3)
+    height = sample_image(projection_model, dtm,
+                          surface[:, :2] + np.asarray(center_of_mess)[:2]) - center_of_mess[2]
+    vertex = []
+    for v, h in zip(surface, height):
+        vertex.append((v[0], v[1], v[2]))
+        vertex.append((v[0], v[1], h))
+    face = strip_faces(start_point, ortho_grid_x.shape[0], 4, flip=flag)
 
     return vertex, face  # , ortho_x_min, ortho_x_max, boundary_points
 
@@ -290,20 +268,16 @@ def get_sphere_volume(dtm, projection_model, centroid, r,
     x = np.cos(u)*np.sin(v)*r + centroid[0]
     y = np.sin(u)*np.sin(v)*r + centroid[1]
     z = np.cos(v)*r + centroid[2]
-    vertex = []
-    face = []
-
-    for i in range(z.shape[0]):
-        vertex.append((x[i, 0], y[i, 0], z[i, 0]))
-
-    for j in range(1, z.shape[1]):
-        for i in range(z.shape[0]):
-            vertex.append((x[i, j], y[i, j], z[i, j]))
-            if i > 0:
-                face.append(([start_point+(j-1)*z.shape[0]+i-1, start_point +
-                              j*z.shape[0]+i-1, start_point+j*z.shape[0]+i], 255, 255, 255))
-                face.append(([start_point+j*z.shape[0]+i, start_point+(j-1) *
-                              z.shape[0]+i, start_point+(j-1)*z.shape[0]+i-1], 255, 255, 255))
+    # vertices column by column (v), faces between consecutive columns
+    vertex = list(zip(x.T.reshape(-1), y.T.reshape(-1), z.T.reshape(-1)))
+    rows = z.shape[0]
+    j, i = np.meshgrid(np.arange(1, z.shape[1]), np.arange(1, rows), indexing='ij')
+    first = np.stack([start_point+(j-1)*rows+i-1, start_point+j*rows+i-1,
+                      start_point+j*rows+i], axis=-1)
+    second = np.stack([start_point+j*rows+i, start_point+(j-1)*rows+i,
+                       start_point+(j-1)*rows+i-1], axis=-1)
+    faces = np.stack([first, second], axis=2).reshape(-1, 3)
+    face = [(list(f), 255, 255, 255) for f in faces.tolist()]
 
     #if theta_max > -0.9*np.pi:
     #    j = z.shape[1]
@@ -399,20 +373,8 @@ def get_cylinder_ply(ax, fitted_points, coefficients, start_point):
     X, Y, Z = [p0[i] + v[i] * t + r *
                np.sin(theta) * n1[i] + r * np.cos(theta) * n2[i] for i in [0, 1, 2]]
 
-    vertex = []
-    face = []
-    print(X.shape)
-    print(Z.shape)
-    print(old_t.shape)
-    print(old_theta.shape)
-    for i in range(X.shape[0]):
-        for j in range(X.shape[1]):
-            vertex.append((X[i, j], Y[i, j], Z[i, j]))
-        if i != 0:
-            face.append(([start_point+(i-1)*2, start_point+2 *
-                          i-1, start_point+2*i], 255, 255, 255))
-            face.append(([start_point+2*i+1, start_point+2 *
-                          i-1, start_point+2*i], 255, 255, 255))
+    vertex = list(zip(X.reshape(-1), Y.reshape(-1), Z.reshape(-1)))
+    face = strip_faces(start_point, X.shape[0], 2)
     return vertex, face
 
 
@@ -0,0 +1,202 @@
+''' CPU (numpy/scipy) versions of the PointNet++ custom ops
+
+They follow the semantics of the CUDA kernels in sampling/, grouping/ and
+interpolation/ so models can run on machines without a GPU:
+    farthest_point_sample: starts at point 0, float32 squared distances
+    query_ball_point: FIRST nsample points (by index) with distance < radius,
+        padded with the first one found, zeros when the ball is empty
+    three_nn: squared distances to the 3 nearest known points
+'''
+import time
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+def prob_sample(inp, inpr):
+    '''
+input:
+    batch_size * ncategory float32
+    batch_size * npoints   float32
+returns:
+    batch_size * npoints   int32
+    '''
+    cumsum = np.cumsum(np.asarray(inp, dtype=np.float32), axis=1)
+    inpr = np.asarray(inpr, dtype=np.float32)
+    out = np.zeros(inpr.shape, dtype=np.int32)
+    for i in range(cumsum.shape[0]):
+        # first category whose cumulative weight reaches r * total
+        found = np.searchsorted(cumsum[i], inpr[i] * cumsum[i, -1], side='left')
+        out[i] = np.minimum(found, cumsum.shape[1] - 1)
+    return out
+
+
+def farthest_point_sample(npoint, xyz):
+    '''
+input:
+    int32
+    batch_size * ndataset * 3   float32
+returns:
+    batch_size * npoint         int32
+    '''
+    xyz = np.asarray(xyz, dtype=np.float32)
+    b, n, _ = xyz.shape
+    idx = np.zeros((b, npoint), dtype=np.int32)
+    if npoint <= 0:
+        return idx
+    rows = np.arange(b)
+    dist = np.full((b, n), 1e38, dtype=np.float32)
+    old = np.zeros(b, dtype=np.int64)
+    for j in range(1, npoint):
+        d = np.sum((xyz - xyz[rows, old][:, None, :]) ** 2, axis=-1)
+        np.minimum(dist, d, out=dist)
+        old = np.argmax(dist, axis=1)
+        idx[:, j] = old
+    return idx
+
+
+def gather_point(inp, idx):
+    '''
+input:
+    batch_size * ndataset * 3   float32
+    batch_size * npoints        int32
+returns:
+    batch_size * npoints * 3    float32
+    '''
+    return np.take_along_axis(np.asarray(inp), np.asarray(idx)[..., None].astype(np.int64), axis=1)
+
+
+def query_ball_point(radius, nsample, xyz1, xyz2):
+    '''
+    Input:
+        radius: float32, ball search radius
+        nsample: int32, number of points selected in each ball region
+        xyz1: (batch_size, ndataset, 3) float32 array, input points
+        xyz2: (batch_size, npoint, 3) float32 array, query points
+    Output:
+        idx: (batch_size, npoint, nsample) int32 array, indices to input points
+        pts_cnt: (batch_size, npoint) int32 array, number of unique points in each local region
+    '''
+    xyz1 = np.asarray(xyz1, dtype=np.float32)
+    xyz2 = np.asarray(xyz2, dtype=np.float32)
+    b, m, _ = xyz2.shape
+    idx = np.zeros((b, m, nsample), dtype=np.int32)
+    pts_cnt = np.zeros((b, m), dtype=np.int32)
+    for i in range(b):
+        # candidate pairs from the KD-tree, then the exact float32 test of the kernel
+        pairs = cKDTree(xyz2[i]).sparse_distance_matrix(
+            cKDTree(xyz1[i]), radius * (1 + 1e-5), output_type='ndarray')
+        query = pairs['i'].astype(np.int64)
+        point = pairs['j'].astype(np.int64)
+        d = np.sqrt(np.sum((xyz1[i][point] - xyz2[i][query]) ** 2, axis=-1))
+        keep = np.maximum(d, np.float32(1e-20)) < radius
+        query = query[keep]
+        point = point[keep]
+
+        order = np.lexsort((point, query))
+        query = query[order]
+        point = point[order]
+        counts = np.bincount(query, minlength=m)
+        starts = np.cumsum(counts) - counts
+        rank = np.arange(len(query)) - starts[query]
+
+        found = counts > 0
+        idx[i, found, :] = point[starts[found]][:, None]
+        first = rank < nsample
+        idx[i, query[first], rank[first]] = point[first]
+        pts_cnt[i] = np.minimum(counts, nsample)
+    return idx, pts_cnt
+
+
+def group_point(points, idx):
+    '''
+    Input:
+        points: (batch_size, ndataset, channel) float32 array, points to sample from
+        idx: (batch_size, npoint, nsample) int32 array, indices to points
+    Output:
+        out: (batch_size, npoint, nsample, channel) float32 array, values sampled from points
+    '''
+    points = np.asarray(points)
+    idx = np.asarray(idx).astype(np.int64)
+    b, m, nsample = idx.shape
+    out = np.take_along_axis(points, idx.reshape(b, m * nsample, 1), axis=1)
+    return out.reshape(b, m, nsample, points.shape[-1])
+
+
+def knn_point(k, xyz1, xyz2):
+    '''
+    Input:
+        k: int32, number of k in k-nn search
+        xyz1: (batch_size, ndataset, c) float32 array, input points
+        xyz2: (batch_size, npoint, c) float32 array, query points
+    Output:
+        val: (batch_size, npoint, k) float32 array, squared L2 distances
+        idx: (batch_size, npoint, k) int32 array, indices to input points
+    '''
+    xyz1 = np.asarray(xyz1, dtype=np.float32)
+    xyz2 = np.asarray(xyz2, dtype=np.float32)
+    b, m, _ = xyz2.shape
+    val = np.zeros((b, m, k), dtype=np.float32)
+    idx = np.zeros((b, m, k), dtype=np.int32)
+    for i in range(b):
+        d, ix = cKDTree(xyz1[i]).query(xyz2[i], k=k)
+        val[i] = np.reshape(d, (m, k)) ** 2
+        idx[i] = np.reshape(ix, (m, k))
+    return val, idx
+
+
+def three_nn(xyz1, xyz2):
+    '''
+    Input:
+        xyz1: (b,n,3) float32 array, unknown points
+        xyz2: (b,m,3) float32 array, known points
+    Output:
+        dist: (b,n,3) float32 array, squared distances to known points
+        idx: (b,n,3) int32 array, indices to known points
+    '''
+    xyz1 = np.asarray(xyz1, dtype=np.float32)
+    xyz2 = np.asarray(xyz2, dtype=np.float32)
+    b, n, _ = xyz1.shape
+    m = xyz2.shape[1]
+    dist = np.zeros((b, n, 3), dtype=np.float32)
+    idx = np.zeros((b, n, 3), dtype=np.int32)
+    for i in range(b):
+        d, ix = cKDTree(xyz2[i]).query(xyz1[i], k=3)
+        # fewer than 3 known points: same placeholders as the kernel
+        missing = ix >= m
+        d[missing] = 1e40
+        ix[missing] = 0
+        dist[i] = d ** 2
+        idx[i] = ix
+    return dist, idx
+
+
+def three_interpolate(points, idx, weight):
+    '''
+    Input:
+        points: (b,m,c) float32 array, known points
+        idx: (b,n,3) int32 array, indices to known points
+        weight: (b,n,3) float32 array, weights on known points
+    Output:
+        out: (b,n,c) float32 array, interpolated point values
+    '''
+    grouped = group_point(points, idx)
+    return np.sum(grouped * np.asarray(weight)[..., None], axis=2).astype(np.float32)
+
+
+if __name__ == '__main__':
+    np.random.seed(100)
+    xyz = np.random.random((16, 4096, 3)).astype('float32')
+    now = time.time()
+    sampled_idx = farthest_point_sample(1024, xyz)
+    print('farthest_point_sample: {:.3f}s'.format(time.time() - now))
+    new_xyz = gather_point(xyz, sampled_idx)
+    now = time.time()
+    ball_idx, _ = query_ball_point(0.1, 32, xyz, new_xyz)
+    print('query_ball_point: {:.3f}s'.format(time.time() - now))
+    now = time.time()
+    group_point(xyz, ball_idx)
+    print('group_point: {:.3f}s'.format(time.time() - now))
+    now = time.time()
+    three_nn(xyz, new_xyz)
+    print('three_nn: {:.3f}s'.format(time.time() - now))
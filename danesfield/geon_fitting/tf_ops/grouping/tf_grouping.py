@@ -2,12 +2,19 @@ import tensorflow as tf
 from tensorflow.python.framework import ops
 import sys
 import os
-try:
-    grouping_module = tf.load_op_library('tf_grouping_so.so')
-except tf.errors.NotFoundError as e:
-    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-    sys.path.append(BASE_DIR)
-    grouping_module = tf.load_op_library(os.path.join(BASE_DIR, 'tf_grouping_so.so'))
+from danesfield.geon_fitting.tf_ops import cpu_ops
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BASE_DIR)
+grouping_module = None
+# set TF_OPS_CPU=1 (or leave the library out) to use the numpy versions
+if not os.environ.get('TF_OPS_CPU'):
+    for library in ['tf_grouping_so.so', os.path.join(BASE_DIR, 'tf_grouping_so.so')]:
+        try:
+            grouping_module = tf.load_op_library(library)
+            break
+        except tf.errors.NotFoundError:
+            pass
 
 
 def query_ball_point(radius, nsample, xyz1, xyz2):
@@ -21,6 +28,12 @@ def query_ball_point(radius, nsample, xyz1, xyz2):
         idx: (batch_size, npoint, nsample) int32 array, indices to input points
         pts_cnt: (batch_size, npoint) int32 array, number of unique points in each local region
     '''
+    if grouping_module is None:
+        idx, pts_cnt = tf.py_func(lambda x1, x2: cpu_ops.query_ball_point(radius, nsample, x1, x2),
+                                  [xyz1, xyz2], [tf.int32, tf.int32], stateful=False)
+        idx.set_shape([xyz2.get_shape()[0], xyz2.get_shape()[1], nsample])
+        pts_cnt.set_shape([xyz2.get_shape()[0], xyz2.get_shape()[1]])
+        return idx, pts_cnt
     #return grouping_module.query_ball_point(radius, nsample, xyz1, xyz2)
     return grouping_module.query_ball_point(xyz1, xyz2, radius, nsample)
 ops.NoGradient('QueryBallPoint')
@@ -33,6 +46,9 @@ def select_top_k(k, dist):
         idx: (b,m,n) int32 array, first k in n are indices to the top k
         dist_out: (b,m,n) float32 array, first k in n are the top k
     '''
+    if grouping_module is None:
+        val, idx = tf.nn.top_k(-dist, k=dist.get_shape()[-1].value)
+        return idx, -val
     return grouping_module.selection_sort(dist, k)
 ops.NoGradient('SelectionSort')
 def group_point(points, idx):
@@ -43,6 +59,11 @@ def group_point(points, idx):
     Output:
         out: (batch_size, npoint, nsample, channel) float32 array, values sampled from points
     '''
+    if grouping_module is None:
+        # plain gather keeps the op differentiable on CPU
+        offset = tf.reshape(tf.range(tf.shape(points)[0]) * tf.shape(points)[1], [-1, 1, 1])
+        flat = tf.reshape(points, [-1, tf.shape(points)[2]])
+        return tf.gather(flat, tf.cast(idx, tf.int32) + offset)
     return grouping_module.group_point(points, idx)
 @tf.RegisterGradient('GroupPoint')
 def _group_point_grad(op, grad_out):
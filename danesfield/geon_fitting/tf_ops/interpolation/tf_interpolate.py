@@ -2,12 +2,19 @@ import tensorflow as tf
 from tensorflow.python.framework import ops
 import sys
 import os
-try:
-    interpolate_module = tf.load_op_library('tf_interpolate_so.so')
-except tf.errors.NotFoundError as e:
-    BASE_DIR = os.path.dirname(__file__)
-    sys.path.append(BASE_DIR)
-    interpolate_module = tf.load_op_library(os.path.join(BASE_DIR, 'tf_interpolate_so.so'))
+from danesfield.geon_fitting.tf_ops import cpu_ops
+
+BASE_DIR = os.path.dirname(__file__)
+sys.path.append(BASE_DIR)
+interpolate_module = None
+# set TF_OPS_CPU=1 (or leave the library out) to use the numpy versions
+if not os.environ.get('TF_OPS_CPU'):
+    for library in ['tf_interpolate_so.so', os.path.join(BASE_DIR, 'tf_interpolate_so.so')]:
+        try:
+            interpolate_module = tf.load_op_library(library)
+            break
+        except tf.errors.NotFoundError:
+            pass
 
 
 def three_nn(xyz1, xyz2):
@@ -19,6 +26,13 @@ def three_nn(xyz1, xyz2):
         dist: (b,n,3) float32 array, distances to known points
         idx: (b,n,3) int32 array, indices to known points
     '''
+    if interpolate_module is None:
+        dist, idx = tf.py_func(cpu_ops.three_nn, [xyz1, xyz2], [tf.float32, tf.int32],
+                               stateful=False)
+        shape = [xyz1.get_shape()[0], xyz1.get_shape()[1], 3]
+        dist.set_shape(shape)
+        idx.set_shape(shape)
+        return dist, idx
     return interpolate_module.three_nn(xyz1, xyz2)
 ops.NoGradient('ThreeNN')
 def three_interpolate(points, idx, weight):
@@ -30,6 +44,12 @@ def three_interpolate(points, idx, weight):
     Output:
         out: (b,n,c) float32 array, interpolated point values
     '''
+    if interpolate_module is None:
+        # plain gather keeps the op differentiable on CPU
+        offset = tf.reshape(tf.range(tf.shape(points)[0]) * tf.shape(points)[1], [-1, 1, 1])
+        flat = tf.reshape(points, [-1, tf.shape(points)[2]])
+        grouped = tf.gather(flat, tf.cast(idx, tf.int32) + offset)
+        return tf.reduce_sum(grouped * tf.expand_dims(weight, -1), axis=2)
     return interpolate_module.three_interpolate(points, idx, weight)
 @tf.RegisterGradient('ThreeInterpolate')
 def _three_interpolate_grad(op, grad_out):
@@ -7,12 +7,20 @@ import tensorflow as tf
 from tensorflow.python.framework import ops
 import sys
 import os
-try:
-    sampling_module = tf.load_op_library('tf_sampling_so.so')
-except tf.errors.NotFoundError as e:
-    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-    sys.path.append(BASE_DIR)
-    sampling_module = tf.load_op_library(os.path.join(BASE_DIR, 'tf_sampling_so.so'))
+from danesfield.geon_fitting.tf_ops import cpu_ops
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BASE_DIR)
+sampling_module = None
+# The compiled ops only have CUDA kernels; set TF_OPS_CPU=1 (or leave the
+# library out) to run the numpy versions from cpu_ops through tf.py_func.
+if not os.environ.get('TF_OPS_CPU'):
+    for library in ['tf_sampling_so.so', os.path.join(BASE_DIR, 'tf_sampling_so.so')]:
+        try:
+            sampling_module = tf.load_op_library(library)
+            break
+        except tf.errors.NotFoundError:
+            pass
 
 
 def prob_sample(inp, inpr):
@@ -23,6 +31,10 @@ input:
 returns:
     batch_size * npoints   int32
     '''
+    if sampling_module is None:
+        out = tf.py_func(cpu_ops.prob_sample, [inp, inpr], tf.int32, stateful=False)
+        out.set_shape(inpr.get_shape())
+        return out
     return sampling_module.prob_sample(inp, inpr)
 
 
@@ -43,6 +55,12 @@ input:
 returns:
     batch_size * npoints * 3    float32
     '''
+    if sampling_module is None:
+        # plain gather keeps the op differentiable on CPU
+        batch_size = tf.shape(inp)[0]
+        offset = tf.reshape(tf.range(batch_size) * tf.shape(inp)[1], [-1, 1])
+        flat = tf.reshape(inp, [-1, 3])
+        return tf.gather(flat, tf.cast(idx, tf.int32) + offset)
     return sampling_module.gather_point(inp, idx)
 # @tf.RegisterShape('GatherPoint')
 # def _gather_point_shape(op):
@@ -66,6 +84,11 @@ input:
 returns:
     batch_size * npoint         int32
     '''
+    if sampling_module is None:
+        out = tf.py_func(lambda xyz: cpu_ops.farthest_point_sample(npoint, xyz), [inp],
+                         tf.int32, stateful=False)
+        out.set_shape([inp.get_shape()[0], npoint])
+        return out
     return sampling_module.farthest_point_sample(inp, npoint)
 
 
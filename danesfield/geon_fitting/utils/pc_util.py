@@ -25,17 +25,15 @@ def point_cloud_to_volume_batch(point_clouds, vsize=12, radius=1.0, flatten=True
     """ Input is BxNx3 batch of point cloud
         Output is Bx(vsize^3)
     """
-    vol_list = []
-    for b in range(point_clouds.shape[0]):
-        vol = point_cloud_to_volume(np.squeeze(point_clouds[b, :, :]), vsize, radius)
-        if flatten:
-            vol_list.append(vol.flatten())
-        else:
-            vol_list.append(np.expand_dims(np.expand_dims(vol, -1), 0))
+    batch_size = point_clouds.shape[0]
+    vol = np.zeros((batch_size, vsize, vsize, vsize))
+    voxel = 2*radius/float(vsize)
+    locations = ((point_clouds + radius)/voxel).astype(int)
+    batch = np.broadcast_to(np.arange(batch_size)[:, None], locations.shape[:2])
+    vol[batch, locations[:, :, 0], locations[:, :, 1], locations[:, :, 2]] = 1.0
     if flatten:
-        return np.vstack(vol_list)
-    else:
-        return np.concatenate(vol_list, 0)
+        return vol.reshape(batch_size, -1)
+    return vol[..., None]
 
 
 def point_cloud_to_volume(points, vsize, radius=1.0):
@@ -60,15 +58,9 @@ def volume_to_point_cloud(vol):
     """
     vsize = vol.shape[0]
     assert(vol.shape[1] == vsize and vol.shape[1] == vsize)
-    points = []
-    for a in range(vsize):
-        for b in range(vsize):
-            for c in range(vsize):
-                if vol[a, b, c] == 1:
-                    points.append(np.array([a, b, c]))
+    points = np.argwhere(vol == 1)
     if len(points) == 0:
         return np.zeros((0, 3))
-    points = np.vstack(points)
     return points
 
 
@@ -5,7 +5,63 @@ import h5py
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(BASE_DIR)
 
-def shuffle_data(data, labels):
+def _random(rng):
+    """ rng can be None (numpy's global state), a seed or a RandomState.
+        The batched functions below draw their random numbers in the same
+        order as the former per sample loops.
+    """
+    if rng is None:
+        return np.random
+    if isinstance(rng, (int, np.integer)):
+        return np.random.RandomState(rng)
+    return rng
+
+
+def _rotation_y(angles):
+    """ Bx3x3 rotations along the up (y) direction """
+    cosval = np.cos(angles)
+    sinval = np.sin(angles)
+    R = np.zeros((len(angles), 3, 3))
+    R[:, 0, 0] = cosval
+    R[:, 0, 2] = sinval
+    R[:, 1, 1] = 1
+    R[:, 2, 0] = -sinval
+    R[:, 2, 2] = cosval
+    return R
+
+
+def _rotation_z(angles):
+    """ Bx3x3 rotations along z """
+    cosval = np.cos(angles)
+    sinval = np.sin(angles)
+    R = np.zeros((len(angles), 3, 3))
+    R[:, 0, 0] = cosval
+    R[:, 0, 1] = -sinval
+    R[:, 1, 0] = sinval
+    R[:, 1, 1] = cosval
+    R[:, 2, 2] = 1
+    return R
+
+
+def _rotation_xyz(angles):
+    """ Bx3x3 rotations Rz * Ry * Rx from Bx3 angles """
+    Rx = np.zeros((len(angles), 3, 3))
+    Rx[:, 0, 0] = 1
+    Rx[:, 1, 1] = np.cos(angles[:, 0])
+    Rx[:, 1, 2] = -np.sin(angles[:, 0])
+    Rx[:, 2, 1] = np.sin(angles[:, 0])
+    Rx[:, 2, 2] = np.cos(angles[:, 0])
+    return np.matmul(_rotation_z(angles[:, 2]), np.matmul(_rotation_y(angles[:, 1]), Rx))
+
+
+def _rotate(points, R):
+    """ points (BxNx3) times the per shape rotation R (Bx3x3),
+        np.einsum('bnj,bjk->bnk') through the batched matmul kernel
+    """
+    return np.matmul(points, R)
+
+
+def shuffle_data(data, labels, rng=None):
     """ Shuffle data and labels.
         Input:
           data: B,N,... numpy array
@@ -14,10 +70,10 @@ def shuffle_data(data, labels):
           shuffled data, label and shuffle indices
     """
     idx = np.arange(len(labels))
-    np.random.shuffle(idx)
+    _random(rng).shuffle(idx)
     return data[idx, ...], labels[idx], idx
 
-def shuffle_points(batch_data):
+def shuffle_points(batch_data, rng=None):
     """ Shuffle orders of points in each point cloud -- changes FPS behavior.
         Use the same shuffling idx for the entire batch.
         Input:
@@ -26,10 +82,10 @@ def shuffle_points(batch_data):
             BxNxC array
     """
     idx = np.arange(batch_data.shape[1])
-    np.random.shuffle(idx)
+    _random(rng).shuffle(idx)
     return batch_data[:,idx,:]
 
-def rotate_point_cloud(batch_data):
+def rotate_point_cloud(batch_data, rng=None):
     """ Randomly rotate the point clouds to augument the dataset
         rotation is per shape based along up direction
         Input:
@@ -37,19 +93,10 @@ def rotate_point_cloud(batch_data):
         Return:
           BxNx3 array, rotated batch of point clouds
     """
-    rotated_data = np.zeros(batch_data.shape, dtype=np.float32)
-    for k in range(batch_data.shape[0]):
-        rotation_angle = np.random.uniform() * 2 * np.pi
-        cosval = np.cos(rotation_angle)
-        sinval = np.sin(rotation_angle)
-        rotation_matrix = np.array([[cosval, 0, sinval],
-                                    [0, 1, 0],
-                                    [-sinval, 0, cosval]])
-        shape_pc = batch_data[k, ...]
-        rotated_data[k, ...] = np.dot(shape_pc.reshape((-1, 3)), rotation_matrix)
-    return rotated_data
+    angles = _random(rng).uniform(size=batch_data.shape[0]) * 2 * np.pi
+    return _rotate(batch_data, _rotation_y(angles)).astype(np.float32)
 
-def rotate_point_cloud_z(batch_data):
+def rotate_point_cloud_z(batch_data, rng=None):
     """ Randomly rotate the point clouds to augument the dataset
         rotation is per shape based along up direction
         Input:
@@ -57,100 +104,65 @@ def rotate_point_cloud_z(batch_data):
         Return:
           BxNx3 array, rotated batch of point clouds
     """
-    rotated_data = np.zeros(batch_data.shape, dtype=np.float32)
-    for k in range(batch_data.shape[0]):
-        rotation_angle = np.random.uniform() * 2 * np.pi
-        cosval = np.cos(rotation_angle)
-        sinval = np.sin(rotation_angle)
-        rotation_matrix = np.array([[cosval, -sinval, 0],
-                                    [sinval, cosval, 0],
-                                    [0, 0, 1]])
-        shape_pc = batch_data[k, ...]
-        rotated_data[k, ...] = np.dot(shape_pc.reshape((-1, 3)), rotation_matrix)
-    return rotated_data
+    angles = _random(rng).uniform(size=batch_data.shape[0]) * 2 * np.pi
+    return _rotate(batch_data, _rotation_z(angles)).astype(np.float32)
 
-def scale_point_cloud(batch_data):
-    """ Randomly rotate the point clouds to augument the dataset
-        rotation is per shape based along up direction
+def scale_point_cloud(batch_data, rng=None):
+    """ Randomly scale the point clouds along y around their y center
         Input:
           BxNx3 array, original batch of point clouds
         Return:
-          BxNx3 array, rotated batch of point clouds
+          BxNx3 array, scaled batch of point clouds
     """
-    scaled_data = np.zeros(batch_data.shape, dtype=np.float32)
-    for k in range(batch_data.shape[0]):
-        scale = 1.0 - (np.random.uniform()-0.5) * 0.4
-        y_center = np.mean(batch_data[k, :, 1])
-        scaled_data[k, :, 0] = batch_data[k, :, 0]
-        scaled_data[k, :, 1] = (batch_data[k, :, 1]-y_center)*scale + y_center
-        scaled_data[k, :, 2] = batch_data[k, :, 2]
+    scale = 1.0 - (_random(rng).uniform(size=batch_data.shape[0])-0.5) * 0.4
+    scaled_data = batch_data.astype(np.float32)
+    y_center = np.mean(batch_data[:, :, 1], axis=1, keepdims=True)
+    scaled_data[:, :, 1] = (batch_data[:, :, 1]-y_center)*scale[:, None] + y_center
     return scaled_data
 
-def flip_point_cloud(batch_data):
-    """ Randomly rotate the point clouds to augument the dataset
-        rotation is per shape based along up direction
+def flip_point_cloud(batch_data, rng=None):
+    """ Randomly mirror the point clouds in x and/or y around their center
         Input:
           BxNx3 array, original batch of point clouds
         Return:
-          BxNx3 array, rotated batch of point clouds
+          BxNx3 array, flipped batch of point clouds
     """
-    flipped_data = np.zeros(batch_data.shape, dtype=np.float32)
-    for k in range(batch_data.shape[0]):
-        y_flip = np.random.uniform()
-        x_flip = np.random.uniform()
-        y_center = np.mean(batch_data[k, :, 1])
-        x_center = np.mean(batch_data[k, :, 0])
-        if x_flip > 0.5:
-            flipped_data[k, :, 0] = -1*(batch_data[k, :, 0] - x_center) + x_center
-        if y_flip > 0.5:
-            flipped_data[k, :, 1] = -1*(batch_data[k, :, 1] - y_center) + y_center
-        flipped_data[k, :, 2] = batch_data[k, :, 2]
+    # per shape: y flip draw, then x flip draw
+    draws = _random(rng).uniform(size=(batch_data.shape[0], 2))
+    flipped_data = batch_data.astype(np.float32)
+    for axis, flip in ((0, draws[:, 1] > 0.5), (1, draws[:, 0] > 0.5)):
+        center = np.mean(batch_data[:, :, axis], axis=1, keepdims=True)
+        mirrored = -1*(batch_data[:, :, axis] - center) + center
+        flipped_data[:, :, axis] = np.where(flip[:, None], mirrored, batch_data[:, :, axis])
     return flipped_data
 
-def rotate_point_cloud_with_normal(batch_xyz_normal):
+def rotate_point_cloud_with_normal(batch_xyz_normal, rng=None):
     ''' Randomly rotate XYZ, normal point cloud.
         Input:
             batch_xyz_normal: B,N,6, first three channels are XYZ, last 3 all normal
         Output:
             B,N,6, rotated XYZ, normal point cloud
     '''
-    for k in range(batch_xyz_normal.shape[0]):
-        rotation_angle = np.random.uniform() * 2 * np.pi
-        cosval = np.cos(rotation_angle)
-        sinval = np.sin(rotation_angle)
-        rotation_matrix = np.array([[cosval, 0, sinval],
-                                    [0, 1, 0],
-                                    [-sinval, 0, cosval]])
-        shape_pc = batch_xyz_normal[k,:,0:3]
-        shape_normal = batch_xyz_normal[k,:,3:6]
-        batch_xyz_normal[k,:,0:3] = np.dot(shape_pc.reshape((-1, 3)), rotation_matrix)
-        batch_xyz_normal[k,:,3:6] = np.dot(shape_normal.reshape((-1, 3)), rotation_matrix)
+    angles = _random(rng).uniform(size=batch_xyz_normal.shape[0]) * 2 * np.pi
+    R = _rotation_y(angles)
+    batch_xyz_normal[:,:,0:3] = _rotate(batch_xyz_normal[:,:,0:3], R)
+    batch_xyz_normal[:,:,3:6] = _rotate(batch_xyz_normal[:,:,3:6], R)
     return batch_xyz_normal
 
-def rotate_perturbation_point_cloud_with_normal(batch_data, angle_sigma=0.06, angle_clip=0.18):
+def rotate_perturbation_point_cloud_with_normal(batch_data, angle_sigma=0.06, angle_clip=0.18,
+                                                rng=None):
     """ Randomly perturb the point clouds by small rotations
         Input:
           BxNx6 array, original batch of point clouds and point normals
         Return:
           BxNx3 array, rotated batch of point clouds
     """
+    angles = np.clip(angle_sigma*_random(rng).randn(batch_data.shape[0], 3),
+                     -angle_clip, angle_clip)
+    R = _rotation_xyz(angles)
     rotated_data = np.zeros(batch_data.shape, dtype=np.float32)
-    for k in range(batch_data.shape[0]):
-        angles = np.clip(angle_sigma*np.random.randn(3), -angle_clip, angle_clip)
-        Rx = np.array([[1,0,0],
-                       [0,np.cos(angles[0]),-np.sin(angles[0])],
-                       [0,np.sin(angles[0]),np.cos(angles[0])]])
-        Ry = np.array([[np.cos(angles[1]),0,np.sin(angles[1])],
-                       [0,1,0],
-                       [-np.sin(angles[1]),0,np.cos(angles[1])]])
-        Rz = np.array([[np.cos(angles[2]),-np.sin(angles[2]),0],
-                       [np.sin(angles[2]),np.cos(angles[2]),0],
-                       [0,0,1]])
-        R = np.dot(Rz, np.dot(Ry,Rx))
-        shape_pc = batch_data[k,:,0:3]
-        shape_normal = batch_data[k,:,3:6]
-        rotated_data[k,:,0:3] = np.dot(shape_pc.reshape((-1, 3)), R)
-        rotated_data[k,:,3:6] = np.dot(shape_normal.reshape((-1, 3)), R)
+    rotated_data[:,:,0:3] = _rotate(batch_data[:,:,0:3], R)
+    rotated_data[:,:,3:6] = _rotate(batch_data[:,:,3:6], R)
     return rotated_data
 
 
@@ -161,67 +173,39 @@ def rotate_point_cloud_by_angle(batch_data, rotation_angle):
         Return:
           BxNx3 array, rotated batch of point clouds
     """
+    R = _rotation_y(np.full(batch_data.shape[0], rotation_angle))
     rotated_data = np.zeros(batch_data.shape, dtype=np.float32)
-    for k in range(batch_data.shape[0]):
-        #rotation_angle = np.random.uniform() * 2 * np.pi
-        cosval = np.cos(rotation_angle)
-        sinval = np.sin(rotation_angle)
-        rotation_matrix = np.array([[cosval, 0, sinval],
-                                    [0, 1, 0],
-                                    [-sinval, 0, cosval]])
-        shape_pc = batch_data[k,:,0:3]
-        rotated_data[k,:,0:3] = np.dot(shape_pc.reshape((-1, 3)), rotation_matrix)
+    rotated_data[:,:,0:3] = _rotate(batch_data[:,:,0:3], R)
     return rotated_data
 
 def rotate_point_cloud_by_angle_with_normal(batch_data, rotation_angle):
     """ Rotate the point cloud along up direction with certain angle.
         Input:
-          BxNx3 array, original batch of point clouds
+          BxNx6 array, original batch of point clouds and point normals
         Return:
-          BxNx3 array, rotated batch of point clouds
+          BxNx6 array, rotated batch of point clouds and point normals
     """
+    R = _rotation_y(np.full(batch_data.shape[0], rotation_angle))
     rotated_data = np.zeros(batch_data.shape, dtype=np.float32)
-    for k in range(batch_data.shape[0]):
-        #rotation_angle = np.random.uniform() * 2 * np.pi
-        cosval = np.cos(rotation_angle)
-        sinval = np.sin(rotation_angle)
-        rotation_matrix = np.array([[cosval, 0, sinval],
-                                    [0, 1, 0],
-                                    [-sinval, 0, cosval]])
-        shape_pc = batch_data[k, ...]
-        shape_normal = batch_data[k,:,3:6]
-        rotated_data[k, ...] = np.dot(shape_pc.reshape((-1, 3)), rotation_matrix)
-        rotated_data[k,:,3:6] = np.dot(shape_normal.reshape((-1,3)), rotation_matrix)
+    rotated_data[:,:,0:3] = _rotate(batch_data[:,:,0:3], R)
+    rotated_data[:,:,3:6] = _rotate(batch_data[:,:,3:6], R)
     return rotated_data
 
 
 
-def rotate_perturbation_point_cloud(batch_data, angle_sigma=0.06, angle_clip=0.18):
+def rotate_perturbation_point_cloud(batch_data, angle_sigma=0.06, angle_clip=0.18, rng=None):
     """ Randomly perturb the point clouds by small rotations
         Input:
           BxNx3 array, original batch of point clouds
         Return:
           BxNx3 array, rotated batch of point clouds
     """
-    rotated_data = np.zeros(batch_data.shape, dtype=np.float32)
-    for k in range(batch_data.shape[0]):
-        angles = np.clip(angle_sigma*np.random.randn(3), -angle_clip, angle_clip)
-        Rx = np.array([[1,0,0],
-                       [0,np.cos(angles[0]),-np.sin(angles[0])],
-                       [0,np.sin(angles[0]),np.cos(angles[0])]])
-        Ry = np.array([[np.cos(angles[1]),0,np.sin(angles[1])],
-                       [0,1,0],
-                       [-np.sin(angles[1]),0,np.cos(angles[1])]])
-        Rz = np.array([[np.cos(angles[2]),-np.sin(angles[2]),0],
-                       [np.sin(angles[2]),np.cos(angles[2]),0],
-                       [0,0,1]])
-        R = np.dot(Rz, np.dot(Ry,Rx))
-        shape_pc = batch_data[k, ...]
-        rotated_data[k, ...] = np.dot(shape_pc.reshape((-1, 3)), R)
-    return rotated_data
+    angles = np.clip(angle_sigma*_random(rng).randn(batch_data.shape[0], 3),
+                     -angle_clip, angle_clip)
+    return _rotate(batch_data, _rotation_xyz(angles)).astype(np.float32)
 
 
-def jitter_point_cloud(batch_data, sigma=0.01, clip=0.05):
+def jitter_point_cloud(batch_data, sigma=0.01, clip=0.05, rng=None):
     """ Randomly jitter points. jittering is per point.
         Input:
           BxNx3 array, original batch of point clouds
@@ -230,11 +214,11 @@ def jitter_point_cloud(batch_data, sigma=0.01, clip=0.05):
     """
     B, N, C = batch_data.shape
     assert(clip > 0)
-    jittered_data = np.clip(sigma * np.random.randn(B, N, C), -1*clip, clip)
+    jittered_data = np.clip(sigma * _random(rng).randn(B, N, C), -1*clip, clip)
     jittered_data += batch_data
     return jittered_data
 
-def shift_point_cloud(batch_data, shift_range=0.1):
+def shift_point_cloud(batch_data, shift_range=0.1, rng=None):
     """ Randomly shift point cloud. Shift is per point cloud.
         Input:
           BxNx3 array, original batch of point clouds
@@ -242,13 +226,12 @@ def shift_point_cloud(batch_data, shift_range=0.1):
           BxNx3 array, shifted batch of point clouds
     """
     B, N, C = batch_data.shape
-    shifts = np.random.uniform(-shift_range, shift_range, (B,3))
-    for batch_index in range(B):
-        batch_data[batch_index,:,:] += shifts[batch_index,:]
+    shifts = _random(rng).uniform(-shift_range, shift_range, (B,3))
+    batch_data += shifts[:, None, :]
     return batch_data
 
 
-def random_scale_point_cloud(batch_data, scale_low=0.8, scale_high=1.25):
+def random_scale_point_cloud(batch_data, scale_low=0.8, scale_high=1.25, rng=None):
     """ Randomly scale the point cloud. Scale is per point cloud.
         Input:
             BxNx3 array, original batch of point clouds
@@ -256,18 +239,18 @@ def random_scale_point_cloud(batch_data, scale_low=0.8, scale_high=1.25):
             BxNx3 array, scaled batch of point clouds
     """
     B, N, C = batch_data.shape
-    scales = np.random.uniform(scale_low, scale_high, B)
-    for batch_index in range(B):
-        batch_data[batch_index,:,:] *= scales[batch_index]
+    scales = _random(rng).uniform(scale_low, scale_high, B)
+    batch_data *= scales[:, None, None]
     return batch_data
 
-def random_point_dropout(batch_pc, max_dropout_ratio=0.875):
+def random_point_dropout(batch_pc, max_dropout_ratio=0.875, rng=None):
     ''' batch_pc: BxNx3 '''
-    for b in range(batch_pc.shape[0]):
-        dropout_ratio =  np.random.random()*max_dropout_ratio # 0~0.875
-        drop_idx = np.where(np.random.random((batch_pc.shape[1]))<=dropout_ratio)[0]
-        if len(drop_idx)>0:
-            batch_pc[b,drop_idx,:] = batch_pc[b,0,:] # set to the first point
+    B, N = batch_pc.shape[:2]
+    # per shape: the dropout ratio, then one draw per point
+    draws = _random(rng).random_sample((B, N + 1))
+    dropout_ratio = draws[:, :1]*max_dropout_ratio # 0~0.875
+    drop = draws[:, 1:] <= dropout_ratio
+    batch_pc[:] = np.where(drop[:, :, None], batch_pc[:, :1, :], batch_pc)  # set to the first point
     return batch_pc
 
 
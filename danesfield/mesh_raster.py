@@ -0,0 +1,231 @@
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+
+"""Software rasterization of triangle meshes seen from above
+
+Triangles are scan converted into rasters aligned with a GDAL geotransform,
+like the orthographic VTK render of tools/buildings_to_dsm.py: a pixel is
+covered by a triangle when its center is inside the triangle projected on
+the XY plane, and it takes the value of the covering triangle with the
+highest Z at that center (a z-buffer). Everything is done with numpy on
+chunks of candidate pixels, no OpenGL context is needed.
+"""
+
+import numpy
+
+
+def world_to_pixel(points, geo_transform):
+    """Continuous (col, row) raster coordinates of world XY points.
+    Pixel (i, j) covers [i, i + 1) x [j, j + 1), its center is (i + 0.5, j + 0.5).
+    """
+    points = numpy.asarray(points, dtype=numpy.float64)
+    a = numpy.array([[geo_transform[1], geo_transform[2]],
+                     [geo_transform[4], geo_transform[5]]])
+    xy = points[:, :2] - [geo_transform[0], geo_transform[3]]
+    return numpy.linalg.solve(a, xy.T).T
+
+
+def triangulate_polygon(points):
+    """Triangles of a simple polygon, by fan for a convex polygon and by ear
+    clipping otherwise.
+
+    points is the (n, 2) array of the polygon vertices in order. Returns an
+    (n - 2, 3) array of vertex indices, empty when the polygon has no area
+    (a wall seen from above).
+    """
+    points = numpy.asarray(points, dtype=numpy.float64)
+    n = len(points)
+    edges = numpy.roll(points, -1, axis=0) - points
+    turns = edges[:, 0] * numpy.roll(edges[:, 1], -1) - edges[:, 1] * numpy.roll(edges[:, 0], -1)
+    area = (points[:, 0] * numpy.roll(points[:, 1], -1) -
+            numpy.roll(points[:, 0], -1) * points[:, 1]).sum()
+    if area == 0 or n < 3:
+        return numpy.zeros((0, 3), dtype=numpy.int64)
+    if (turns * area >= 0).all():
+        return numpy.stack((numpy.zeros(n - 2, dtype=numpy.int64),
+                            numpy.arange(1, n - 1), numpy.arange(2, n)), axis=1)
+
+    def cross(i, j, k):
+        (xi, yi), (xj, yj), (xk, yk) = points[i], points[j], points[k]
+        return ((xj - xi) * (yk - yi) - (yj - yi) * (xk - xi)) * area
+
+    remaining = list(range(n))
+    triangles = []
+    while len(remaining) > 3:
+        for k in range(len(remaining)):
+            i, j, h = remaining[k - 1], remaining[k], remaining[(k + 1) % len(remaining)]
+            if cross(i, j, h) <= 0:
+                continue
+            if any(cross(i, j, m) >= 0 and cross(j, h, m) >= 0 and cross(h, i, m) >= 0
+                   for m in remaining if m not in (i, j, h)):
+                continue
+            triangles.append((i, j, h))
+            remaining.pop(k)
+            break
+        else:
+            # only degenerate ears left
+            break
+    triangles += [(remaining[0], remaining[k], remaining[k + 1])
+                  for k in range(1, len(remaining) - 1)]
+    return numpy.array(triangles, dtype=numpy.int64)
+
+
+def polygon_triangles(vertices, indices, offsets):
+    """Triangles of polygon faces given as flat vertex indices and offsets
+    (see ply_reader.read_ply and obj_io.read_obj).
+
+    Polygons are triangulated in their XY projection, polygons with no
+    area there (walls) are left out. Polygons with the same number of
+    vertices are handled together, only the concave ones are clipped one
+    by one. Returns the (F, 3) vertex indices of the triangles and the
+    polygon of each triangle.
+    """
+    vertices = numpy.asarray(vertices, dtype=numpy.float64)
+    counts = numpy.diff(offsets)
+    triangles = [numpy.zeros((0, 3), dtype=numpy.int64)]
+    polygon = [numpy.zeros(0, dtype=numpy.int64)]
+    for n in numpy.unique(counts[counts >= 3]):
+        faces = numpy.flatnonzero(counts == n)
+        corners = indices[offsets[faces, None] + numpy.arange(n)]
+        xy = vertices[corners, :2]
+        nxt = numpy.roll(xy, -1, axis=1)
+        area = (xy[..., 0] * nxt[..., 1] - nxt[..., 0] * xy[..., 1]).sum(axis=1)
+        edges = nxt - xy
+        turns = (edges[..., 0] * numpy.roll(edges[..., 1], -1, axis=1) -
+                 edges[..., 1] * numpy.roll(edges[..., 0], -1, axis=1))
+        convex = (area != 0) & (turns * area[:, None] >= 0).all(axis=1)
+        fan = numpy.stack((numpy.zeros(n - 2, dtype=numpy.int64),
+                           numpy.arange(1, n - 1), numpy.arange(2, n)), axis=1)
+        triangles.append(corners[convex][:, fan].reshape(-1, 3))
+        polygon.append(numpy.repeat(faces[convex], n - 2))
+        for p in numpy.flatnonzero((area != 0) & ~convex):
+            local = triangulate_polygon(xy[p])
+            triangles.append(corners[p][local])
+            polygon.append(numpy.full(len(local), faces[p]))
+    polygon = numpy.concatenate(polygon)
+    order = numpy.argsort(polygon, kind='stable')
+    return numpy.concatenate(triangles)[order], polygon[order]
+
+
+def rasterize_tile(pixels, z, triangles, values, window, chunk_size=1 << 22):
+    """Z-buffer render of triangles into a raster window.
+
+    pixels are the (N, 2) raster (col, row) coordinates and z the heights of
+    the vertices, triangles the (F, 3) vertex indices and values the (F,)
+    value of each triangle. window is (row, col, height, width). Returns
+    the value raster (NaN where no triangle is seen) and the depth raster
+    (-inf there) of the window.
+    """
+    row0, col0, height, width = window
+    out_values = numpy.full((height, width), numpy.nan)
+    depth = numpy.full((height, width), -numpy.inf)
+    flat_values = out_values.ravel()
+    flat_depth = depth.ravel()
+    if len(triangles) == 0:
+        return out_values, depth
+
+    a, b, c = pixels[triangles[:, 0]], pixels[triangles[:, 1]], pixels[triangles[:, 2]]
+    area = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0])
+    corners = numpy.stack((a, b, c), axis=1)
+    # pixels whose center is inside the bounding box, clipped to the window
+    lo = numpy.ceil(corners.min(axis=1) - 0.5).astype(numpy.int64)
+    hi = numpy.floor(corners.max(axis=1) - 0.5).astype(numpy.int64)
+    lo = numpy.maximum(lo, [col0, row0])
+    hi = numpy.minimum(hi, [col0 + width - 1, row0 + height - 1])
+    size = hi - lo + 1
+    visible = numpy.flatnonzero((area != 0) & (size > 0).all(axis=1))
+    if len(visible) == 0:
+        return out_values, depth
+    counts = size[visible, 0] * size[visible, 1]
+    ends = numpy.cumsum(counts)
+
+    start = 0
+    while start < len(visible):
+        stop = max(start + 1, numpy.searchsorted(ends, ends[start] - counts[start] + chunk_size,
+                                                 side='right'))
+        chunk = visible[start:stop]
+        n = counts[start:stop]
+        owner = numpy.repeat(numpy.arange(len(chunk)), n)
+        local = numpy.arange(n.sum()) - numpy.repeat(numpy.cumsum(n) - n, n)
+        w = size[chunk, 0][owner]
+        col = lo[chunk, 0][owner] + local % w
+        row = lo[chunk, 1][owner] + local // w
+        t = chunk[owner]
+        px = col + 0.5
+        py = row + 0.5
+
+        # barycentric coordinates of the pixel centers
+        tri = triangles[t]
+        ax, ay = pixels[tri[:, 0], 0], pixels[tri[:, 0], 1]
+        bx, by = pixels[tri[:, 1], 0], pixels[tri[:, 1], 1]
+        cx, cy = pixels[tri[:, 2], 0], pixels[tri[:, 2], 1]
+        l1 = ((px - ax) * (cy - ay) - (py - ay) * (cx - ax)) / area[t]
+        l2 = ((bx - ax) * (py - ay) - (by - ay) * (px - ax)) / area[t]
+        l0 = 1 - l1 - l2
+        inside = (l0 >= 0) & (l1 >= 0) & (l2 >= 0)
+        t, tri = t[inside], tri[inside]
+        key = (row[inside] - row0) * width + (col[inside] - col0)
+        d = l0[inside] * z[tri[:, 0]] + l1[inside] * z[tri[:, 1]] + l2[inside] * z[tri[:, 2]]
+
+        # highest candidate of each pixel, then the z-buffer test
+        order = numpy.lexsort((d, key))
+        key, d, t = key[order], d[order], t[order]
+        last = numpy.ones(len(key), dtype=bool)
+        last[:-1] = key[1:] != key[:-1]
+        key, d, t = key[last], d[last], t[last]
+        closer = d > flat_depth[key]
+        flat_depth[key[closer]] = d[closer]
+        flat_values[key[closer]] = values[t[closer]]
+        start = stop
+    return out_values, depth
+
+
+def raster_tiles(shape, tile_size=None):
+    """(row, col, height, width) windows covering a raster shape"""
+    if tile_size is None:
+        tile_size = max(shape)
+    for row in range(0, shape[0], tile_size):
+        for col in range(0, shape[1], tile_size):
+            yield (row, col, min(tile_size, shape[0] - row), min(tile_size, shape[1] - col))
+
+
+def iter_rasterize(vertices, triangles, values, geo_transform, shape, tile_size=None):
+    """Z-buffer render of triangles, one raster tile at a time.
+
+    vertices are (N, 3) world coordinates, triangles (F, 3) vertex indices
+    and values the (F,) value of each triangle. Yields each window of
+    raster_tiles with its value and depth rasters (see rasterize_tile), so
+    large areas are rendered in bounded memory.
+    """
+    vertices = numpy.asarray(vertices, dtype=numpy.float64)
+    triangles = numpy.asarray(triangles, dtype=numpy.int64).reshape(-1, 3)
+    values = numpy.asarray(values)
+    pixels = world_to_pixel(vertices, geo_transform)
+    z = vertices[:, 2]
+    corners = pixels[triangles]
+    lo = numpy.floor(corners.min(axis=1) - 0.5)
+    hi = numpy.ceil(corners.max(axis=1) - 0.5)
+    for window in raster_tiles(shape, tile_size):
+        row, col, height, width = window
+        selected = ((hi[:, 0] >= col) & (lo[:, 0] < col + width) &
+                    (hi[:, 1] >= row) & (lo[:, 1] < row + height))
+        tile_values, tile_depth = rasterize_tile(pixels, z, triangles[selected],
+                                                 values[selected], window)
+        yield window, tile_values, tile_depth
+
+
+def rasterize_triangles(vertices, triangles, values, geo_transform, shape, tile_size=None):
+    """Z-buffer render of triangles into a raster of the given (rows, cols)
+    shape, see iter_rasterize. Returns the value and depth rasters.
+    """
+    out_values = numpy.full(shape, numpy.nan)
+    depth = numpy.full(shape, -numpy.inf)
+    for (row, col, height, width), tile_values, tile_depth in iter_rasterize(
+            vertices, triangles, values, geo_transform, shape, tile_size):
+        out_values[row:row + height, col:col + width] = tile_values
+        depth[row:row + height, col:col + width] = tile_depth
+    return out_values, depth
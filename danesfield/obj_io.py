@@ -0,0 +1,290 @@
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+'''
+Bulk OBJ input and output. Vertex and face arrays are formatted a block of
+rows at a time with one % operation, numbers printed like str() of their
+numpy type, so files match the ones written line by line. OBJ files are
+parsed into flat vertex and polygon arrays, cached in .npz files next to
+them, and merged by streaming their lines with shifted indices and
+offsets.
+'''
+
+from itertools import groupby, islice
+from operator import itemgetter
+import os
+import re
+import zipfile
+
+import numpy as np
+
+# rows formatted per % operation, bounds the size of the temporary text
+CHUNK_ROWS = 65536
+# version of the arrays saved by load_obj, older cache files are parsed again
+CACHE_VERSION = 1
+
+OFFSET_RE = re.compile(r"#([xyz]) offset: ([-+]?(\d+(\.\d*)?|\.\d+)([eE][-+]?\d+)?)")
+COORDINATE_SYSTEM_RE = re.compile(
+    r"# coordinate_system: {.* \[[^,]*, [^,]*, ([^,]*), ([^,]*), ([^,]*), .*\].*}\n")
+
+
+def format_rows(prefix, rows):
+    '''
+    OBJ lines of a 2D array: the prefix ('v', 'f', ...) then the values of
+    each row. float64 and integer values are written like str(), other
+    floats like str() of their numpy type.
+    '''
+    rows = np.asarray(rows)
+    if rows.size == 0:
+        return ''
+    if rows.ndim == 1:
+        rows = rows[None, :]
+    if rows.dtype.kind == 'f' and rows.dtype != np.float64:
+        values = rows.astype(str).ravel().tolist()
+    else:
+        values = rows.ravel().tolist()
+    line = prefix + ' %s' * rows.shape[1] + '\n'
+    return (line * rows.shape[0]) % tuple(values)
+
+
+def offset_header(offset):
+    ''' '#x offset:' comment lines of a mesh translated by offset '''
+    return ''.join('#{} offset: {}\n'.format(axis, str(value))
+                   for axis, value in zip('xyz', offset))
+
+
+def write_obj(fp, vertices, faces=None, offset=None, header=None, start=1):
+    '''
+    Write a mesh to an OBJ file.
+    :param fp: file path or text file object
+    :param vertices: (V, 3) vertex coordinates
+    :param faces: (F, k) vertex indices of the faces
+    :param offset: written as the offset header of the file when given
+    :param header: extra header lines written after the offset
+    :param start: added to the face indices, 1 for 0-based faces
+    '''
+    if isinstance(fp, str):
+        with open(fp, 'w') as f:
+            return write_obj(f, vertices, faces, offset, header, start)
+    if offset is not None:
+        fp.write(offset_header(offset))
+    if header:
+        fp.writelines(header)
+    vertices = np.asarray(vertices)
+    for i in range(0, len(vertices), CHUNK_ROWS):
+        fp.write(format_rows('v', vertices[i:i + CHUNK_ROWS]))
+    if faces is not None:
+        faces = np.asarray(faces)
+        for i in range(0, len(faces), CHUNK_ROWS):
+            fp.write(format_rows('f', faces[i:i + CHUNK_ROWS] + start))
+
+
+def read_obj(fp):
+    '''
+    Vertices and faces of an OBJ file.
+    :param fp: OBJ file path
+    :return: (N, 3) vertex coordinates, flat 0-based face vertex indices and
+             the offsets of each face in them, like ply_reader.read_ply
+    '''
+    vertices = [np.zeros((0, 3))]
+    indices = [np.zeros(0, dtype=np.int64)]
+    counts = [np.zeros(0, dtype=np.int64)]
+    nb_vertices = 0
+    with open(fp) as f:
+        for kind, run in groupby(f, itemgetter(slice(0, 2))):
+            if kind == 'v ':
+                run = list(run)
+                values = parse_rows('v', run)
+                if values is None or values.shape[1] < 3:
+                    values = np.array([line.split()[1:4] for line in run], dtype=np.float64)
+                vertices.append(values[:, :3])
+                nb_vertices += len(run)
+            elif kind == 'f ':
+                run = list(run)
+                values = parse_rows('f', run)
+                if values is not None:
+                    face_indices = values.ravel()
+                    face_counts = np.full(len(run), values.shape[1], dtype=np.int64)
+                else:
+                    rows = [[x.partition('/')[0] for x in line.split()[1:]] for line in run]
+                    face_indices = np.array([x for row in rows for x in row], dtype=np.int64)
+                    face_counts = np.array([len(row) for row in rows], dtype=np.int64)
+                # relative indices count back from the last vertex read
+                indices.append(np.where(face_indices > 0, face_indices - 1,
+                                        face_indices + nb_vertices))
+                counts.append(face_counts)
+    offsets = np.zeros(sum(len(c) for c in counts) + 1, dtype=np.int64)
+    np.cumsum(np.concatenate(counts), out=offsets[1:])
+    return np.concatenate(vertices), np.concatenate(indices), offsets
+
+
+def parse_rows(kind, lines):
+    '''
+    Values of 'v' or 'f' lines with the same number of plain values, as a
+    (len(lines), k) array, None for other lines.
+    '''
+    text = ''.join(lines)
+    if '/' in text:
+        return None
+    width = len(lines[0].split()) - 1
+    values = np.fromstring(text.replace(kind, ' '),
+                           dtype=np.float64 if kind == 'v' else np.int64, sep=' ')
+    spaces = lines[0].count(' ')
+    if values.size != len(lines) * width or any(line.count(' ') != spaces for line in lines):
+        return None
+    return values.reshape(len(lines), width)
+
+
+def cache_path(fp):
+    ''' .npz file caching the arrays of an OBJ file, next to it '''
+    return os.path.splitext(fp)[0] + '.npz'
+
+
+def load_obj(fp, cache=True):
+    '''
+    Vertices and faces of an OBJ file, like read_obj, with the offset of
+    its header added to the vertices.
+    The arrays are saved in a .npz file next to the OBJ file (see
+    cache_path) and loaded from there as long as the OBJ file keeps the
+    same size and modification time, and the cache the same CACHE_VERSION.
+    :param fp: OBJ file path
+    :param cache: use and write the cache file
+    '''
+    stat = os.stat(fp)
+    source = np.array([CACHE_VERSION, stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+    path = cache_path(fp)
+    if cache and os.path.isfile(path):
+        try:
+            with np.load(path) as data:
+                if np.array_equal(data['source'], source):
+                    return data['vertices'], data['indices'], data['offsets']
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            pass
+
+    vertices, indices, offsets = read_obj(fp)
+    offset, count = read_obj_offset(fp)
+    if offset is not None:
+        vertices += offset
+    if cache:
+        tmp = '{}.tmp{}'.format(path, os.getpid())
+        try:
+            with open(tmp, 'wb') as f:
+                np.savez(f, vertices=vertices, indices=indices, offsets=offsets,
+                         source=source)
+            os.replace(tmp, path)
+        except OSError:
+            # read-only directory, work without the cache
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    return vertices, indices, offsets
+
+
+def read_offset_header(lines):
+    '''
+    Offset written as comments at the top of a mesh file, either as
+    '#x offset: ...', '#y offset: ...', '#z offset: ...' first lines or in
+    a '# coordinate_system: ...' 8th line (see gdal_utils.read_offset).
+    :param lines: first lines of the file
+    :return: offset, None when the file has none, and the number of
+             '#x offset' lines at the top of the file
+    '''
+    offset = [0.0, 0.0, 0.0]
+    count = 0
+    for axis, line in zip('xyz', lines[:3]):
+        match = OFFSET_RE.match(line)
+        if match is None or match.group(1) != axis:
+            break
+        offset[count] = float(match.group(2))
+        count += 1
+    if count:
+        return offset, count
+    match = COORDINATE_SYSTEM_RE.match(lines[7]) if len(lines) > 7 else None
+    if match:
+        return [float(match.group(1 + i)) for i in range(3)], 0
+    return None, 0
+
+
+def read_obj_offset(fp):
+    ''' offset header of an OBJ file, see read_offset_header '''
+    with open(fp) as f:
+        return read_offset_header([f.readline() for i in range(8)])
+
+
+def shift_lines(kind, lines, delta, start):
+    '''
+    Vertex lines translated by delta or face lines with their (positive)
+    vertex indices shifted by start. Blocks of lines with the same number
+    of plain values are parsed at once, others line by line.
+    '''
+    values = parse_rows(kind, lines)
+    if values is not None and (kind == 'f' or values.shape[1] == 3):
+        if kind == 'v':
+            return format_rows('v', values + delta)
+        values[values > 0] += start
+        return format_rows('f', values)
+    rows = [line.split() for line in lines]
+    if kind == 'v':
+        return ''.join(' '.join(['v'] + [str(float(x) + d) for x, d in zip(row[1:4], delta)] +
+                                row[4:]) + '\n' for row in rows)
+    return ''.join(' '.join(['f'] + [shift_face_vertex(x, start) for x in row[1:]]) + '\n'
+                   for row in rows)
+
+
+def shift_face_vertex(text, start):
+    # 'v', 'v/vt', 'v//vn' or 'v/vt/vn' face vertex with its vertex index shifted
+    index, sep, rest = text.partition('/')
+    index = int(index)
+    return str(index + start if index > 0 else index) + sep + rest
+
+
+def merge_obj(mesh_files, output_file, check_offsets=False, chunk_lines=CHUNK_ROWS):
+    '''
+    Merge the vertices and faces of OBJ files.
+    A first pass reads the offset headers of the files, then the files are
+    streamed to the output a chunk of lines at a time: face indices are
+    shifted by the number of vertices of the previous files, and vertices
+    are translated from the offset of their file to the offset of the first
+    file with an offset, which the output header records. Files without
+    offset are taken as they are: their vertices (like the ground mesh of
+    dtm_to_mesh) already have that offset removed. Other lines are copied,
+    so memory does not depend on the number or the size of the meshes.
+    :param mesh_files: OBJ file paths
+    :param output_file: merged OBJ file path
+    :param check_offsets: fail when the offsets of the files differ
+    :return: the number of vertices written
+    '''
+    headers = [read_obj_offset(fp) for fp in mesh_files]
+    for fp, (offset, count) in zip(mesh_files, headers):
+        if check_offsets and offset != headers[0][0]:
+            raise ValueError('Offsets are not consistent over the meshes '
+                             '({})'.format(fp))
+    reference = next((offset for offset, count in headers if offset is not None), None)
+
+    nb_vertices = 0
+    with open(output_file, 'w') as out:
+        if reference is not None:
+            out.write(offset_header(reference))
+        for fp, (offset, count) in zip(mesh_files, headers):
+            delta = None
+            if offset is not None and offset != reference:
+                delta = np.subtract(offset, reference)
+            start = nb_vertices
+            with open(fp) as f:
+                for line in islice(f, count):
+                    pass
+                while True:
+                    lines = list(islice(f, chunk_lines))
+                    if not lines:
+                        break
+                    for kind, run in groupby(lines, itemgetter(slice(0, 2))):
+                        run = list(run)
+                        if kind == 'v ':
+                            nb_vertices += len(run)
+                        if (kind == 'v ' and delta is not None) or (kind == 'f ' and start):
+                            out.write(shift_lines(kind[0], run, delta, start))
+                        else:
+                            out.writelines(run)
+    return nb_vertices
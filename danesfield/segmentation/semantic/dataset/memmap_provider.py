@@ -0,0 +1,142 @@
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+import hashlib
+import os
+import time
+
+import numpy as np
+
+from .abstract_image_type import AbstractImageType, AlphaNotAvailableException
+from .image_provider import AbstractImageProvider
+
+
+class MemmapImageType(AbstractImageType):
+    """
+    image type backed by the .npy files written by MemmapImageProvider;
+    image, mask and alpha are read-only memory maps so crops are views
+    """
+
+    def __init__(self, provider, fn, item):
+        super().__init__(provider.paths, fn, None, has_alpha=provider.has_alpha)
+        self.provider = provider
+        self.item = item
+
+    def read_image(self):
+        return self.provider.array(self.item, 'image')
+
+    def read_mask(self):
+        return self.provider.array(self.item, 'mask')
+
+    def read_alpha(self):
+        return self.provider.array(self.item, 'alpha')
+
+
+class MemmapImageProvider(AbstractImageProvider):
+    """
+    provides images decoded once into a memory-mapped .npy store.
+
+    Every image of the wrapped provider is decoded in the parent process and
+    saved under cache_dir, keyed by the image type, border and source files
+    of each band, so DataLoader workers share the page cache instead of
+    decoding their own copy.
+    """
+
+    def __init__(self, provider, cache_dir, with_mask=True):
+        super(MemmapImageProvider, self).__init__(provider.image_type,
+                                                  has_alpha=provider.has_alpha)
+        self.paths = provider.paths
+        self.im_names = provider.im_names
+        self.border = provider.border
+        self.cache_dir = cache_dir
+        self.with_mask = with_mask
+        self.files = []
+        self._arrays = {}
+
+        os.makedirs(cache_dir, exist_ok=True)
+        for item in range(len(provider)):
+            self.files.append(self._decode(provider, item))
+
+    def cache_key(self, fn):
+        sources = []
+        for band, path in sorted(self.paths.items()):
+            src = os.path.join(path, fn)
+            mtime = os.path.getmtime(src) if os.path.exists(src) else None
+            sources.append((band, os.path.abspath(src), mtime))
+        key = repr((self.image_type.__name__, self.border, sources))
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _decode(self, provider, item):
+        image = provider[item]
+        key = self.cache_key(image.fn)
+        names = ['image']
+        if self.with_mask:
+            names.append('mask')
+        if self.has_alpha:
+            names.append('alpha')
+
+        files = {}
+        for name in names:
+            path = os.path.join(self.cache_dir, '{}_{}.npy'.format(key, name))
+            if not os.path.exists(path):
+                tmp = path + '.{}.tmp'.format(os.getpid())
+                with open(tmp, 'wb') as f:
+                    np.save(f, np.ascontiguousarray(getattr(image, name)))
+                os.replace(tmp, path)
+            files[name] = path
+        return files
+
+    def array(self, item, name):
+        if name == 'alpha' and not self.has_alpha:
+            raise AlphaNotAvailableException
+        # memory maps are opened lazily so each worker maps the files itself
+        if (item, name) not in self._arrays:
+            self._arrays[(item, name)] = np.load(self.files[item][name], mmap_mode='r')
+        return self._arrays[(item, name)]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_arrays'] = {}
+        return state
+
+    def __getitem__(self, item):
+        return MemmapImageType(self, self.im_names[item], item)
+
+    def __len__(self):
+        return len(self.im_names)
+
+
+def epoch_time(dataset, num_workers, batch_size=8):
+    """
+    seconds needed to iterate once over dataset with a DataLoader
+    """
+    from torch.utils.data.dataloader import DataLoader as PytorchDataLoader
+
+    loader = PytorchDataLoader(dataset, batch_size=batch_size, shuffle=True,
+                               num_workers=num_workers, drop_last=False)
+    start = time.time()
+    for _ in loader:
+        pass
+    return time.time() - start
+
+
+def benchmark(provider, cache_dir, image_indexes, config, transforms=None,
+              workers=(4, 8), batch_size=8):
+    """
+    compare the epoch time of TrainDataset on the decoding provider against
+    the memory-mapped one
+    """
+    from .neural_dataset import TrainDataset
+
+    cached = MemmapImageProvider(provider, cache_dir)
+    results = {}
+    for num_workers in workers:
+        for name, ds in (('decode', provider), ('memmap', cached)):
+            dataset = TrainDataset(ds, image_indexes, config, transforms=transforms)
+            results[(name, num_workers)] = epoch_time(dataset, num_workers, batch_size)
+            print('{} loader, {} workers: {:.2f} s/epoch'.format(
+                name, num_workers, results[(name, num_workers)]))
+    return results
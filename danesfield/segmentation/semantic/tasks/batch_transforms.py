@@ -0,0 +1,236 @@
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+"""
+batch counterparts of the augmentations in transforms.py.
+They work on whole (B, C, H, W) tensors, as produced by ToTensor and the
+DataLoader, with all random decisions drawn at once from a seeded
+torch.Generator. transforms.py stays the per-sample reference.
+"""
+import torch
+
+
+def _select(mask):
+    return mask.nonzero().view(-1)
+
+
+def _rot90(x, k):
+    # clockwise rotation by k * 90 degrees in the (H, W) plane, like
+    # RandomRotate90 with angle = k * 90
+    if k == 1:
+        return x.transpose(2, 3).flip(3)
+    if k == 2:
+        return x.flip(2).flip(3)
+    return x.transpose(2, 3).flip(2)
+
+
+class BatchCompose:
+    def __init__(self, transforms):
+        self.transforms = transforms
+
+    def __call__(self, x, mask=None):
+        for t in self.transforms:
+            x, mask = t(x, mask)
+        return x, mask
+
+
+class BatchTransform:
+    """
+    base class, owns the random generator so a seed gives the same
+    augmentation sequence on every run. params() draws the random decisions
+    of a batch and apply() uses them, __call__ does both.
+    """
+    def __init__(self, prob=.5, generator=None, seed=None):
+        self.prob = prob
+        if generator is None:
+            generator = torch.Generator()
+            if seed is not None:
+                generator.manual_seed(seed)
+        self.generator = generator
+
+    def draw(self, batch_size):
+        return torch.rand(batch_size, generator=self.generator) < self.prob
+
+    def params(self, img):
+        return self.draw(img.size(0))
+
+    def apply(self, img, mask, params):
+        raise NotImplementedError
+
+    def __call__(self, img, mask=None):
+        return self.apply(img, mask, self.params(img))
+
+
+class _BatchSelected(BatchTransform):
+    # applies op to the selected samples of the image and mask
+    def op(self, x):
+        raise NotImplementedError
+
+    def apply(self, img, mask, selected):
+        idx = _select(selected).to(img.device)
+        if len(idx):
+            img = img.clone()
+            img[idx] = self.op(img[idx])
+            if mask is not None:
+                mask = mask.clone()
+                mask[idx] = self.op(mask[idx])
+        return img, mask
+
+
+class BatchHorizontalFlip(_BatchSelected):
+    def op(self, x):
+        return x.flip(3)
+
+
+class BatchVerticalFlip(_BatchSelected):
+    def op(self, x):
+        return x.flip(2)
+
+
+class BatchTranspose(_BatchSelected):
+    def op(self, x):
+        return x.transpose(2, 3)
+
+    def apply(self, img, mask, selected):
+        if img.size(2) != img.size(3):
+            raise ValueError('BatchTranspose needs square images, got {}x{}'
+                             .format(img.size(2), img.size(3)))
+        return super().apply(img, mask, selected)
+
+
+class BatchRandomRotate90(BatchTransform):
+    """
+    rotates each selected sample by 90, 180 or 270 degrees; params are the
+    number of quarter turns of each sample, 0 when it is not selected
+    """
+    def params(self, img):
+        selected = self.draw(img.size(0))
+        turns = torch.randint(1, 4, (img.size(0),), generator=self.generator)
+        return turns * selected.long()
+
+    def apply(self, img, mask, turns):
+        if img.size(2) != img.size(3):
+            raise ValueError('BatchRandomRotate90 needs square images, got {}x{}'
+                             .format(img.size(2), img.size(3)))
+        img = img.clone()
+        if mask is not None:
+            mask = mask.clone()
+        for k in (1, 2, 3):
+            idx = _select(turns == k).to(img.device)
+            if len(idx):
+                img[idx] = _rot90(img[idx], k)
+                if mask is not None:
+                    mask[idx] = _rot90(mask[idx], k)
+        return img, mask
+
+
+class BatchRandomCrop(BatchTransform):
+    """
+    crops rows x cols windows at independent random positions, like
+    ImageCropper.random_crop_coords and crop_image do for single samples;
+    params are the (y, x) top left corners
+    """
+    def __init__(self, rows, cols, generator=None, seed=None):
+        super().__init__(prob=1., generator=generator, seed=seed)
+        self.rows = rows
+        self.cols = cols
+
+    def crop(self, x, ys, xs):
+        rows = (ys.view(-1, 1) + torch.arange(self.rows)).to(x.device)
+        cols = (xs.view(-1, 1) + torch.arange(self.cols)).to(x.device)
+        batch = torch.arange(x.size(0), device=x.device).view(-1, 1, 1)
+        # advanced indexing puts the batch/row/col dimensions first
+        return x.permute(0, 2, 3, 1)[batch, rows[:, :, None], cols[:, None, :]] \
+            .permute(0, 3, 1, 2).contiguous()
+
+    def params(self, img):
+        batch_size, _, height, width = img.size()
+        if (height, width) == (self.rows, self.cols):
+            return None
+        ys = torch.randint(0, height - self.rows + 1, (batch_size,), generator=self.generator)
+        xs = torch.randint(0, width - self.cols + 1, (batch_size,), generator=self.generator)
+        return ys, xs
+
+    def apply(self, img, mask, corners):
+        if corners is None:
+            return img, mask
+        img = self.crop(img, *corners)
+        if mask is not None:
+            mask = self.crop(mask, *corners)
+        return img, mask
+
+
+class _BatchIntensity(BatchTransform):
+    """
+    base class of the color jitters of the first `channels` bands. Inputs
+    are ToTensor outputs, x = 2 * v / scale - 1 for an image v, so the
+    per-sample formulas are applied to u = (x + 1) / 2 and the results are
+    clipped to [0, max(u)] as clip() does. params are the per-sample alpha,
+    1 when the sample is not selected.
+    """
+    def __init__(self, limit=.1, channels=3, prob=.5, generator=None, seed=None):
+        super().__init__(prob=prob, generator=generator, seed=seed)
+        self.limit = limit
+        self.channels = channels
+
+    def params(self, img):
+        selected = self.draw(img.size(0)).double()
+        alpha = 1 + self.limit * (2 * torch.rand(img.size(0), generator=self.generator,
+                                                 dtype=torch.float64) - 1)
+        return 1 + selected * (alpha - 1)
+
+    def jitter(self, u, alpha):
+        raise NotImplementedError
+
+    def apply(self, img, mask, alpha):
+        batch_size = img.size(0)
+        u = (img[:, :self.channels].double() + 1) / 2
+        maxval = u.reshape(batch_size, -1).max(1)[0].view(-1, 1, 1, 1)
+        alpha = alpha.to(img.device).view(-1, 1, 1, 1)
+        u = torch.min(self.jitter(u, alpha).clamp(min=0), maxval)
+        img = img.clone()
+        img[:, :self.channels] = (2 * u - 1).to(img.dtype)
+        return img, mask
+
+
+class BatchBrightness(_BatchIntensity):
+    """
+    batch version of RandomBrightness
+    """
+    def jitter(self, u, alpha):
+        return alpha * u
+
+
+class BatchContrast(_BatchIntensity):
+    """
+    batch version of RandomContrast, the gray level is the one of
+    cv2.COLOR_BGR2GRAY
+    """
+    def jitter(self, u, alpha):
+        weights = torch.tensor([0.114, 0.587, 0.299], dtype=u.dtype, device=u.device)
+        gray = (u[:, :3] * weights.view(1, 3, 1, 1)).sum(1).mean((1, 2)).view(-1, 1, 1, 1)
+        return alpha * u + 3 * (1 - alpha) * gray
+
+
+def batch_augment_flips_color(seed=None, crop=None):
+    """
+    flips, 90 degree rotations, optional random crop and brightness and
+    contrast jitter sharing one seeded generator
+    """
+    generator = torch.Generator()
+    if seed is not None:
+        generator.manual_seed(seed)
+    transforms = []
+    if crop is not None:
+        transforms.append(BatchRandomCrop(*crop, generator=generator))
+    transforms.extend([
+        BatchHorizontalFlip(prob=.5, generator=generator),
+        BatchVerticalFlip(prob=.5, generator=generator),
+        BatchRandomRotate90(prob=.5, generator=generator),
+        BatchBrightness(prob=.5, generator=generator),
+        BatchContrast(prob=.5, generator=generator),
+    ])
+    return BatchCompose(transforms)
@@ -20,6 +20,7 @@ from scipy import ndimage as ndi
 from skimage.morphology import remove_small_objects, watershed
 
 from danesfield.segmentation.semantic.dataset.neural_dataset import ValDataset, SequentialDataset
+from danesfield.segmentation.semantic.tasks.tiled_inference import TiledPredictor
 from torch.utils.data.dataloader import DataLoader as PytorchDataLoader
 from danesfield.segmentation.semantic.utils.utils import heatmap
 from torch.serialization import SourceChangeWarning
@@ -37,12 +38,12 @@ class flip:
 
 def flip_tensor_lr(batch):
     columns = batch.data.size()[-1]
-    return batch.index_select(3, torch.LongTensor(list(reversed(range(columns)))).cuda())
+    return batch.index_select(3, torch.LongTensor(list(reversed(range(columns)))).to(batch.device))
 
 
 def flip_tensor_ud(batch):
     rows = batch.data.size()[-2]
-    return batch.index_select(2, torch.LongTensor(list(reversed(range(rows)))).cuda())
+    return batch.index_select(2, torch.LongTensor(list(reversed(range(rows)))).to(batch.device))
 
 
 def to_numpy(batch):
@@ -125,13 +126,17 @@ class Evaluator:
     base class for inference, supports different strategy - full image or crops,
     also supports different image types
     """
-    def __init__(self, config, ds=None, folds=1, test=False, flips=0, num_workers=0, border=12):
+    def __init__(self, config, ds=None, folds=1, test=False, flips=0, num_workers=0, border=12,
+                 device=None, tile_batch_size=4, tile_overlap=128):
         self.config = config
         self.ds = ds
         self.folds = folds
         self.test = test
         self.flips = flips
         self.num_workers = num_workers
+        self.device = device
+        self.tile_batch_size = tile_batch_size
+        self.tile_overlap = tile_overlap
 
         self.full_image = None
         self.full_mask = None
@@ -213,7 +218,7 @@ class Evaluator:
         data = {}
         data['image'] = torch.Tensor(np.array([mydata]))
 
-        predicted = self.predict_samples_large(model, data)
+        predicted = self.predict_samples_tiled(model, data)
 
         self.process_data(predicted, dsmpath, outdir, outfname)
 
@@ -315,6 +320,21 @@ class Evaluator:
 
         return predicted
 
+    def predict_samples_tiled(self, model, data):
+        """
+        replaces predict_samples_large: tiles are batched and flips are done in
+        the same forward pass. Overlapping tiles are blended with a smooth
+        window instead of copying out the center of each tile, so values near
+        tile seams differ from predict_samples_large
+        """
+        predictor = TiledPredictor(model, tile_size=1024, overlap=self.tile_overlap,
+                                   batch_size=self.tile_batch_size, flips=self.flips,
+                                   device=self.device)
+        predicted = np.stack([predictor.predict(image) for image in data['image']])
+        print('Segmentation throughput on {}: {:.3f} MP/s'.format(predictor.device,
+                                                                  predictor.throughput))
+        return predicted
+
     def get_data(self, data):
         """
         transform data to viewable representation
@@ -0,0 +1,183 @@
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+import time
+
+import numpy as np
+import torch
+
+
+class flip:
+    """
+    flip types for TTA, same values as in eval.py and seval.py
+    """
+    FLIP_NONE = 0
+    FLIP_LR = 1
+    FLIP_FULL = 2
+
+
+def tile_origins(length, tile_size, overlap):
+    """
+    start offsets of tiles of size tile_size covering [0, length) with at
+    least overlap pixels shared between neighbours; the last tile is
+    aligned to the end of the image
+    """
+    if length <= tile_size:
+        return [0]
+    stride = tile_size - overlap
+    if stride <= 0:
+        raise ValueError('overlap ({}) must be smaller than the tile size ({})'
+                         .format(overlap, tile_size))
+    origins = list(range(0, length - tile_size, stride))
+    origins.append(length - tile_size)
+    return origins
+
+
+def blend_window(tile_size, kind='cosine', sigma=0.25):
+    """
+    2D weight used to blend overlapping tile predictions. The weights never
+    reach zero so pixels covered by a single tile keep their prediction.
+    """
+    pos = (np.arange(tile_size, dtype=np.float64) + 0.5) / tile_size
+    if kind == 'cosine':
+        w = 0.5 - 0.5 * np.cos(2 * np.pi * pos)
+    elif kind == 'gaussian':
+        w = np.exp(-0.5 * ((pos - 0.5) / sigma) ** 2)
+    elif kind == 'none':
+        w = np.ones(tile_size)
+    else:
+        raise ValueError('Unknown blend window: {}'.format(kind))
+    w = np.maximum(w, 1e-3)
+    return np.outer(w, w).astype(np.float32)
+
+
+def _reverse(batch, dim):
+    index = torch.arange(batch.size(dim) - 1, -1, -1, device=batch.device).long()
+    return batch.index_select(dim, index)
+
+
+def tta_variants(flips):
+    """
+    list of (flip_lr, flip_ud) pairs applied for the given flip type
+    """
+    variants = [(False, False)]
+    if flips > flip.FLIP_NONE:
+        variants.append((True, False))
+        if flips > flip.FLIP_LR:
+            variants.extend([(False, True), (True, True)])
+    return variants
+
+
+def _apply_flip(batch, lr, ud):
+    if lr:
+        batch = _reverse(batch, 3)
+    if ud:
+        batch = _reverse(batch, 2)
+    return batch
+
+
+def tta_forward(model, batch, flips=flip.FLIP_NONE):
+    """
+    run all flip variants of batch through the model in one forward pass;
+    logits are un-flipped and averaged before the sigmoid, as in predict()
+    """
+    variants = tta_variants(flips)
+    n = batch.size(0)
+    stacked = torch.cat([_apply_flip(batch, lr, ud) for lr, ud in variants], 0)
+    out = model(stacked)
+    if isinstance(out, tuple):
+        out = out[0]
+    logits = [_apply_flip(out[i * n:(i + 1) * n], lr, ud)
+              for i, (lr, ud) in enumerate(variants)]
+    return torch.sigmoid(torch.mean(torch.stack(logits, 0), 0))
+
+
+class TiledPredictor:
+    """
+    sliding-window inference for images larger than the network input.
+    Tiles are batched together with their flip variants, and overlapping
+    predictions are blended with a smooth window into a preallocated output.
+    """
+    def __init__(self, model, tile_size=1024, overlap=128, batch_size=4,
+                 flips=flip.FLIP_NONE, device=None, window='cosine'):
+        if device is None:
+            device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        self.device = torch.device(device)
+        self.model = model.to(self.device)
+        self.model.eval()
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.batch_size = batch_size
+        self.flips = flips
+        self.window = blend_window(tile_size, window)
+        self.throughput = None
+
+    def tiles(self, rows, cols):
+        """
+        (row, col) origin of every tile of a rows x cols image
+        """
+        return [(r, c)
+                for r in tile_origins(rows, self.tile_size, self.overlap)
+                for c in tile_origins(cols, self.tile_size, self.overlap)]
+
+    def _pad(self, image):
+        # images smaller than a tile are reflected up to the tile size
+        rows, cols = image.shape[-2:]
+        pad_rows = max(self.tile_size - rows, 0)
+        pad_cols = max(self.tile_size - cols, 0)
+        if pad_rows or pad_cols:
+            mode = 'reflect' if pad_rows < rows and pad_cols < cols else 'edge'
+            image = np.pad(image, ((0, 0), (0, pad_rows), (0, pad_cols)), mode=mode)
+        return image
+
+    def predict(self, image):
+        """
+        image is a (channels, rows, cols) array, returns a
+        (classes, rows, cols) float32 probability map
+        """
+        if isinstance(image, torch.Tensor):
+            image = image.numpy()
+        rows, cols = image.shape[-2:]
+        image = self._pad(image)
+        prows, pcols = image.shape[-2:]
+        size = self.tile_size
+
+        start = time.time()
+        origins = self.tiles(prows, pcols)
+        predicted = None
+        weights = np.zeros((prows, pcols), dtype=np.float32)
+        with torch.no_grad():
+            for b in range(0, len(origins), self.batch_size):
+                chunk = origins[b:b + self.batch_size]
+                batch = np.stack([image[:, r:r + size, c:c + size] for r, c in chunk])
+                batch = torch.from_numpy(np.ascontiguousarray(batch, dtype=np.float32))
+                prob = tta_forward(self.model, batch.to(self.device), self.flips)
+                prob = prob.cpu().numpy()
+                if predicted is None:
+                    predicted = np.zeros((prob.shape[1], prows, pcols), dtype=np.float32)
+                for (r, c), p in zip(chunk, prob):
+                    predicted[:, r:r + size, c:c + size] += p * self.window
+                    weights[r:r + size, c:c + size] += self.window
+        predicted /= weights
+        elapsed = max(time.time() - start, 1e-9)
+        self.throughput = rows * cols / 1e6 / elapsed
+        return predicted[:, :rows, :cols]
+
+
+def benchmark(model, image, devices=('cpu', 'cuda'), **kwargs):
+    """
+    throughput of TiledPredictor in megapixels per second on each available
+    device
+    """
+    results = {}
+    for device in devices:
+        if device.startswith('cuda') and not torch.cuda.is_available():
+            continue
+        predictor = TiledPredictor(model, device=device, **kwargs)
+        predictor.predict(image)
+        results[device] = predictor.throughput
+        print('{}: {:.3f} MP/s'.format(device, predictor.throughput))
+    return results
@@ -274,8 +274,9 @@ class PytorchTrain:
     class for training process and callbacks in right places
     """
     def __init__(self, estimator: Estimator, fold, metrics, callbacks=None,
-                 hard_negative_miner=None):
+                 hard_negative_miner=None, batch_transforms=None):
         self.fold = fold
+        self.batch_transforms = batch_transforms
         self.step = 0
         self.save_every_steps = 20
         self.estimator = estimator
@@ -402,6 +403,8 @@ class PytorchTrain:
         ytrues = data['mask']
 
         if training is True:
+            if self.batch_transforms is not None:
+                images, ytrues = self.batch_transforms(images, ytrues)
             meter, ypreds = self.estimator.make_step_itersize(images, ytrues, training,
                                                               self.metrics)
         else:
@@ -436,7 +439,7 @@ class PytorchTrain:
 
 
 def train(ds, folds, config, num_workers=0, transforms=None, skip_folds=None,
-          num_channels_changed=False):
+          num_channels_changed=False, batch_transforms=None):
     """
     here we construct all needed structures and specify parameters
     """
@@ -481,7 +484,8 @@ def train(ds, folds, config, num_workers=0, transforms=None, skip_folds=None,
                                fold=fold,
                                metrics=metrics,
                                callbacks=callbacks,
-                               hard_negative_miner=None)
+                               hard_negative_miner=None,
+                               batch_transforms=batch_transforms)
 
         train_loader = PytorchDataLoader(TrainDataset(ds, train_idx, config, transforms=transforms),
                                          batch_size=config.batch_size,
@@ -500,7 +504,7 @@ def train(ds, folds, config, num_workers=0, transforms=None, skip_folds=None,
 
 
 def onetrain(trainds, valds, ntrain, nval, config, num_workers=0, transforms=None,
-             num_channels_changed=False):
+             num_channels_changed=False, batch_transforms=None):
     """
     here we construct all needed structures and specify parameters
     """
@@ -542,7 +546,8 @@ def onetrain(trainds, valds, ntrain, nval, config, num_workers=0, transforms=Non
                            fold=-1,
                            metrics=metrics,
                            callbacks=callbacks,
-                           hard_negative_miner=None)
+                           hard_negative_miner=None,
+                           batch_transforms=batch_transforms)
 
     train_loader = PytorchDataLoader(TrainDataset(trainds, train_idx, config,
                                      transforms=transforms),
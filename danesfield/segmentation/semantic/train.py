@@ -7,8 +7,10 @@
 import os
 
 from tasks.transforms import augment_flips_color
+from tasks.batch_transforms import batch_augment_flips_color
 
 from dataset.image_provider import ImageProvider
+from dataset.memmap_provider import MemmapImageProvider
 from dataset.threeband_image import ThreebandImageType
 from dataset.multiband_image import MultibandImageType
 from utils.utils import get_folds, update_config
@@ -21,6 +23,13 @@ from utils.config import Config
 parser = argparse.ArgumentParser()
 parser.add_argument('config_path')
 parser.add_argument('train_data_path')
+parser.add_argument('--cache_dir', help='decode images once into memory-mapped .npy files '
+                    'stored in this directory and share them between loader workers')
+parser.add_argument('--batch_augment_seed', type=int,
+                    help='augment whole training batches with this seed instead of '
+                    'augmenting each sample in the loader workers')
+parser.add_argument('--batch_crop', type=int, nargs=2, metavar=('ROWS', 'COLS'),
+                    help='random crop of the batch augmentation')
 args = parser.parse_args()
 
 with open(args.config_path, 'r') as f:
@@ -44,6 +53,14 @@ paths = {k: os.path.join(config.dataset_path, v) for k, v in paths.items()}
 valpaths = {k: os.path.join(config.dataset_path, v).replace(
     'DaytonJacksonville', '4AOIs') for k, v in paths.items()}
 
+if args.batch_augment_seed is not None:
+    transforms = None
+    batch_transforms = batch_augment_flips_color(seed=args.batch_augment_seed,
+                                                 crop=args.batch_crop)
+else:
+    transforms = augment_flips_color
+    batch_transforms = None
+
 
 def single_train(config):
     print('paths: {}'.format(paths))
@@ -65,9 +82,13 @@ def single_train(config):
     # 2nd stage: train on RGB+ndsm+ndvi.
     trainds = ImageProvider(MultibandImageType, paths, image_suffix='.png')
     valds = ImageProvider(MultibandImageType, valpaths, image_suffix='.png')
+    if args.cache_dir:
+        trainds = MemmapImageProvider(trainds, os.path.join(args.cache_dir, 'train'))
+        valds = MemmapImageProvider(valds, os.path.join(args.cache_dir, 'val'))
     config = update_config(config, num_channels=5, nb_epoch=num_epochs)
     onetrain(trainds, valds, ntrain, nval, config,
-             num_workers=num_workers, transforms=augment_flips_color)
+             num_workers=num_workers, transforms=transforms,
+             batch_transforms=batch_transforms)
     # onetrain(trainds, valds, ntrain, nval, config,
     #          num_workers=num_workers, transforms=augment_flips_color,
     #          num_channels_changed=True)
@@ -76,7 +97,8 @@ def single_train(config):
     config = update_config(config, loss=config.loss +
                            '_w', nb_epoch=num_epochs + num_epochs)
     onetrain(trainds, valds, ntrain, nval, config,
-             num_workers=num_workers, transforms=augment_flips_color)
+             num_workers=num_workers, transforms=transforms,
+             batch_transforms=batch_transforms)
 
 
 def multifold_cross_train(config):
@@ -91,19 +113,22 @@ def multifold_cross_train(config):
     folds = get_folds(ds, 5)
     config = update_config(config, num_channels=3, nb_epoch=5)
     train(ds, folds, config, num_workers=num_workers,
-          transforms=augment_flips_color)
+          transforms=transforms, batch_transforms=batch_transforms)
 
     # 2nd stage: train on RGB+ndsm+ndvi.
     config = update_config(config, num_channels=5, nb_epoch=num_epochs)
     ds = ImageProvider(MultibandImageType, paths, image_suffix='.png')
+    if args.cache_dir:
+        ds = MemmapImageProvider(ds, args.cache_dir)
     train(ds, folds, config, num_workers=num_workers,
-          transforms=augment_flips_color, num_channels_changed=True)
+          transforms=transforms, num_channels_changed=True,
+          batch_transforms=batch_transforms)
 
     # 3rd stage: change the loss function.
     config = update_config(config, loss=config.loss +
                            '_w', nb_epoch=num_epochs + num_epochs)
     train(ds, folds, config, num_workers=num_workers,
-          transforms=augment_flips_color)
+          transforms=transforms, batch_transforms=batch_transforms)
 
 
 if __name__ == "__main__":
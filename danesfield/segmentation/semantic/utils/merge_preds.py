@@ -140,3 +140,72 @@ def all_dice(pred_path, gt_path):
         print(im, d)
         all_d.append(d)
     print(np.mean(all_d))
+
+
+class WindowMerger:
+    """
+    accumulates tile predictions, given with their (xoff, yoff, xsize, ysize)
+    window, into a tiled GeoTIFF. Running sums and counts live in a scratch
+    raster next to the output, so only one tile is held in memory at a time.
+    """
+    def __init__(self, out_path, ref_path, block_size=256, nodata=-1.0):
+        ref = gdal.Open(ref_path, gdal.GA_ReadOnly)
+        self.cols = ref.RasterXSize
+        self.rows = ref.RasterYSize
+        self.out_path = out_path
+        self.acc_path = out_path + '.acc.tif'
+        self.block_size = block_size
+        self.nodata = nodata
+
+        options = ['TILED=YES', 'BLOCKXSIZE={}'.format(block_size),
+                   'BLOCKYSIZE={}'.format(block_size)]
+        driver = gdal.GetDriverByName('GTiff')
+        self.out = driver.Create(out_path, self.cols, self.rows, 1, gdal.GDT_Float32,
+                                 options=options + ['COMPRESS=DEFLATE'])
+        self.out.SetGeoTransform(ref.GetGeoTransform())
+        self.out.SetProjection(ref.GetProjection())
+        self.out.GetRasterBand(1).SetNoDataValue(nodata)
+        # band 1 holds the running sum, band 2 the number of predictions
+        self.acc = driver.Create(self.acc_path, self.cols, self.rows, 2, gdal.GDT_Float32,
+                                 options=options)
+        ref = None
+
+    def add(self, window, prediction):
+        xoff, yoff, xsize, ysize = window
+        prediction = np.asarray(prediction, dtype=np.float32).reshape(ysize, xsize)
+        total = self.acc.GetRasterBand(1)
+        count = self.acc.GetRasterBand(2)
+        total.WriteArray(total.ReadAsArray(xoff, yoff, xsize, ysize) + prediction, xoff, yoff)
+        count.WriteArray(count.ReadAsArray(xoff, yoff, xsize, ysize) + 1, xoff, yoff)
+
+    def close(self):
+        """
+        write sum / count block by block and remove the scratch raster
+        """
+        total = self.acc.GetRasterBand(1)
+        count = self.acc.GetRasterBand(2)
+        outband = self.out.GetRasterBand(1)
+        for yoff in range(0, self.rows, self.block_size):
+            ysize = min(self.block_size, self.rows - yoff)
+            for xoff in range(0, self.cols, self.block_size):
+                xsize = min(self.block_size, self.cols - xoff)
+                s = total.ReadAsArray(xoff, yoff, xsize, ysize)
+                n = count.ReadAsArray(xoff, yoff, xsize, ysize)
+                block = np.full(s.shape, self.nodata, dtype=np.float32)
+                np.divide(s, n, out=block, where=n > 0)
+                outband.WriteArray(block, xoff, yoff)
+        self.out.FlushCache()
+        self.out = None
+        self.acc = None
+        gdal.GetDriverByName('GTiff').Delete(self.acc_path)
+
+
+def merge_windows(out_path, ref_path, predictions, block_size=256):
+    """
+    merge an iterable of (window, prediction) pairs, e.g. predictions made
+    on the windows of split2tiles.tile_windows, into out_path
+    """
+    merger = WindowMerger(out_path, ref_path, block_size=block_size)
+    for window, prediction in predictions:
+        merger.add(window, prediction)
+    merger.close()
@@ -7,11 +7,17 @@
 import numpy as np
 import sys
 import os
-from osgeo import gdal
-from osgeo import osr
-from fractions import gcd
-from rasterio.enums import ColorInterp
+from math import gcd
 from scipy.ndimage import measurements
+try:
+    from osgeo import gdal
+    from osgeo import osr
+except ImportError:
+    gdal = None
+try:
+    from rasterio.enums import ColorInterp
+except ImportError:
+    ColorInterp = None
 
 
 def get_extent(dataset):
@@ -106,7 +112,7 @@ def split(file_name, nbands, stype, tagname, sqwidth=2048):
     if not os.path.exists(output_path):
         os.makedirs(output_path)
 
-    print("GCD, " + str(gcd(round(width, 0), round(height, 0))))
+    print("GCD, " + str(gcd(int(round(width)), int(round(height)))))
     print("Width, " + str(width))
     print("height, " + str(height))
 
@@ -128,45 +134,14 @@ def split(file_name, nbands, stype, tagname, sqwidth=2048):
     for tile in tiles:
         print('tile: {}'.format(tile))
 
-        minx = tile[0][0]
-        maxx = tile[1][0]
-        miny = tile[1][1]
-        maxy = tile[0][1]
-
-        # p1 = (minx, maxy)
-        # p2 = (maxx, miny)
-
-        i1 = int((minx - xOrigin) / pixelWidth)
-        j1 = int((yOrigin - maxy) / pixelHeight)
-
-        i2 = int((maxx - xOrigin) / pixelWidth)
-        print('oldx: ' + str(i1) + ', ' + str(i2) + ' -- ' + str(i2-i1))
-        while i2-i1 != sqwidth:
-            if i2-i1 > sqwidth:
-                maxx -= 0.5*pixelWidth
-            else:
-                maxx += 0.5*pixelWidth
-
-            i2 = int((maxx - xOrigin) / pixelWidth)
-            print('nowx: ' + str(i1) + ', ' + str(i2) + ' -- ' + str(i2-i1))
-
-        j2 = int((yOrigin - miny) / pixelHeight)
-        print('oldy: ' + str(j1) + ', ' + str(j2) + ' -- ' + str(j2-j1))
-        while j2-j1 != sqwidth:
-            if j2-j1 > sqwidth:
-                miny += 0.5*pixelHeight
-            else:
-                miny -= 0.5*pixelHeight
-
-            j2 = int((yOrigin - miny) / pixelHeight)
-            print('nowy: ' + str(j1) + ', ' + str(j2) + ' -- ' + str(j2-j1))
+        (i1, j1, new_cols, new_rows), (minx, maxx, miny, maxy) = square_tile_window(
+            tile, transform, sqwidth)
+        i2 = i1 + new_cols
+        j2 = j1 + new_rows
 
         print(str(i1) + ', ' + str(i2) + ' -- ' + str(i2-i1))
         print(str(j1) + ', ' + str(j2) + ' -- ' + str(j2-j1))
 
-        new_cols = i2-i1
-        new_rows = j2-j1
-
         mydata = []
         for i in range(nbands):
             mydata.append(bands[i].ReadAsArray(i1, j1, new_cols, new_rows))
@@ -248,5 +223,132 @@ def split(file_name, nbands, stype, tagname, sqwidth=2048):
     dataset = None
 
 
+def square_tile_window(tile, transform, sqwidth):
+    """
+    pixel window (xoff, yoff, xsize, ysize) of a create_square_tiles tile in
+    the raster with the given geotransform, and the tile bounds
+    (minx, maxx, miny, maxy) moved by half pixels until the window is
+    sqwidth pixels wide and high, as split() does
+    """
+    xOrigin = transform[0]
+    yOrigin = transform[3]
+    pixelWidth = transform[1]
+    pixelHeight = -transform[5]
+
+    minx = tile[0][0]
+    maxx = tile[1][0]
+    miny = tile[1][1]
+    maxy = tile[0][1]
+
+    i1 = int((minx - xOrigin) / pixelWidth)
+    j1 = int((yOrigin - maxy) / pixelHeight)
+
+    i2 = int((maxx - xOrigin) / pixelWidth)
+    while i2-i1 != sqwidth:
+        if i2-i1 > sqwidth:
+            maxx -= 0.5*pixelWidth
+        else:
+            maxx += 0.5*pixelWidth
+        i2 = int((maxx - xOrigin) / pixelWidth)
+
+    j2 = int((yOrigin - miny) / pixelHeight)
+    while j2-j1 != sqwidth:
+        if j2-j1 > sqwidth:
+            miny += 0.5*pixelHeight
+        else:
+            miny -= 0.5*pixelHeight
+        j2 = int((yOrigin - miny) / pixelHeight)
+
+    return (i1, j1, i2-i1, j2-j1), (minx, maxx, miny, maxy)
+
+
+def _cover_starts(starts, length, sqwidth):
+    # starts plus the tile starts needed to cover the pixels they miss
+    covered = []
+    end = 0
+    for start in sorted(set(starts)) + [length]:
+        while end < start:
+            covered.append(min(end, max(length - sqwidth, 0)))
+            end = covered[-1] + sqwidth
+        if start < length:
+            covered.append(start)
+            end = max(end, start + sqwidth)
+    return sorted(set(covered))
+
+
+def square_tile_windows(transform, cols, rows, sqwidth=2048, cover=False):
+    """
+    (xoff, yoff, xsize, ysize) of the tiles split() writes for a cols x rows
+    raster with the given geotransform, in the same order. With cover=True,
+    tiles are added where split() leaves pixels out (the margins and any
+    gap); those tiles overlap their neighbours.
+    """
+    minx = transform[0]
+    maxx = transform[0] + cols * transform[1] + rows * transform[2]
+    miny = transform[3] + cols * transform[4] + rows * transform[5]
+    maxy = transform[3]
+    txlen = sqwidth*transform[1]
+    tylen = -sqwidth*transform[5]
+
+    tiles = create_square_tiles(minx, miny, maxx, maxy, txlen, tylen)
+    windows = [square_tile_window(tile, transform, sqwidth)[0] for tile in tiles]
+    if not cover:
+        return windows
+
+    xoffs = _cover_starts([w[0] for w in windows], cols, sqwidth)
+    yoffs = _cover_starts([w[1] for w in windows], rows, sqwidth)
+    return [(xoff, yoff, min(sqwidth, cols - xoff), min(sqwidth, rows - yoff))
+            for yoff in yoffs for xoff in xoffs]
+
+
+def tile_windows(file_name, sqwidth=2048, cover=False):
+    """
+    square_tile_windows of an image file, without reading or writing any
+    pixels
+    """
+    dataset = gdal.Open(file_name, gdal.GA_ReadOnly)
+    transform = dataset.GetGeoTransform()
+    cols = dataset.RasterXSize
+    rows = dataset.RasterYSize
+    dataset = None
+    return square_tile_windows(transform, cols, rows, sqwidth, cover)
+
+
+def read_window(dataset, window, nbands=None):
+    """
+    read a tile described by a window from an open dataset,
+    as a (rows, cols) or (bands, rows, cols) array
+    """
+    xoff, yoff, xsize, ysize = window
+    if nbands is None:
+        nbands = dataset.RasterCount
+    if nbands == 1:
+        return dataset.GetRasterBand(1).ReadAsArray(xoff, yoff, xsize, ysize)
+    return np.stack([dataset.GetRasterBand(i + 1).ReadAsArray(xoff, yoff, xsize, ysize)
+                     for i in range(nbands)])
+
+
+def split_vrt(file_name, tagname, sqwidth=2048, cover=False, output_dir="data"):
+    """
+    same tiles as split(), written as VRT files that reference windows of
+    the source image instead of copies of its pixels
+    """
+    raw_file_name = os.path.splitext(os.path.basename(file_name))[
+        0].replace("_downsample", "")
+    output_path = os.path.join(output_dir, raw_file_name)
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
+
+    source = os.path.abspath(file_name)
+    outputs = []
+    for tile_num, window in enumerate(tile_windows(file_name, sqwidth, cover)):
+        output_file = os.path.join(output_path,
+                                   "Tile_" + str(tile_num) + '_' + tagname + ".vrt")
+        gdal.Translate(output_file, source, format='VRT', srcWin=list(window))
+        outputs.append((output_file, window))
+
+    return outputs
+
+
 if __name__ == "__main__":
     split(sys.argv[1], int(sys.argv[2]), sys.argv[3], sys.argv[4])
@@ -46,6 +46,33 @@ def bounding_area(index, hull):
             }
 
 
+def min_bounding_area(hull):
+    # bounding_area of every edge of the ordered hull at once: one product
+    # projects the hull on the unit and orthogonal vectors of all E edges,
+    # giving the (E, N, 2) rotated hulls; the first rectangle of minimum
+    # area is returned
+    edge = np.roll(hull, -1, axis=0) - hull
+    length = np.sqrt(edge[:, 0] ** 2 + edge[:, 1] ** 2)
+    unit_p = edge / length[:, None]
+    unit_o = np.stack([-unit_p[:, 1], unit_p[:, 0]], axis=1)
+
+    # np.dot rounds like the per edge projections did
+    dis = np.dot(hull, np.concatenate([unit_p, unit_o]).T)
+    dis = dis.reshape(hull.shape[0], 2, -1).transpose(2, 0, 1)
+    min_dis = dis.min(axis=1)
+    len_dis = dis.max(axis=1) - min_dis
+    area = len_dis[:, 0] * len_dis[:, 1]
+
+    i = np.argmin(area)
+    return {'area': area[i],
+            'length_parallel': len_dis[i, 0],
+            'length_orthogonal': len_dis[i, 1],
+            'rectangle_center': (min_dis[i, 0] + len_dis[i, 0] / 2,
+                                 min_dis[i, 1] + len_dis[i, 1] / 2),
+            'unit_vector': (unit_p[i, 0], unit_p[i, 1]),
+            }
+
+
 def to_xy_coordinates(unit_vector_angle, point):
     # returns converted unit vector coordinates in x, y coordinates
     angle_orthogonal = unit_vector_angle + pi / 2
@@ -117,22 +144,15 @@ def MinimumBoundingBox(points):
     if len(points) <= 2:
         raise ValueError('More than two points required.')
 
-    hull_ordered = [points[index] for index in ConvexHull(points).vertices]
-    hull_ordered.append(hull_ordered[0])
-    hull_ordered = tuple(hull_ordered)
-
-    min_rectangle = bounding_area(0, hull_ordered)
-    for i in range(1, len(hull_ordered)-1):
-        rectangle = bounding_area(i, hull_ordered)
-        if rectangle['area'] < min_rectangle['area']:
-            min_rectangle = rectangle
+    points = np.asarray(points, dtype=np.float64)
+    hull = points[ConvexHull(points).vertices]
+    min_rectangle = min_bounding_area(hull)
 
     min_rectangle['unit_vector_angle'] = atan2(
         min_rectangle['unit_vector'][1], min_rectangle['unit_vector'][0])
     min_rectangle['rectangle_center'] = to_xy_coordinates(
         min_rectangle['unit_vector_angle'], min_rectangle['rectangle_center'])
 
-    # this is ugly but a quick hack and is being changed in the speedup branch
     return BoundingBox(
         area=min_rectangle['area'],
         length_parallel=min_rectangle['length_parallel'],
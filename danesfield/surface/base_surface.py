@@ -11,6 +11,9 @@ import copy
 import numpy as np
 
 from shapely.geometry import Polygon
+from shapely.prepared import prep
+
+from ..obj_io import format_rows
 
 from .poly_functions import (
     check_relation,
@@ -20,6 +23,7 @@ from .poly_functions import (
     get_difference_plane,
     get_height_from_dem,
     get_height_from_lower_surface,
+    polygon_relation,
     rotate_plane,
 )
 
@@ -73,37 +77,65 @@ class Building:
 
     def split_surface(self):
         '''
-        Check planes spatial relationship and split intersected planes
+        Check planes spatial relationship and split intersected planes.
+        Only planes whose bounding boxes overlap are compared, tested at
+        once against the boxes of the original planes. Splitting only
+        shrinks a plane, so the pieces stay inside the box of the plane
+        they came from and the pairs are visited in the same order as
+        before.
         '''
+        polygons = [Polygon(surf.point_cor[:, 0:2]) for surf in self.topsurface]
+        if not polygons:
+            return
+        bounds = np.array([p.bounds for p in polygons])
+        # room for rounding in the intersection points of split planes
+        eps = 1e-9 * (1 + np.max(np.abs(bounds)))
+        bounds[:, :2] -= eps
+        bounds[:, 2:] += eps
+        pieces = [[k] for k in range(len(polygons))]
+        origin = list(range(len(polygons)))
+
         for i in range(0, self.surface_num):
-            for j in range(0, self.surface_num):
-                if i != j:
-                    relationship_flag = check_relation(
-                        self.topsurface[i].point_cor[:, 0:2], self.topsurface[j].point_cor[:, 0:2])
-                    if relationship_flag == 2:
-                        try:
-                            rst = get_difference_plane(
-                                self.topsurface[i].point_cor, self.topsurface[j].point_cor)
-                            if rst[0]:
-                                self.topsurface[j].point_cor = \
-                                    fix_height(self.topsurface[j].point_cor, rst[1])
-                                self.topsurface.append(
-                                    Surface(fix_height(self.topsurface[j].point_cor,
-                                                       rst[2])))
-                                self.surface_num += 1
-                        except Exception as e:
-                            print(e)
+            p1 = polygons[i]
+            prepared = prep(p1) if p1.is_valid else None
+            minx, miny, maxx, maxy = p1.bounds
+            overlap = np.flatnonzero((bounds[:, 0] <= maxx) & (bounds[:, 2] >= minx) &
+                                     (bounds[:, 1] <= maxy) & (bounds[:, 3] >= miny))
+            candidates = sorted(k for o in overlap for k in pieces[o]
+                                if k != i and k < self.surface_num)
+            for j in candidates:
+                relationship_flag = polygon_relation(p1, polygons[j], prepared)
+                if relationship_flag == 2:
+                    try:
+                        rst = get_difference_plane(
+                            self.topsurface[i].point_cor, self.topsurface[j].point_cor)
+                        if rst[0]:
+                            self.topsurface[j].point_cor = \
+                                fix_height(self.topsurface[j].point_cor, rst[1])
+                            polygons[j] = Polygon(self.topsurface[j].point_cor[:, 0:2])
+                            self.topsurface.append(
+                                Surface(fix_height(self.topsurface[j].point_cor,
+                                                   rst[2])))
+                            polygons.append(Polygon(self.topsurface[-1].point_cor[:, 0:2]))
+                            pieces[origin[j]].append(self.surface_num)
+                            origin.append(origin[j])
+                            self.surface_num += 1
+                    except Exception as e:
+                        print(e)
 
     def get_bottomsurface(self, dem_parameter):
         '''
         Get bottom surface for each roof
-        :param dem: DEM object
+        :param dem_parameter: DEM georeference and heights, see get_dem_parameter
         '''
         self.bottomsurface = copy.deepcopy(self.topsurface)
-        for i in range(0, self.surface_num):
-            base_height = get_height_from_dem(self.bottomsurface[i].point_cor,
-                                              dem_parameter)
-            self.bottomsurface[i].point_cor[:, 2] = base_height
+        # one DEM lookup for the footprints of all surfaces
+        if self.surface_num > 0:
+            cor = [self.bottomsurface[i].point_cor for i in range(0, self.surface_num)]
+            base_height = get_height_from_dem(np.concatenate(cor), dem_parameter)
+            split = np.cumsum([len(c) for c in cor])[:-1]
+            for c, height in zip(cor, np.split(base_height, split)):
+                c[:, 2] = height
         for i in range(0, self.surface_num):
             for j in range(0, self.surface_num):
                 if i != j:
@@ -123,8 +155,6 @@ class Building:
         point_flag = 1
 
         for i in range(self.surface_num):
-            topstring = []
-            bottomstring = []
             pn = self.topsurface[i].point_cor.shape[0]
 
             poly_check = self.topsurface[i].point_cor[:, 0:2]
@@ -144,37 +174,21 @@ class Building:
             self.surface_info.append([pn, pn, area])
             self.vertex_num += 2*pn
             self.edge_num += 3*pn
-            top_index = [str(j) for j in range(point_flag, point_flag + pn)]
-            top_string = 'f ' + ' '.join(top_index) + "\n"
-            bottom_index = [str(j) for j in range(point_flag + pn, point_flag + 2*pn)]
-            bottom_string = 'f ' + ' '.join(bottom_index) + "\n"
-            wallstring = []
-            for j in range(pn):
-                if j == pn - 1:
-                    wallstring.append('f ' + ' '.join([
-                        top_index[j], bottom_index[j], bottom_index[0], top_index[0]
-                    ]) + '\n')
-                    self.wall_num += 1
-                else:
-                    wallstring.append('f ' + ' '.join([
-                        top_index[j], bottom_index[j], bottom_index[j + 1], top_index[j + 1]
-                    ]) + '\n')
-                    self.wall_num += 1
+            top_index = np.arange(point_flag, point_flag + pn)
+            bottom_index = top_index + pn
+            # wall j joins top and bottom edges j -> j + 1, the last one closes the ring
+            wall_index = np.stack([top_index, bottom_index,
+                                   np.roll(bottom_index, -1), np.roll(top_index, -1)], axis=1)
+            self.wall_num += pn
             point_flag = point_flag + 2*pn
-            for v in self.topsurface[i].point_cor:
-                v = v - offset
-                tl = v.tolist()
-                tl = [str(t) for t in tl]
-                topstring.append('v ' + ' '.join(tl) + '\n')
-            for v in self.bottomsurface[i].point_cor:
-                v = v - offset
-                tl = v.tolist()
-                tl = [str(t) for t in tl]
-                bottomstring.append('v ' + ' '.join(tl) + '\n')
-
-            s = "o Mesh" + str(i) + "\ng Mesh" + str(i) + "\n" +\
-                ''.join(topstring) + ''.join(bottomstring) + top_string + bottom_string + \
-                ''.join(wallstring)
+
+            s = "o Mesh" + str(i) + "\ng Mesh" + str(i) + "\n" + \
+                format_rows('v', np.asarray(self.topsurface[i].point_cor - offset,
+                                            dtype=np.float64)) + \
+                format_rows('v', np.asarray(self.bottomsurface[i].point_cor - offset,
+                                            dtype=np.float64)) + \
+                format_rows('f', top_index) + format_rows('f', bottom_index) + \
+                format_rows('f', wall_index)
             objs.append(s)
 
         return objs
@@ -186,18 +200,11 @@ class Building:
         objs = []
         point_flag = 1
         for i in range(self.surface_num):
-            topstring = []
             pn = self.topsurface[i].point_cor.shape[0]
-            top_index = [str(j) for j in range(point_flag, point_flag + pn)]
-            top_string = 'f ' + ' '.join(top_index) + "\n"
+            top_index = np.arange(point_flag, point_flag + pn)
             point_flag = point_flag + pn
-            for v in self.topsurface[i].point_cor:
-                v = v - offset
-                tl = v.tolist()
-                tl = [str(t) for t in tl]
-                topstring.append('v ' + ' '.join(tl) + '\n')
-
-            s = ''.join(topstring) + top_string
+            s = format_rows('v', np.asarray(self.topsurface[i].point_cor - offset,
+                                            dtype=np.float64)) + format_rows('f', top_index)
             objs.append(s)
 
         return objs
@@ -8,7 +8,9 @@
 
 
 import copy
+import numpy as np
 
+from ..obj_io import format_rows
 from .poly_functions import get_height_from_dem, list_intersect
 from .base_surface import Building
 
@@ -46,12 +48,6 @@ class Curved_building(Building):
         objs = []
         point_flag = 0
         for i in range(0, self.body_num):
-            curved_surface_index = []
-            curved_surface_index_str = []
-            curved_surface_cor_str = []
-            bottom_surface_index = []
-            bottom_surface_index_str = []
-            bottom_surface_cor_str = []
             intersect_line = []
             wall_str = []
 
@@ -59,25 +55,16 @@ class Curved_building(Building):
             # surface info: vertex num, edge num, area
             self.surface_info.append([pn * 2, pn * 3, 0])
 
-            for v in self.top_curved_surface[i]:
-                v = v - offset
-                tl = v.tolist()
-                tl = [str(t) for t in tl]
-                curved_surface_cor_str.append('v ' + ' '.join(tl) + '\n')
-
-            for v in self.bottom_curved_surface[i]:
-                v = v - offset
-                tl = v.tolist()
-                tl = [str(t) for t in tl]
-                bottom_surface_cor_str.append('v ' + ' '.join(tl) + '\n')
-
-            for l in self.top_curved_surface_index[i]:
-                curved_surface_index.append([si + point_flag for si in l.tolist()])
-                bottom_surface_index.append([si + point_flag + pn for si in l.tolist()])
-                curved_surface_index_str.append(
-                    'f ' + ' '.join([str(si + point_flag) for si in l.tolist()]) + "\n")
-                bottom_surface_index_str.append(
-                    'f ' + ' '.join([str(si + point_flag + pn) for si in l.tolist()]) + "\n")
+            curved_surface_cor_str = format_rows(
+                'v', np.asarray(self.top_curved_surface[i] - offset, dtype=np.float64))
+            bottom_surface_cor_str = format_rows(
+                'v', np.asarray(self.bottom_curved_surface[i] - offset, dtype=np.float64))
+
+            top_index = np.asarray(self.top_curved_surface_index[i])
+            curved_surface_index = (top_index + point_flag).tolist()
+            bottom_surface_index = (top_index + point_flag + pn).tolist()
+            curved_surface_index_str = format_rows('f', top_index + point_flag)
+            bottom_surface_index_str = format_rows('f', top_index + point_flag + pn)
 
             for i1 in range(0, self.top_curved_surface_index[i].shape[0]):
                 for i2 in range(i1, self.top_curved_surface_index[i].shape[0]):
@@ -129,9 +116,9 @@ class Curved_building(Building):
                                 'f ' + ' '.join([str(l) for l in temp_wall_index]) + '\n')
             point_flag += pn
 
-            s = "o Mesh" + str(i) + "\ng Mesh" + str(i) + "\n" + ''.join(curved_surface_cor_str) + \
-                ''.join(bottom_surface_cor_str) + ''.join(curved_surface_index_str) + \
-                ''.join(bottom_surface_index_str) + ''.join(wall_str)
+            s = "o Mesh" + str(i) + "\ng Mesh" + str(i) + "\n" + curved_surface_cor_str + \
+                bottom_surface_cor_str + curved_surface_index_str + \
+                bottom_surface_index_str + ''.join(wall_str)
             objs.append(s)
 
         return objs
@@ -140,25 +127,15 @@ class Curved_building(Building):
         objs = []
         point_flag = 0
         for i in range(0, self.body_num):
-            curved_surface_index_str = []
-            curved_surface_cor_str = []
-
             pn = self.top_curved_surface[i].shape[0]
-
-            for v in self.top_curved_surface[i]:
-                v = v - offset
-                tl = v.tolist()
-                tl = [str(t) for t in tl]
-                curved_surface_cor_str.append('v ' + ' '.join(tl) + '\n')
-
-            for l in self.top_curved_surface_index[i]:
-                curved_surface_index_str.append(
-                    'f ' + ' '.join([str(si) for si in l.tolist()]) + "\n")
+            curved_surface_cor_str = format_rows(
+                'v', np.asarray(self.top_curved_surface[i] - offset, dtype=np.float64))
+            curved_surface_index_str = format_rows('f', self.top_curved_surface_index[i])
 
             point_flag += pn
 
-            s = "o Mesh" + str(i) + "\ng Mesh" + str(i) + "\n" + ''.join(curved_surface_cor_str) + \
-                ''.join(curved_surface_index_str)
+            s = "o Mesh" + str(i) + "\ng Mesh" + str(i) + "\n" + curved_surface_cor_str + \
+                curved_surface_index_str
             objs.append(s)
 
         return objs
@@ -15,7 +15,7 @@ import json as js
 import numpy as np
 from osgeo import gdal
 from pathlib import Path
-from .scene import Model
+from .scene import Model, get_dem_parameter
 from .MinimumBoundingBox import MinimumBoundingBox as mbr
 from .geon_functions import (
     add_box_geon,
@@ -90,6 +90,7 @@ class Geon(Model):
         :return:
         '''
         self.dem = gdal.Open(dem_path)
+        dem_parameter = get_dem_parameter(self.dem)
         self.ply_path = ply_path
         self.offset_flag = offset
         self.geonjson_path = ply_path + "_json"
@@ -114,7 +115,7 @@ class Geon(Model):
         for i in range(self.building_num):
             process = ''.join(['Now processing intersected surfaces: ' + str(i) + '\r'])
             sys.stdout.write(process)
-            self.buildings[i].get_bottomsurface(self.dem)
+            self.buildings[i].get_bottomsurface(dem_parameter)
             self.buildings[i].get_flatsurface()
         sys.stdout.write('Generating bottom surfaces finished!\n')
 
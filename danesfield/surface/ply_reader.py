@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+'''
+PLY reader for building meshes. The header is parsed once, then every
+element is loaded as whole arrays: numpy.frombuffer for binary files and
+one token array for ASCII files. Faces come back as a flat vertex index
+array plus offsets, so meshes of any size load without a per face
+interpreter loop whenever all faces have the same vertex count.
+'''
+
+import struct
+
+import numpy as np
+
+PLY_TYPES = {
+    'char': 'i1', 'int8': 'i1', 'uchar': 'u1', 'uint8': 'u1',
+    'short': 'i2', 'int16': 'i2', 'ushort': 'u2', 'uint16': 'u2',
+    'int': 'i4', 'int32': 'i4', 'uint': 'u4', 'uint32': 'u4',
+    'float': 'f4', 'float32': 'f4', 'double': 'f8', 'float64': 'f8',
+}
+STRUCT_TYPES = {'i1': 'b', 'u1': 'B', 'i2': 'h', 'u2': 'H',
+                'i4': 'i', 'u4': 'I', 'f4': 'f', 'f8': 'd'}
+
+
+def read_header(f):
+    '''
+    Format and elements of a PLY header.
+    :param f: file opened in binary mode, left at the start of the data
+    :return: format name and a list of (name, count, properties), each
+             property being (name, type) or (name, count type, item type)
+    '''
+    if f.readline().strip() != b'ply':
+        raise ValueError('Not a PLY file')
+    fmt = None
+    elements = []
+    while True:
+        line = f.readline()
+        if not line:
+            raise ValueError('PLY header without end_header')
+        words = line.decode('ascii', 'replace').split()
+        if not words:
+            continue
+        if words[0] == 'format':
+            fmt = words[1]
+        elif words[0] == 'element':
+            elements.append((words[1], int(words[2]), []))
+        elif words[0] == 'property':
+            if words[1] == 'list':
+                elements[-1][2].append((words[4], PLY_TYPES[words[2]], PLY_TYPES[words[3]]))
+            else:
+                elements[-1][2].append((words[2], PLY_TYPES[words[1]]))
+        elif words[0] == 'end_header':
+            return fmt, elements
+
+
+def list_values(items, counts):
+    # flat list items and the offsets of every row in them
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return items, offsets
+
+
+def fixed_row_layout(props, counts):
+    # (property, column, width) of a row whose lists have the given counts
+    layout = []
+    column = 0
+    for prop in props:
+        if len(prop) == 2:
+            layout.append((prop, column, 1))
+            column += 1
+        else:
+            n = counts[prop[0]]
+            layout.append((prop, column, n + 1))
+            column += n + 1
+    return layout, column
+
+
+def read_binary_element(body, pos, count, props, endian):
+    if all(len(prop) == 2 for prop in props):
+        dtype = np.dtype([(prop[0], endian + prop[1]) for prop in props])
+        data = np.frombuffer(body, dtype, count, pos)
+        return {prop[0]: data[prop[0]] for prop in props}, pos + count * dtype.itemsize
+    if count == 0:
+        return {prop[0]: list_values(np.zeros(0, prop[-1]), []) if len(prop) == 3
+                else np.zeros(0, prop[1]) for prop in props}, pos
+
+    # rows laid out like the first one: one structured frombuffer
+    fields = []
+    counts = {}
+    p = pos
+    for prop in props:
+        if len(prop) == 2:
+            fields.append((prop[0], endian + prop[1]))
+            p += np.dtype(prop[1]).itemsize
+        else:
+            n = int(np.frombuffer(body, endian + prop[1], 1, p)[0])
+            counts[prop[0]] = n
+            fields.append((prop[0] + ' count', endian + prop[1]))
+            fields.append((prop[0], endian + prop[2], (n,)))
+            p += np.dtype(prop[1]).itemsize + n * np.dtype(prop[2]).itemsize
+    dtype = np.dtype(fields)
+    if pos + count * dtype.itemsize <= len(body):
+        data = np.frombuffer(body, dtype, count, pos)
+        if all(np.all(data[name + ' count'] == n) for name, n in counts.items()):
+            values = {}
+            for prop in props:
+                if len(prop) == 2:
+                    values[prop[0]] = data[prop[0]]
+                else:
+                    n = counts[prop[0]]
+                    values[prop[0]] = list_values(data[prop[0]].reshape(-1),
+                                                  np.full(count, n, dtype=np.int64))
+            return values, pos + count * dtype.itemsize
+
+    # rows of different lengths, walked one at a time
+    columns = {prop[0]: [] for prop in props}
+    lengths = {prop[0]: [] for prop in props if len(prop) == 3}
+    for _ in range(count):
+        for prop in props:
+            size = np.dtype(prop[1]).itemsize
+            value = struct.unpack_from(endian + STRUCT_TYPES[prop[1]], body, pos)[0]
+            pos += size
+            if len(prop) == 2:
+                columns[prop[0]].append(value)
+            else:
+                columns[prop[0]].append(np.frombuffer(body, endian + prop[2], value, pos))
+                lengths[prop[0]].append(value)
+                pos += value * np.dtype(prop[2]).itemsize
+    values = {}
+    for prop in props:
+        if len(prop) == 2:
+            values[prop[0]] = np.array(columns[prop[0]], dtype=prop[1])
+        else:
+            values[prop[0]] = list_values(
+                np.concatenate(columns[prop[0]]).astype(prop[2]), lengths[prop[0]])
+    return values, pos
+
+
+def read_ascii_element(tokens, pos, count, props, dtype):
+    # dtype overrides the declared type of scalar properties, so text is
+    # converted once, without rounding through the declared type
+    def scalar_type(prop):
+        return dtype if dtype is not None else prop[1]
+
+    if count == 0:
+        return {prop[0]: list_values(np.zeros(0, prop[-1]), []) if len(prop) == 3
+                else np.zeros(0, prop[1]) for prop in props}, pos
+
+    # rows laid out like the first one: one reshape of the tokens
+    counts = {}
+    column = pos
+    for prop in props:
+        if len(prop) == 3:
+            counts[prop[0]] = int(tokens[column])
+            column += counts[prop[0]]
+        column += 1
+    layout, width = fixed_row_layout(props, counts)
+    if pos + count * width <= len(tokens):
+        rows = np.array(tokens[pos:pos + count * width]).reshape(count, width)
+        try:
+            uniform = all(np.all(rows[:, c].astype(np.int64) == counts[prop[0]])
+                          for prop, c, w in layout if len(prop) == 3)
+        except ValueError:
+            # a shorter row shifted a float into a list count column
+            uniform = False
+        if uniform:
+            values = {}
+            for prop, c, w in layout:
+                if len(prop) == 2:
+                    values[prop[0]] = rows[:, c].astype(np.float64).astype(scalar_type(prop))
+                else:
+                    items = rows[:, c + 1:c + w].astype(np.int64 if prop[2][0] in 'iu'
+                                                        else np.float64)
+                    values[prop[0]] = list_values(items.reshape(-1).astype(prop[2]),
+                                                  np.full(count, w - 1, dtype=np.int64))
+            return values, pos + count * width
+
+    # rows of different lengths, walked one at a time
+    columns = {prop[0]: [] for prop in props}
+    lengths = {prop[0]: [] for prop in props if len(prop) == 3}
+    for _ in range(count):
+        for prop in props:
+            if len(prop) == 2:
+                columns[prop[0]].append(tokens[pos])
+                pos += 1
+            else:
+                n = int(tokens[pos])
+                columns[prop[0]].extend(tokens[pos + 1:pos + 1 + n])
+                lengths[prop[0]].append(n)
+                pos += n + 1
+    values = {}
+    for prop in props:
+        if len(prop) == 2:
+            values[prop[0]] = np.array(columns[prop[0]], dtype=np.float64).astype(
+                scalar_type(prop))
+        else:
+            items = np.array(columns[prop[0]], dtype=np.int64 if prop[2][0] in 'iu'
+                             else np.float64)
+            values[prop[0]] = list_values(items.astype(prop[2]), lengths[prop[0]])
+    return values, pos
+
+
+def read_ply_elements(fp, dtype=None):
+    '''
+    All elements of a PLY file.
+    :param fp: PLY file path
+    :param dtype: type for the scalar properties of ASCII files,
+                  default is their declared type
+    :return: dict of element name to a dict of property name to values;
+             list properties are (flat items, offsets) pairs
+    '''
+    with open(fp, 'rb') as f:
+        fmt, elements = read_header(f)
+        body = f.read()
+    values = {}
+    if fmt == 'ascii':
+        tokens = body.split()
+        pos = 0
+        for name, count, props in elements:
+            values[name], pos = read_ascii_element(tokens, pos, count, props, dtype)
+    elif fmt in ('binary_little_endian', 'binary_big_endian'):
+        endian = '<' if fmt == 'binary_little_endian' else '>'
+        pos = 0
+        for name, count, props in elements:
+            values[name], pos = read_binary_element(body, pos, count, props, endian)
+    else:
+        raise ValueError('Unknown PLY format {}'.format(fmt))
+    return values
+
+
+def read_ply(fp, dtype=None):
+    '''
+    Vertices and faces of a PLY file.
+    :param fp: PLY file path
+    :param dtype: type of the returned coordinates, default is the type
+                  declared in the file
+    :return: (N, 3) vertex coordinates, flat face vertex indices and the
+             offsets of each face in them (one more than the face count)
+    '''
+    elements = read_ply_elements(fp, dtype)
+    vertex = elements.get('vertex', {})
+    if 'x' in vertex:
+        cor = np.vstack((vertex['x'], vertex['y'], vertex['z'])).transpose()
+    else:
+        cor = np.zeros((0, 3))
+    if dtype is not None:
+        cor = cor.astype(dtype)
+    face = elements.get('face', {})
+    lists = [value for value in face.values() if isinstance(value, tuple)]
+    if lists:
+        indices, offsets = lists[0]
+    else:
+        indices, offsets = np.zeros(0, dtype=np.int64), np.zeros(1, dtype=np.int64)
+    return cor, indices.astype(np.int64), offsets
+
+
+def face_list(indices, offsets):
+    ''' faces as a list of vertex index arrays '''
+    if len(offsets) < 2:
+        return []
+    return np.split(indices, offsets[1:-1])
@@ -7,10 +7,13 @@
 ###############################################################################
 
 
-import re
 import numpy as np
+import scipy.sparse
+import scipy.sparse.csgraph
+from scipy import ndimage
 from shapely.geometry import Polygon, LineString
 from shapely.ops import polygonize, unary_union
+from .ply_reader import face_list, read_ply
 
 
 def list_intersect(a, b):
@@ -23,32 +26,38 @@ def list_union(a, b):
     return list(set(a) | set(b))
 
 
+def cluster_faces(faces):
+    '''
+    Group faces that are connected through shared vertices.
+    :param faces: face vertex indices, one row per face
+    :return: face indices of each group, groups ordered by their first face
+    '''
+    faces = np.asarray(faces, dtype=np.int64)
+    if len(faces) == 0:
+        return []
+    face_num = faces.shape[0]
+    # faces and vertices as the nodes of one bipartite graph
+    rows = np.repeat(np.arange(face_num), faces.shape[1])
+    cols = face_num + faces.reshape(-1)
+    node_num = face_num + np.max(faces) + 1
+    graph = scipy.sparse.coo_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)),
+                                    shape=(node_num, node_num))
+    _, labels = scipy.sparse.csgraph.connected_components(graph, directed=False)
+    labels = labels[:face_num]
+    _, first, labels = np.unique(labels, return_index=True, return_inverse=True)
+    labels = np.argsort(np.argsort(first))[labels]
+    order = np.argsort(labels, kind='stable')
+    return np.split(order, np.cumsum(np.bincount(labels))[:-1])
+
+
 def ply_parser(fp):
     '''
     :param fp: PLY file path
-    :return: Surface coordinates and surface index
+    :return: Surface coordinates and surface index, every face as a list
+             of strings: vertex count followed by the vertex indices
     '''
-    tf = open(fp)
-    lines = tf.readlines()
-    flag = 0
-    for l in lines:
-        if re.search("\s*element\s*vertex\s*\d*", l) is not None:
-            vertex_num = int(re.findall("\d+\.?\d*", l)[0])
-        if re.search("\s*element\s*face\s*\d*", l) is not None:
-            face_num = int(re.findall("\d+\.?\d*", l)[0])
-        if re.search("end_header", l) is not None:
-            begin_num = flag + 1
-        flag += 1
-
-    x = [float(re.findall("-*\d+\.?\d*", l)[0]) for l in lines[begin_num:begin_num + vertex_num]]
-    y = [float(re.findall("-*\d+\.?\d*", l)[1]) for l in lines[begin_num:begin_num + vertex_num]]
-    z = [float(re.findall("-*\d+\.?\d*", l)[2]) for l in lines[begin_num:begin_num + vertex_num]]
-
-    cor = [[x[i], y[i], z[i]] for i in range(0, len(x))]
-    cor = np.asarray(cor)
-    f = [re.findall("\d+\.?\d*", l)
-         for l in lines[begin_num + vertex_num:begin_num + vertex_num + face_num]]
-
+    cor, indices, offsets = read_ply(fp, dtype=np.float64)
+    f = [[str(len(face))] + [str(i) for i in face] for face in face_list(indices, offsets)]
     return cor, f
 
 
@@ -59,12 +68,18 @@ def check_relation(plane1, plane2):
     :param plane2:
     :return: spatial relationship tag
     '''
-    p1 = Polygon(plane1)
-    p2 = Polygon(plane2)
+    return polygon_relation(Polygon(plane1), Polygon(plane2))
 
+
+def polygon_relation(p1, p2, prepared=None):
+    '''
+    Spatial relationship tag of two shapely polygons, see check_relation.
+    prepared is shapely.prepared.prep(p1), for repeated predicates on p1.
+    '''
+    test = p1 if prepared is None else prepared
     try:
-        if p1.intersects(p2):
-            if p1.contains(p2):
+        if test.intersects(p2):
+            if test.contains(p2):
                 flag = 1
             else:
                 if p1.area >= p2.area:
@@ -78,35 +93,43 @@ def check_relation(plane1, plane2):
         return 4
 
 
+def fill_invalid_heights(data, nodata=None):
+    '''
+    Replace NaN and nodata pixels of a DEM by the nearest valid pixel.
+    :param data: DEM height array
+    :param nodata: nodata value of the DEM band
+    :return: DEM array without invalid pixels
+    '''
+    data = np.asarray(data)
+    invalid = ~np.isfinite(data)
+    if nodata is not None:
+        invalid |= data == nodata
+    if not invalid.any() or invalid.all():
+        return data
+    indices = ndimage.distance_transform_edt(invalid, return_distances=False,
+                                             return_indices=True)
+    return data[tuple(indices)]
+
+
 def get_height_from_dem(cor, dem_parameter):
     '''
-    Get Z coordinate from DEM based on given XY coordinate.
-    r1-r4 represent the image boundaries for coordinates outside.
-    :param cor: XY coordinate
-    :param dem: DEM object
-    :return: Z coordinate
+    Get Z coordinates from DEM for an array of XY coordinates.
+    Coordinates outside the DEM take the height of the nearest border pixel.
+    :param cor: XY coordinates
+    :param dem_parameter: [xOrigin, yOrigin, pixelWidth, pixelHeight, data]
+    :return: Z coordinates
     '''
     xOrigin = dem_parameter[0]
     yOrigin = dem_parameter[1]
     pixelWidth = dem_parameter[2]
     pixelHeight = dem_parameter[3]
     data = dem_parameter[4]
-    r = dem_parameter[5]
-    base_height = []
-    for i in range(cor.shape[0]):
-        x = cor[i, 0]
-        y = cor[i, 1]
-        xOffset = int((x - xOrigin) / pixelWidth)
-        yOffset = int((y - yOrigin) / pixelHeight)
-        try:
-            value = data[yOffset][xOffset]
-            base_height.append(value)
-        except:  # noqa: E722
-            dist_2 = np.sum((r - np.array([yOffset, xOffset])) ** 2, axis=1)
-            index = np.argmin(dist_2)
-            value = data[r[index, 0]][r[index, 1]]
-            base_height.append(value)
-    return np.array(base_height)
+    cor = np.asarray(cor)
+    xOffset = ((cor[:, 0] - xOrigin) / pixelWidth).astype(np.int64)
+    yOffset = ((cor[:, 1] - yOrigin) / pixelHeight).astype(np.int64)
+    xOffset = np.clip(xOffset, 0, data.shape[1] - 1)
+    yOffset = np.clip(yOffset, 0, data.shape[0] - 1)
+    return data[yOffset, xOffset]
 
 
 def get_height_from_lower_surface(plane1, plane2):
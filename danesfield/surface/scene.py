@@ -11,14 +11,93 @@ import os
 import sys
 import time
 import numpy as np
-from osgeo import gdal
 from pathlib import Path
-from plyfile import PlyData
-from .poly_functions import list_intersect, list_union, ply_parser
+from ..obj_io import offset_header
+from .poly_functions import cluster_faces, fill_invalid_heights
+from .ply_reader import face_list, read_ply
 from .base_surface import Building
 from .base_surface import Surface
 from .curve_surface import Curved_building
 
+try:
+    from osgeo import gdal
+except ImportError:
+    gdal = None
+
+
+def get_dem_parameter(dem):
+    '''
+    Georeference and heights of a DEM for get_height_from_dem.
+    Nodata pixels are filled with the nearest valid height once, so
+    every lookup afterwards is a plain array index.
+    :param dem: GDAL dataset of the DEM
+    :return: [xOrigin, yOrigin, pixelWidth, pixelHeight, data]
+    '''
+    transform = dem.GetGeoTransform()
+    band = dem.GetRasterBand(1)
+    data = fill_invalid_heights(band.ReadAsArray(), band.GetNoDataValue())
+    return [transform[0], transform[3], transform[1], transform[5], data]
+
+
+def write_atomic(path, text):
+    '''
+    Write text through a temporary file in the same folder, so path
+    holds either nothing or the complete text.
+    '''
+    tmp_path = '{}.tmp{}'.format(path, os.getpid())
+    try:
+        with open(tmp_path, 'w') as out_file:
+            out_file.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def get_obj_text(building, model_offset):
+    '''
+    OBJ file text of a building, with the offset and counts header
+    '''
+    s = building.get_obj_string(model_offset)
+    header = [offset_header(model_offset),
+              '#top surface num: ' + str(building.surface_num) + '\n',
+              '#bottom surface num: ' + str(building.surface_num) + '\n',
+              '#wall surface num: ' + str(building.wall_num) + '\n',
+              '#edge num: ' + str(building.edge_num) + '\n',
+              '#vertex num: ' + str(building.vertex_num) + '\n']
+    return ''.join(header) + ''.join(s)
+
+
+def get_surface_info(name, building):
+    '''
+    model_log.txt text of the top surfaces of a building
+    '''
+    text = name + '\n'
+    for si in range(0, building.surface_num):
+        text += 'surface #' + str(si) + '\nVertex num: ' +\
+                str(building.surface_info[si][0]) + \
+                '\nEdge num: ' + \
+                str(building.surface_info[si][1]) + \
+                '\nArea: ' + \
+                str(building.surface_info[si][2]) + \
+                '\n'
+    return text
+
+
+def get_model_log(write_time, top, bottom, wall, edge, vertex, surface_info):
+    '''
+    model_log.txt text: write time, surface totals and surface info
+    '''
+    return ''.join(['Write model time:', str(write_time) + 's' + '\n######\n',
+                    'Total top surface num: ', str(top) + '\n',
+                    'Total bottom surface num: ', str(bottom) + '\n',
+                    'Total wall surface num: ', str(wall) + '\n',
+                    'Total surface num: ', str(top + bottom + wall) + '\n',
+                    'Total edge num: ', str(edge) + '\n',
+                    'Total vertex num: ', str(vertex) + '\n######\n',
+                    'Surface info: \n', surface_info + '\n######\n'])
+
 
 class Model(object):
     def __init__(self):
@@ -42,157 +121,65 @@ class Model(object):
         self.offset_flag = True
 
     def get_offset(self, fp):
-        try:
-            plydata = PlyData.read(fp)
-            if plydata['vertex'].count == 0:
-                return
-
-            cor = np.vstack((plydata['vertex']['x'],
-                             plydata['vertex']['y'],
-                             plydata['vertex']['z'])).transpose()
-
-            if self.x_offset is None:
-                self.x_offset = min(cor[:, 0])
-                self.y_offset = min(cor[:, 1])
-                self.z_offset = min(cor[:, 2])
-            else:
-                self.x_offset = min(self.x_offset, min(cor[:, 0]))
-                self.y_offset = min(self.y_offset, min(cor[:, 1]))
-                self.z_offset = min(self.z_offset, min(cor[:, 2]))
-
-        except:  # noqa: E722
-            cor, f = ply_parser(fp)
-
-            for i in range(0, len(f)):
-                for j in range(0, len(f[i])):
-                    f[i][j] = int(f[i][j])
-                del f[i][0]
-
-            for face_index in f:
-                face_cor = cor[face_index]
-                if self.x_offset is None:
-                    self.x_offset = min(face_cor[:, 0])
-                    self.y_offset = min(face_cor[:, 1])
-                    self.z_offset = min(face_cor[:, 2])
-                else:
-                    self.x_offset = min(self.x_offset, min(face_cor[:, 0]))
-                    self.y_offset = min(self.y_offset, min(face_cor[:, 1]))
-                    self.z_offset = min(self.z_offset, min(face_cor[:, 2]))
+        cor, _, _ = read_ply(fp)
+        if cor.shape[0] == 0:
+            return
+
+        if self.x_offset is None:
+            self.x_offset = np.min(cor[:, 0])
+            self.y_offset = np.min(cor[:, 1])
+            self.z_offset = np.min(cor[:, 2])
+        else:
+            self.x_offset = min(self.x_offset, np.min(cor[:, 0]))
+            self.y_offset = min(self.y_offset, np.min(cor[:, 1]))
+            self.z_offset = min(self.z_offset, np.min(cor[:, 2]))
 
     def load_from_ply(self, fp):
         scene_name = Path(fp).with_suffix('').name
 
-        try:
-            plydata = PlyData.read(fp)
-            if plydata['vertex'].count == 0:
-                return Building()
-            cor = np.vstack((plydata['vertex']['x'],
-                             plydata['vertex']['y'],
-                             plydata['vertex']['z'])).transpose()
-            building_model = Building()
-            building_model.scene_name = scene_name
-            face_name = plydata['face'].data.dtype.names[0]
-
-            for face_index in plydata['face'].data[face_name]:
-                face_cor = cor[face_index]
-                building_model.add_topsurface(Surface(face_cor))
-
-            return building_model
-        except:  # noqa: E722
-            cor, f = ply_parser(fp)
-
-            for i in range(0, len(f)):
-                for j in range(0, len(f[i])):
-                    f[i][j] = int(f[i][j])
-                del f[i][0]
+        cor, indices, offsets = read_ply(fp)
+        if cor.shape[0] == 0:
+            return Building()
+        building_model = Building()
+        building_model.scene_name = scene_name
 
-            building_model = Building()
-            building_model.scene_name = scene_name
+        for face_index in face_list(indices, offsets):
+            face_cor = cor[face_index]
+            building_model.add_topsurface(Surface(face_cor))
 
-            for face_index in range(len(f)):
-                face_cor = cor[f[face_index]]
-                building_model.add_topsurface(Surface(face_cor))
-
-            return building_model
+        return building_model
 
     def load_from_curved_ply(self, fp):
         scene_name = Path(fp).with_suffix('').name
-        try:
-            plydata = PlyData.read(fp)
-            if plydata['vertex'].count == 0:
-                return Curved_building()
-
-            cor = np.vstack((plydata['vertex']['x'],
-                             plydata['vertex']['y'],
-                             plydata['vertex']['z'])).transpose()
-
-            building_model = Curved_building()
-            building_model.scene_name = scene_name
-            face_name = plydata['face'].data.dtype.names[0]
-            fi = np.array([face_index for face_index
-                           in plydata['face'].data[face_name]])
-        except:  # noqa: E722
-            cor, f = ply_parser(fp)
-
-            for i in range(0, len(f)):
-                for j in range(0, len(f[i])):
-                    f[i][j] = int(f[i][j])
-                del f[i][0]
-
-            building_model = Curved_building()
-            building_model.scene_name = scene_name
-            fi = np.array(f)
-
-        c_cor = []
-        c_cor_index = []
-        t_fi = fi
-        while (len(t_fi) > 0):
-            t = t_fi[0]
-            del_i = []
-
-            for i in range(0, len(t_fi)):
-                if len(list_intersect(t, t_fi[i])) > 0:
-                    t = list_union(t, t_fi[i])
-                    del_i.append(i)
-            t_fi = np.delete(np.array(t_fi), tuple(del_i), 0)
-            c_cor.append(t)
-
-            si = []
-            for i in range(0, len(fi)):
-                if len(list_intersect(t, fi[i])) > 0:
-                    si.append(i)
-            c_cor_index.append(si)
+        cor, indices, offsets = read_ply(fp)
+        if cor.shape[0] == 0:
+            return Curved_building()
+
+        building_model = Curved_building()
+        building_model.scene_name = scene_name
+        fi = np.array(face_list(indices, offsets))
 
         pn = 0
-        for i in range(0, len(c_cor_index)):
-            si = c_cor_index[i]
+        for si in cluster_faces(fi):
             surface_index = fi[si]
-            triangle_index = []
-            unique_index = np.unique(surface_index).tolist()
-            for index in surface_index:
-                triangle_index.append([unique_index.index(x) + pn + 1
-                                       for x in index])
+            unique_index = np.unique(surface_index)
+            triangle_index = np.searchsorted(unique_index, surface_index) + pn + 1
             pn = np.max(triangle_index)
-            building_model.add_topsurface(cor[unique_index], np.array(triangle_index))
+            building_model.add_topsurface(cor[unique_index], triangle_index)
 
         return building_model
 
+    def load_building(self, fp):
+        '''
+        Load a building PLY, as curved surfaces when its name says so
+        '''
+        if 'curve' in os.path.basename(fp):
+            return self.load_from_curved_ply(fp)
+        return self.load_from_ply(fp)
+
     def initialize(self, ply_path, dem_path, offset=True):
         self.dem = gdal.Open(dem_path)
-        transform = self.dem.GetGeoTransform()
-        xOrigin = transform[0]
-        yOrigin = transform[3]
-        pixelWidth = transform[1]
-        pixelHeight = transform[5]
-        band = self.dem.GetRasterBand(1)
-        data = band.ReadAsArray()
-        r1 = [[0, i] for i in range(data.shape[1])]
-        r2 = [[data.shape[0] - 1, i] for i in range(data.shape[1])]
-        r3 = [[i, 0] for i in range(data.shape[0])]
-        r4 = [[i, data.shape[1] - 1] for i in range(data.shape[0])]
-        r = np.r_[r1, r2, r3, r4]
-        dem_parameter = [xOrigin, yOrigin, pixelWidth, pixelHeight,
-                         data, r]
+        dem_parameter = get_dem_parameter(self.dem)
 
         self.ply_path = ply_path
         self.obj_path = ply_path + "_obj"
@@ -218,11 +205,7 @@ class Model(object):
             process = ''.join(['Now loading the PLY: ' + fp + '\n'])
             sys.stdout.write(process)
             if os.path.splitext(fp)[-1] == '.ply':
-                if 'curve' in fp:
-                    self.buildings.append(
-                        self.load_from_curved_ply(os.path.join(self.ply_path, fp)))
-                else:
-                    self.buildings.append(self.load_from_ply(os.path.join(self.ply_path, fp)))
+                self.buildings.append(self.load_building(os.path.join(self.ply_path, fp)))
                 self.building_num += 1
         sys.stdout.write('Loading PLY finished!         \n')
 
@@ -256,51 +239,20 @@ class Model(object):
 
         for bi in range(0, self.building_num):
             write_path = os.path.join(self.obj_path, self.building_name[bi] + ".obj")
-            out_file = open(write_path, 'w')
-            s = self.buildings[bi].get_obj_string(model_offset)
-            self.surface_info_str += self.building_name[bi] + '\n'
-            for si in range(0, self.buildings[bi].surface_num):
-                self.surface_info_str += 'surface #' + str(si) + '\nVertex num: ' +\
-                                         str(self.buildings[bi].surface_info[si][0]) + \
-                                         '\nEdge num: ' + \
-                                         str(self.buildings[bi].surface_info[si][1]) + \
-                                         '\nArea: ' + \
-                                         str(self.buildings[bi].surface_info[si][2]) + \
-                                         '\n'
-            out_file.write('#x offset: ' + str(model_offset[0]) + '\n')
-            out_file.write('#y offset: ' + str(model_offset[1]) + '\n')
-            out_file.write('#z offset: ' + str(model_offset[2]) + '\n')
-            out_file.write('#top surface num: ' + str(self.buildings[bi].surface_num) + '\n')
+            write_atomic(write_path, get_obj_text(self.buildings[bi], model_offset))
+            self.surface_info_str += get_surface_info(self.building_name[bi],
+                                                      self.buildings[bi])
             self.top_num_total += self.buildings[bi].surface_num
-            out_file.write('#bottom surface num: ' + str(self.buildings[bi].surface_num) + '\n')
             self.bottom_num_total += self.buildings[bi].surface_num
-            out_file.write('#wall surface num: ' + str(self.buildings[bi].wall_num) + '\n')
             self.wall_num_total += self.buildings[bi].wall_num
-            out_file.write('#edge num: ' + str(self.buildings[bi].edge_num) + '\n')
             self.edge_num_total += self.buildings[bi].edge_num
-            out_file.write('#vertex num: ' + str(self.buildings[bi].vertex_num) + '\n')
             self.vertex_num_total += self.buildings[bi].vertex_num
-            out_file.write(''.join(s))
-            del s
-            out_file.close()
         write_model_time = time.time()
         self.surface_num_total = self.top_num_total + self.bottom_num_total + self.wall_num_total
-        log_file.write('Write model time:')
-        log_file.write(str(write_model_time - start_time) + 's' + '\n######\n')
-        log_file.write('Total top surface num: ')
-        log_file.write(str(self.top_num_total) + '\n')
-        log_file.write('Total bottom surface num: ')
-        log_file.write(str(self.bottom_num_total) + '\n')
-        log_file.write('Total wall surface num: ')
-        log_file.write(str(self.wall_num_total) + '\n')
-        log_file.write('Total surface num: ')
-        log_file.write(str(self.surface_num_total) + '\n')
-        log_file.write('Total edge num: ')
-        log_file.write(str(self.edge_num_total) + '\n')
-        log_file.write('Total vertex num: ')
-        log_file.write(str(self.vertex_num_total) + '\n######\n')
-        log_file.write('Surface info: \n')
-        log_file.write(self.surface_info_str + '\n######\n')
+        log_file.write(get_model_log(write_model_time - start_time, self.top_num_total,
+                                     self.bottom_num_total, self.wall_num_total,
+                                     self.edge_num_total, self.vertex_num_total,
+                                     self.surface_info_str))
         log_file.close()
 
     def write_surface(self, offset=True):
@@ -310,8 +262,4 @@ class Model(object):
             model_offset = [self.x_offset, self.y_offset, self.z_offset]
         for bi in range(0, self.building_num):
             write_path = os.path.join(self.surface_path, self.building_name[bi] + ".obj")
-            out_file = open(write_path, 'w')
-            s = self.buildings[bi].get_top_string(model_offset)
-            out_file.write(''.join(s))
-            del s
-            out_file.close()
+            write_atomic(write_path, ''.join(self.buildings[bi].get_top_string(model_offset)))
@@ -0,0 +1,124 @@
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+import random
+
+import numpy
+import pytest
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('cv2')
+from danesfield.segmentation.semantic.dataset.image_cropper import ImageCropper  # noqa: E402
+from danesfield.segmentation.semantic.tasks import batch_transforms  # noqa: E402
+from danesfield.segmentation.semantic.tasks import transforms  # noqa: E402
+
+
+def samples(rng, nb, rows, cols, channels=5):
+    # float images in [0, 1] with 0/255 masks, as read before ToTensor
+    images = [rng.uniform(0, 1, (rows, cols, channels)).astype(numpy.float32)
+              for _ in range(nb)]
+    masks = [(rng.uniform(0, 1, (rows, cols)) > 0.5).astype(numpy.uint8) * 255
+             for _ in range(nb)]
+    return images, masks
+
+
+def to_batch(images, masks):
+    pairs = [transforms.ToTensor()(im, m) for im, m in zip(images, masks)]
+    return (torch.from_numpy(numpy.stack([p[0] for p in pairs])),
+            torch.from_numpy(numpy.stack([p[1] for p in pairs])))
+
+
+def reference(transform, images, masks, selected):
+    # the per-sample transform on the selected samples, then ToTensor
+    out = [transform(im.copy(), m.copy()) if s else (im, m)
+           for im, m, s in zip(images, masks, selected)]
+    return to_batch(*zip(*out))
+
+
+def assert_batches_equal(result, expected):
+    numpy.testing.assert_array_equal(result[0].numpy(), expected[0].numpy())
+    numpy.testing.assert_array_equal(result[1].numpy(), expected[1].numpy())
+
+
+def test_geometric_transforms_match_per_sample(monkeypatch):
+    rng = numpy.random.RandomState(0)
+    images, masks = samples(rng, 6, 9, 9)
+    batch = to_batch(images, masks)
+    selected = torch.tensor([True, False, True, True, False, True])
+    for batch_class, sample_class in [
+            (batch_transforms.BatchHorizontalFlip, transforms.HorizontalFlip),
+            (batch_transforms.BatchVerticalFlip, transforms.VerticalFlip),
+            (batch_transforms.BatchTranspose, transforms.Transpose)]:
+        result = batch_class().apply(*batch, selected)
+        assert_batches_equal(result, reference(sample_class(1.), images, masks, selected))
+
+    turns = torch.tensor([1, 0, 2, 3, 0, 1])
+    expected = []
+    for im, m, k in zip(images, masks, turns.tolist()):
+        monkeypatch.setattr(random, 'randint', lambda a, b: k)
+        expected.append(transforms.RandomRotate90(1.)(im.copy(), m.copy()) if k else (im, m))
+    monkeypatch.undo()
+    result = batch_transforms.BatchRandomRotate90().apply(*batch, turns)
+    assert_batches_equal(result, to_batch(*zip(*expected)))
+
+    images, masks = samples(rng, 4, 13, 11)
+    corners = torch.tensor([0, 6, 3, 1]), torch.tensor([4, 0, 2, 1])
+    cropper = ImageCropper(7, 4, 0)
+    expected = to_batch([cropper.crop_image(im, x, y) for im, x, y in
+                         zip(images, corners[1].tolist(), corners[0].tolist())],
+                        [cropper.crop_image(m, x, y) for m, x, y in
+                         zip(masks, corners[1].tolist(), corners[0].tolist())])
+    result = batch_transforms.BatchRandomCrop(7, 4).apply(*to_batch(images, masks), corners)
+    assert_batches_equal(result, expected)
+
+
+def test_intensity_transforms_match_per_sample(monkeypatch):
+    rng = numpy.random.RandomState(1)
+    images, masks = samples(rng, 4, 10, 12)
+    batch = to_batch(images, masks)
+    alpha = torch.tensor([1.08, 1., 0.93, 0.96], dtype=torch.float64)
+    for batch_class, sample_class in [
+            (batch_transforms.BatchBrightness, transforms.RandomBrightness),
+            (batch_transforms.BatchContrast, transforms.RandomContrast)]:
+        expected = []
+        for im, m, a in zip(images, masks, alpha.tolist()):
+            monkeypatch.setattr(random, 'uniform', lambda lo, hi: (a - 1) / 0.1)
+            expected.append((sample_class(limit=0.1, prob=1.)(im.copy()), m))
+        monkeypatch.undo()
+        expected = to_batch(*zip(*expected))
+        result = batch_class(limit=0.1).apply(*batch, alpha)
+        numpy.testing.assert_allclose(result[0].numpy(), expected[0].numpy(), atol=1e-5)
+        numpy.testing.assert_array_equal(result[0][:, 3:].numpy(), batch[0][:, 3:].numpy())
+        assert result[1] is batch[1]
+
+
+def test_batch_augment_seed():
+    rng = numpy.random.RandomState(2)
+    batches = [to_batch(*samples(rng, 8, 16, 16)) for _ in range(3)]
+
+    def run(seed):
+        augment = batch_transforms.batch_augment_flips_color(seed=seed, crop=(12, 12))
+        return [augment(*b) for b in batches]
+    first, second, other = run(5), run(5), run(6)
+    for a, b in zip(first, second):
+        assert_batches_equal(a, b)
+    assert not all(torch.equal(a[0], c[0]) for a, c in zip(first, other))
+    assert first[0][0].shape == (8, 5, 12, 12) and first[0][1].shape == (8, 1, 12, 12)
+
+
+def test_batch_augment_keeps_mask_aligned():
+    # the mask is a band of the image that no color jitter touches
+    rng = numpy.random.RandomState(3)
+    images, masks = samples(rng, 16, 20, 20)
+    images = [numpy.dstack((im[..., :4], m / 255.)).astype(numpy.float32)
+              for im, m in zip(images, masks)]
+    image, mask = to_batch(images, masks)
+    augment = batch_transforms.batch_augment_flips_color(seed=0, crop=(14, 14))
+    for _ in range(5):
+        result, result_mask = augment(image, mask)
+        numpy.testing.assert_array_equal((result[:, 4:] > 0).float().numpy(),
+                                         result_mask.numpy())
+    assert not torch.equal(result[:, 4:], mask[:, :, :14, :14] * 2 - 1)
@@ -0,0 +1,124 @@
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+import argparse
+import importlib
+import os
+
+import numpy
+import pytest
+
+from danesfield import mesh_raster
+
+TOOLS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools')
+GEO_TRANSFORM = (435000.0, 0.5, 0.0, 3355000.0, 0.0, -0.5)
+
+
+def roofs(rng, rows, cols, cell):
+    # one roof per grid cell: flat L shapes, gables and hips, as polygons
+    vertices = []
+    polygons = []
+    for row in range(rows):
+        for col in range(cols):
+            x0 = GEO_TRANSFORM[0] + col * cell + rng.uniform(1, 3)
+            y0 = GEO_TRANSFORM[3] - (row + 1) * cell + rng.uniform(1, 3)
+            w, d = rng.uniform(0.5, 0.8, 2) * cell
+            z, h = rng.uniform(5, 40), rng.uniform(1, 6)
+            kind = (row * cols + col) % 3
+            if kind == 0:
+                corners = [[0, 0], [w, 0], [w, d / 2], [w / 2, d / 2], [w / 2, d], [0, d]]
+                roof = [numpy.c_[corners, numpy.full(6, z)]]
+            elif kind == 1:
+                roof = [[[0, 0, z], [w, 0, z], [w, d / 2, z + h], [0, d / 2, z + h]],
+                        [[0, d / 2, z + h], [w, d / 2, z + h], [w, d, z], [0, d, z]]]
+            else:
+                a, b = [w / 4, d / 2, z + h], [3 * w / 4, d / 2, z + h]
+                roof = [[[0, 0, z], [w, 0, z], b, a], [[w, d, z], [0, d, z], a, b],
+                        [[0, d, z], [0, 0, z], a], [[w, 0, z], [w, d, z], b]]
+            for polygon in roof:
+                polygons.append(numpy.arange(len(polygon)) + sum(map(len, vertices)))
+                vertices.append(numpy.asarray(polygon, dtype=numpy.float64) + [x0, y0, 0])
+    offsets = numpy.cumsum([0] + [len(p) for p in polygons])
+    return numpy.concatenate(vertices), numpy.concatenate(polygons), offsets
+
+
+def legacy_cells_loop(cells):
+    # cell by cell walk of the legacy layout n, i_1, ..., i_n, n, ...
+    counts = []
+    indices = []
+    position = 0
+    while position < len(cells):
+        counts.append(cells[position])
+        indices.extend(cells[position + 1:position + 1 + cells[position]])
+        position += 1 + cells[position]
+    return numpy.cumsum([0] + counts), numpy.array(indices, dtype=numpy.int64)
+
+
+@pytest.fixture
+def buildings_to_dsm(monkeypatch):
+    monkeypatch.syspath_prepend(TOOLS_DIR)
+    return importlib.import_module('buildings_to_dsm')
+
+
+def test_legacy_cell_offsets(buildings_to_dsm):
+    rng = numpy.random.RandomState(1)
+    for nb_cells in [0, 1, 2, 7, 1000]:
+        counts = rng.randint(1, 9, nb_cells)
+        # point ids as large as the array, so they look like cell sizes too
+        cells = rng.randint(0, 20000, counts.sum() + nb_cells)
+        starts = numpy.cumsum(numpy.r_[0, counts[:-1] + 1])[:nb_cells]
+        cells[starts] = counts
+        offsets, positions = buildings_to_dsm.legacy_cell_offsets(cells)
+        expected_offsets, expected_indices = legacy_cells_loop(cells)
+        numpy.testing.assert_array_equal(offsets, expected_offsets)
+        numpy.testing.assert_array_equal(cells[positions], expected_indices)
+
+
+def test_polydata_mesh(buildings_to_dsm):
+    pytest.importorskip('vtk')
+    vertices, indices, offsets = roofs(numpy.random.RandomState(2), 3, 4, 24.0)
+    result = buildings_to_dsm.polydata_mesh(
+        buildings_to_dsm.mesh_polydata(vertices, indices, offsets))
+    for r, e in zip(result, (vertices, indices, offsets)):
+        numpy.testing.assert_array_equal(r, e)
+
+
+def test_render_vtk_matches_numpy(buildings_to_dsm):
+    pytest.importorskip('vtk')
+    vertices, indices, offsets = roofs(numpy.random.RandomState(0), 6, 8, 24.0)
+    shape = (6 * 48, 8 * 48)
+    dtm = argparse.Namespace(RasterXSize=shape[1], RasterYSize=shape[0])
+    bounds = [GEO_TRANSFORM[0], GEO_TRANSFORM[0] + shape[1] * GEO_TRANSFORM[1],
+              GEO_TRANSFORM[3] + shape[0] * GEO_TRANSFORM[5], GEO_TRANSFORM[3]]
+
+    # the roof heights each pixel may get, whatever the triangulation
+    triangles, polygon = mesh_raster.polygon_triangles(vertices, indices, offsets)
+    z = vertices[:, 2]
+    low = numpy.minimum.reduceat(z[indices], offsets[:-1])[polygon]
+    high = numpy.maximum.reduceat(z[indices], offsets[:-1])[polygon]
+    low = mesh_raster.rasterize_triangles(vertices, triangles, low, GEO_TRANSFORM, shape)[0]
+    high = mesh_raster.rasterize_triangles(vertices, triangles, high, GEO_TRANSFORM, shape)[0]
+
+    for render_cls in [False, True]:
+        args = argparse.Namespace(render_cls=render_cls, render_png=False, debug=False)
+        poly = buildings_to_dsm.mesh_polydata(vertices, indices, offsets)
+        expected = buildings_to_dsm.render_numpy([(vertices, indices, offsets)], [6, 17],
+                                                 render_cls, GEO_TRANSFORM, shape, 128)
+        result = buildings_to_dsm.render_vtk(args, [poly], [6, 17], dtm, bounds)
+        assert result.shape == shape
+
+        # pixel centers on a roof edge may go either way
+        covered = ~numpy.isnan(expected)
+        assert covered.mean() > 0.3
+        assert (numpy.isnan(result) == ~covered).mean() > 0.99
+        both = covered & ~numpy.isnan(result)
+        if render_cls:
+            assert (result[both] == 6).all()
+            continue
+        inside = (result[both] >= low[both] - 1e-3) & (result[both] <= high[both] + 1e-3)
+        assert inside.mean() > 0.99
+        flat = both & (low == high)
+        assert (numpy.abs(result[flat] - expected[flat]) < 1e-3).mean() > 0.99
@@ -0,0 +1,136 @@
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+import numpy
+
+from danesfield import dtm_mesh
+
+GEO_TRANSFORM = (435000.0, 0.5, 0.0, 3355000.0, 0.0, -0.5)
+
+
+def grid_mesh_loop(dtm, geo_transform, downsampled_u, downsampled_v):
+    # per pixel loop of tools/dtm_to_mesh.py that grid_mesh replaced
+    nb_u_samples = len(downsampled_u)
+    nb_v_samples = len(downsampled_v)
+    origin = numpy.array([geo_transform[0], geo_transform[3]])
+    scale = numpy.array([geo_transform[1], geo_transform[5]])
+    x = numpy.tile(downsampled_u, nb_v_samples) * scale[0] + origin[0]
+    y = numpy.repeat(downsampled_v, nb_u_samples) * scale[1] + origin[1]
+    z = dtm.ravel()
+    xyz = numpy.vstack((x, y, z)).T
+    faces = []
+    for j in range(nb_v_samples-1):
+        for i in range(nb_u_samples-1):
+            id0 = j * nb_u_samples + i
+            id1 = id0 + 1
+            id2 = id0 + nb_u_samples
+            id3 = id2 + 1
+            faces.append([id0, id2, id1])
+            faces.append([id2, id3, id1])
+    return xyz, numpy.array(faces).reshape(-1, 3)
+
+
+def test_grid_mesh_matches_loop():
+    rng = numpy.random.RandomState(0)
+    for shape in [(2, 2), (1, 5), (5, 1), (7, 4), (13, 29)]:
+        dtm = rng.uniform(10, 40, shape).astype(numpy.float32)
+        downsampled_u = numpy.linspace(0, 40 * shape[1] - 1, shape[1])
+        downsampled_v = numpy.linspace(0, 40 * shape[0] - 1, shape[0])
+        xyz, faces = dtm_mesh.grid_mesh(dtm, GEO_TRANSFORM, downsampled_u, downsampled_v)
+        expected_xyz, expected_faces = grid_mesh_loop(dtm, GEO_TRANSFORM,
+                                                      downsampled_u, downsampled_v)
+        numpy.testing.assert_array_equal(xyz, expected_xyz)
+        numpy.testing.assert_array_equal(faces, expected_faces)
+
+
+def test_grid_mesh_nodata():
+    rng = numpy.random.RandomState(1)
+    dtm = rng.uniform(10, 40, (9, 11))
+    dtm[2, 3] = -9999
+    dtm[6:, 8:] = -9999
+    dtm[0, 10] = numpy.nan
+    full_xyz, full_faces = dtm_mesh.grid_mesh(numpy.zeros(dtm.shape), GEO_TRANSFORM)
+    xyz, faces = dtm_mesh.grid_mesh(dtm, GEO_TRANSFORM, nodata=-9999)
+
+    valid = (dtm != -9999) & ~numpy.isnan(dtm)
+    assert len(xyz) == valid.sum()
+    numpy.testing.assert_array_equal(xyz[:, :2], full_xyz[valid.ravel(), :2])
+    numpy.testing.assert_array_equal(xyz[:, 2], dtm[valid])
+    # the same triangles as the full grid, less the ones touching nodata
+    index = numpy.flatnonzero(valid)
+    kept = full_faces[valid.ravel()[full_faces].all(axis=1)]
+    numpy.testing.assert_array_equal(index[faces], kept)
+    assert len(kept) == len(full_faces) - 6 - 18 - 1
+
+
+def mesh_errors(heights, vertices, faces):
+    # largest height error over the samples inside each triangle
+    rows = numpy.round((vertices[:, 1] - GEO_TRANSFORM[3]) / GEO_TRANSFORM[5])
+    cols = numpy.round((vertices[:, 0] - GEO_TRANSFORM[0]) / GEO_TRANSFORM[1])
+    points = numpy.stack((rows, cols), axis=1)
+    errors = []
+    for face in faces:
+        corners = points[face]
+        lo = corners.min(axis=0).astype(int)
+        hi = corners.max(axis=0).astype(int)
+        r, c = numpy.mgrid[lo[0]:hi[0] + 1, lo[1]:hi[1] + 1]
+        samples = numpy.stack((r.ravel(), c.ravel()), axis=1)
+        weights = numpy.linalg.solve((corners[1:] - corners[0]).T,
+                                     (samples - corners[0]).T).T
+        weights = numpy.concatenate((1 - weights.sum(axis=1, keepdims=True), weights), axis=1)
+        inside = (weights > -1e-9).all(axis=1)
+        z = heights[r.ravel()[inside], c.ravel()[inside]]
+        errors.append(numpy.abs(z - weights[inside].dot(vertices[face, 2])).max())
+    return numpy.array(errors), points
+
+
+def signed_areas(points, faces):
+    a, b, c = points[faces[:, 0]], points[faces[:, 1]], points[faces[:, 2]]
+    return ((b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0]) -
+            (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1])) / 2
+
+
+def test_simplified_grid_mesh_error_bound():
+    rng = numpy.random.RandomState(2)
+    r, c = numpy.mgrid[0:61, 0:93]
+    heights = 5 * numpy.sin(r / 9.) + 3 * numpy.cos(c / 13.) + rng.normal(0, 0.05, r.shape)
+    full_vertices, full_faces = dtm_mesh.grid_mesh(heights, GEO_TRANSFORM)
+    for max_error in [0, 0.1, 0.5, 2]:
+        vertices, faces = dtm_mesh.simplified_grid_mesh(heights, GEO_TRANSFORM, max_error)
+        errors, points = mesh_errors(heights, vertices, faces)
+        assert errors.max() <= max_error
+        assert numpy.isin(vertices, full_vertices).all()
+
+        # wound like grid_mesh and covering the whole grid without cracks:
+        # only the edges on the grid border belong to a single triangle
+        areas = signed_areas(points, faces)
+        assert (areas < 0).all()
+        assert -areas.sum() == (r.shape[0] - 1) * (r.shape[1] - 1)
+        edges = numpy.sort(faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+        edges, counts = numpy.unique(edges, axis=0, return_counts=True)
+        assert counts.max() == 2
+        border = points[edges[counts == 1]]
+        assert ((border[..., 0] == 0).all(axis=1) | (border[..., 0] == 60).all(axis=1) |
+                (border[..., 1] == 0).all(axis=1) | (border[..., 1] == 92).all(axis=1)).all()
+        if max_error == 0:
+            assert len(faces) == len(full_faces)
+    assert len(faces) * 10 < len(full_faces)
+
+
+def test_simplified_grid_mesh_nodata():
+    rng = numpy.random.RandomState(3)
+    heights = numpy.add.outer(numpy.linspace(0, 10, 40), numpy.linspace(0, 5, 50))
+    heights += rng.normal(0, 0.01, heights.shape)
+    heights[10:14, 20:30] = -9999
+    heights[30, 5] = numpy.nan
+    vertices, faces = dtm_mesh.simplified_grid_mesh(heights, GEO_TRANSFORM, 0.1,
+                                                    nodata=-9999)
+    assert (vertices[:, 2] != -9999).all() and not numpy.isnan(vertices).any()
+    # no triangle covers a missing sample, they would be far from its plane
+    valid = (heights != -9999) & ~numpy.isnan(heights)
+    errors, points = mesh_errors(numpy.where(valid, heights, 1e6), vertices, faces)
+    assert errors.max() <= 0.1
+    assert len(faces) * 5 < 2 * 39 * 49
@@ -0,0 +1,99 @@
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+import importlib
+import os
+
+import numpy
+import pytest
+
+TOOLS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools')
+
+
+@pytest.fixture
+def fitting(monkeypatch):
+    # pool workers import the tool by name, so it goes through sys.path
+    monkeypatch.syspath_prepend(TOOLS_DIR)
+    return importlib.import_module('fitting_curved_plane')
+
+
+def test_building_tasks(fitting):
+    rng = numpy.random.RandomState(0)
+    labels = rng.choice([0, 1, 3, 4], 1000, p=[0.4, 0.05, 0.3, 0.25])
+    points = rng.uniform(-50, 50, (1000, 3)).astype(numpy.float32)
+    geons = rng.randint(0, 4, 1000)
+    tasks = list(fitting.building_tasks(points, labels, geons, seed=10, min_points=100))
+
+    assert len(tasks) == 5
+    for building, (indices, task) in enumerate(tasks):
+        # clusters in label order, their points in input order
+        numpy.testing.assert_array_equal(indices, numpy.flatnonzero(labels == building))
+        if len(indices) < 100:
+            assert task is None
+            continue
+        assert task[0] == building and task[3] == 10 + building
+        numpy.testing.assert_array_equal(task[1], points[indices])
+        numpy.testing.assert_array_equal(task[2], geons[indices])
+    assert [task is None for indices, task in tasks] == [False, True, True, False, False]
+
+
+def geon_models(rng):
+    cylinders = [{'name': 'poly_cylinder', 'building': b, 'model': [
+        rng.uniform(size=3), rng.uniform(size=3), rng.uniform(size=3), rng.uniform(size=3),
+        -5.0, 7.5, -12.0, 11.0, 1500, rng.uniform(size=40)]} for b in [0, 0, 2]]
+    spheres = [{'name': 'sphere', 'building': 1, 'model': [
+        rng.uniform(size=3), 12.5, -3.0, 11.0, 420]}]
+    return cylinders, spheres
+
+
+def test_geon_table_round_trip(fitting, tmp_path):
+    rng = numpy.random.RandomState(1)
+    cylinders, spheres = geon_models(rng)
+    filename = str(tmp_path / 'geons.npz')
+    fitting.write_geon_table(filename, cylinders + spheres)
+    table = numpy.load(filename)
+
+    for name, geons in [('poly_cylinder', cylinders), ('sphere', spheres)]:
+        numpy.testing.assert_array_equal(table[name + '_building'],
+                                         [geon['building'] for geon in geons])
+        for i, field in enumerate(fitting.GEON_COLUMNS[name]):
+            values = [geon['model'][i] for geon in geons]
+            if field == 'mean_diff':
+                values = [numpy.mean(value) for value in values]
+            numpy.testing.assert_array_equal(table[name + '_' + field], values)
+
+    fitting.write_geon_table(filename, cylinders)
+    table = numpy.load(filename)
+    assert table['sphere_center'].shape == (0, 3)
+    assert table['sphere_radius'].shape == (0,)
+    assert table['sphere_building'].shape == (0,)
+
+
+def curved_roofs(rng, nb_buildings, nb_points=3000):
+    # half cylinders of radius 20 along x, one per building
+    points, labels = [], []
+    for building in range(nb_buildings):
+        angle = rng.uniform(0, numpy.pi, nb_points)
+        x = rng.uniform(0, 60, nb_points)
+        roof = numpy.stack((x, 20 * numpy.cos(angle), 20 * numpy.sin(angle)), axis=1)
+        points.append(roof + [200 * building, 0, 10] + rng.normal(0, 0.1, roof.shape))
+        labels.append(numpy.full(nb_points, building))
+    points = numpy.concatenate(points)
+    return points, numpy.concatenate(labels), numpy.full(len(points), 2)
+
+
+def test_fit_buildings_workers(fitting):
+    pytest.importorskip('pcl')
+    points, labels, geons = curved_roofs(numpy.random.RandomState(2), 3)
+    serial = fitting.fit_buildings(points, labels, geons, workers=1, seed=7)
+    pooled = fitting.fit_buildings(points, labels, geons, workers=2, seed=7)
+
+    numpy.testing.assert_array_equal(serial[1], pooled[1])
+    assert len(serial[0]) == len(pooled[0])
+    for a, b in zip(serial[0], pooled[0]):
+        assert (a['name'], a['building']) == (b['name'], b['building'])
+        for x, y in zip(a['model'], b['model']):
+            numpy.testing.assert_array_equal(x, y)
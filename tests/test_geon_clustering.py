@@ -0,0 +1,67 @@
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+import numpy
+import scipy.sparse
+import scipy.sparse.csgraph
+from scipy.spatial import cKDTree
+
+from danesfield.geon_fitting.tensorflow import clustering
+
+
+def buildings(seed=0):
+    # three separated boxes of points with different sizes, plus scattered noise
+    rng = numpy.random.RandomState(seed)
+    boxes = [rng.uniform(0, 10, (800, 3)),
+             rng.uniform(0, 10, (300, 3)) + [50, 0, 0],
+             rng.uniform(0, 10, (1200, 3)) + [0, 50, 0]]
+    noise = rng.uniform(0, 10, (20, 3)) * 30 + [200, 200, 0]
+    points = numpy.concatenate(boxes + [noise])
+    return points[rng.permutation(len(points))].astype(numpy.float32)
+
+
+def test_kdtree_cluster_labels():
+    points = buildings()
+    labels = clustering.euclidean_cluster_labels(points, tolerance=2, min_size=100,
+                                                 use_pcl=False)
+    assert labels.dtype == numpy.int32
+    # largest cluster first, noise unlabelled
+    numpy.testing.assert_array_equal(numpy.bincount(labels[labels >= 0]), [1200, 800, 300])
+    assert numpy.count_nonzero(labels < 0) == 20
+    assert (points[labels == 2, 0] >= 50).all()
+
+    # clusters above max_size are dropped, as pcl does
+    labels = clustering.euclidean_cluster_labels(points, tolerance=2, min_size=100,
+                                                 max_size=1000, use_pcl=False)
+    numpy.testing.assert_array_equal(numpy.bincount(labels[labels >= 0]), [800, 300])
+
+
+def test_cluster_subsets_and_stats():
+    points = buildings()
+    labels = clustering.euclidean_cluster_labels(points, use_pcl=False)
+    subsets = clustering.cluster_subsets(labels)
+    counts, centroids, mins, maxs = clustering.cluster_stats(points, labels)
+    assert len(subsets) == len(counts) == 3
+    for j, indices in enumerate(subsets):
+        numpy.testing.assert_array_equal(indices, numpy.nonzero(labels == j)[0])
+        assert counts[j] == len(indices)
+        numpy.testing.assert_allclose(centroids[j], points[indices].mean(axis=0), rtol=1e-5)
+        numpy.testing.assert_array_equal(mins[j], points[indices].min(axis=0))
+        numpy.testing.assert_array_equal(maxs[j], points[indices].max(axis=0))
+
+
+def test_kdtree_components_chunks():
+    # same components as the whole neighbour graph, whatever the chunk size
+    rng = numpy.random.RandomState(1)
+    points = numpy.concatenate([buildings(1), rng.uniform(0, 300, (2000, 3)) * [1, 1, 0.1]])
+    pairs = cKDTree(points).query_pairs(2, output_type='ndarray')
+    graph = scipy.sparse.coo_matrix((numpy.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])),
+                                    shape=(len(points), len(points)))
+    _, expected = scipy.sparse.csgraph.connected_components(graph, directed=False)
+    assert len(numpy.unique(expected)) > 100
+    for chunk_size in [1, 7, 500, 1 << 14]:
+        components = clustering.kdtree_components(points, 2, chunk_size=chunk_size)
+        numpy.testing.assert_array_equal(components, expected)
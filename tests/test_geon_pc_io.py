@@ -0,0 +1,43 @@
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+import numpy
+
+from danesfield.geon_fitting.tensorflow import utils
+
+
+def labelled_cloud(n=1000, seed=0):
+    rng = numpy.random.RandomState(seed)
+    points = rng.uniform(-1000, 1000, (n, 3)) + [740000., 4400000., 200.]
+    return points, rng.randint(0, 40, n), rng.randint(0, 4, n)
+
+
+def test_binary_matches_text(tmpdir):
+    points, building, geon = labelled_cloud()
+    text_name = str(tmpdir.join('roof_seg.txt'))
+    utils.write_geon_type_pc(text_name, points, building, geon)
+    text = utils.read_geon_type_pc(text_name)
+    for ext in ('npy', 'npz'):
+        name = str(tmpdir.join('roof_seg.' + ext))
+        utils.write_geon_type_pc(name, points, building, geon)
+        binary = utils.read_geon_type_pc(name)
+        for b, t in zip(binary, text):
+            numpy.testing.assert_array_equal(b, t)
+        numpy.testing.assert_array_equal(utils.read_txt_pc(name), points)
+
+
+def test_label_pc(tmpdir):
+    points, _, geon = labelled_cloud(10)
+    name = str(tmpdir.join('remaining.npy'))
+    utils.write_label_pc(name, points, geon)
+    read_points, cluster, label = utils.read_binary_pc(name)
+    numpy.testing.assert_array_equal(read_points, points)
+    numpy.testing.assert_array_equal(label, geon)
+    assert (cluster == -1).all()
+    utils.write_label_pc(str(tmpdir.join('remaining.txt')), points, geon)
+    with open(str(tmpdir.join('remaining.txt'))) as f:
+        lines = f.read().splitlines()
+    assert lines[3] == '{} {} {} {}'.format(points[3, 0], points[3, 1], points[3, 2], geon[3])
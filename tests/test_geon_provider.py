@@ -0,0 +1,96 @@
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+import numpy
+import pytest
+
+pytest.importorskip('h5py')
+from danesfield.geon_fitting.utils import provider  # noqa: E402
+
+
+# Per sample loops the batched augmentations replaced
+
+def rotate_loop(batch_data, rng):
+    rotated_data = numpy.zeros(batch_data.shape, dtype=numpy.float32)
+    for k in range(batch_data.shape[0]):
+        rotation_angle = rng.uniform() * 2 * numpy.pi
+        cosval = numpy.cos(rotation_angle)
+        sinval = numpy.sin(rotation_angle)
+        rotation_matrix = numpy.array([[cosval, 0, sinval],
+                                       [0, 1, 0],
+                                       [-sinval, 0, cosval]])
+        rotated_data[k, ...] = numpy.dot(batch_data[k].reshape((-1, 3)), rotation_matrix)
+    return rotated_data
+
+
+def rotate_perturbation_loop(batch_data, rng, angle_sigma=0.06, angle_clip=0.18):
+    rotated_data = numpy.zeros(batch_data.shape, dtype=numpy.float32)
+    for k in range(batch_data.shape[0]):
+        angles = numpy.clip(angle_sigma*rng.randn(3), -angle_clip, angle_clip)
+        c, s = numpy.cos(angles), numpy.sin(angles)
+        Rx = numpy.array([[1, 0, 0], [0, c[0], -s[0]], [0, s[0], c[0]]])
+        Ry = numpy.array([[c[1], 0, s[1]], [0, 1, 0], [-s[1], 0, c[1]]])
+        Rz = numpy.array([[c[2], -s[2], 0], [s[2], c[2], 0], [0, 0, 1]])
+        R = numpy.dot(Rz, numpy.dot(Ry, Rx))
+        rotated_data[k, ...] = numpy.dot(batch_data[k].reshape((-1, 3)), R)
+    return rotated_data
+
+
+def dropout_loop(batch_pc, rng, max_dropout_ratio=0.875):
+    for b in range(batch_pc.shape[0]):
+        dropout_ratio = rng.random_sample()*max_dropout_ratio
+        drop_idx = numpy.where(rng.random_sample((batch_pc.shape[1])) <= dropout_ratio)[0]
+        if len(drop_idx) > 0:
+            batch_pc[b, drop_idx, :] = batch_pc[b, 0, :]
+    return batch_pc
+
+
+def batch(seed=0, channels=3):
+    return numpy.random.RandomState(seed).uniform(-1, 1, (8, 256, channels))
+
+
+def test_rotations_match_loops():
+    numpy.testing.assert_allclose(
+        provider.rotate_point_cloud(batch(), rng=numpy.random.RandomState(5)),
+        rotate_loop(batch(), numpy.random.RandomState(5)), rtol=1e-5, atol=1e-6)
+    numpy.testing.assert_allclose(
+        provider.rotate_perturbation_point_cloud(batch(), rng=numpy.random.RandomState(5)),
+        rotate_perturbation_loop(batch(), numpy.random.RandomState(5)), rtol=1e-5, atol=1e-6)
+
+    # normals follow the same rotation as the points
+    data = batch(channels=6)
+    rotated = provider.rotate_point_cloud_with_normal(data.copy(), rng=3)
+    numpy.testing.assert_allclose(rotated[:, :, :3], rotate_loop(data[:, :, :3],
+                                                                 numpy.random.RandomState(3)),
+                                  rtol=1e-5, atol=1e-6)
+    numpy.testing.assert_allclose(rotated[:, :, 3:], rotate_loop(data[:, :, 3:],
+                                                                 numpy.random.RandomState(3)),
+                                  rtol=1e-5, atol=1e-6)
+
+
+def test_seeded_and_per_sample():
+    a = provider.jitter_point_cloud(batch(), rng=11)
+    b = provider.jitter_point_cloud(batch(), rng=11)
+    numpy.testing.assert_array_equal(a, b)
+    assert numpy.abs(a - batch()).max() <= 0.05
+
+    shifted = provider.shift_point_cloud(batch(), rng=2)
+    shifts = numpy.random.RandomState(2).uniform(-0.1, 0.1, (8, 3))
+    numpy.testing.assert_allclose(shifted, batch() + shifts[:, None, :])
+
+    flipped = provider.flip_point_cloud(batch(), rng=4)
+    draws = numpy.random.RandomState(4).uniform(size=(8, 2))
+    for k in range(8):
+        expected = batch()[k].copy()
+        if draws[k, 1] > 0.5:
+            expected[:, 0] = 2 * expected[:, 0].mean() - expected[:, 0]
+        if draws[k, 0] > 0.5:
+            expected[:, 1] = 2 * expected[:, 1].mean() - expected[:, 1]
+        numpy.testing.assert_allclose(flipped[k], expected, rtol=1e-5, atol=1e-6)
+
+    numpy.testing.assert_array_equal(
+        provider.random_point_dropout(batch(), rng=numpy.random.RandomState(9)),
+        dropout_loop(batch(), numpy.random.RandomState(9)))
@@ -0,0 +1,148 @@
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+import numpy
+
+from danesfield.geon_fitting.tensorflow import utils
+from danesfield.geon_fitting.utils import pc_util
+
+
+# Loop versions the vectorized helpers replaced
+
+def label_point_shape_loop(model, image, pc):
+    label = numpy.zeros((pc.shape[0]), dtype=numpy.int32)
+    for idx in range(pc.shape[0]):
+        projected_point = utils.ProjectPoint(model, [pc[idx, 0], pc[idx, 1]])
+        projected_point[0] = int(projected_point[0]+0.5)
+        projected_point[1] = int(projected_point[1]+0.5)
+        label[idx] = image[projected_point[1], projected_point[0]]
+    return label
+
+
+def get_poly_ply_volume_loop(dtm, projection_model, centroid, ex, ey, coefficients,
+                             min_axis_z, max_axis_z, ortho_x_min, ortho_x_max, start_point,
+                             center_of_mess):
+    ez = numpy.cross(ex, ey)
+    inverse_matrix = numpy.zeros((3, 3), numpy.float32)
+    inverse_matrix[0, :] = ex
+    inverse_matrix[1, :] = ez
+    inverse_matrix[2, :] = ey
+    ortho_grid_x = numpy.linspace(ortho_x_min, ortho_x_max, 30)
+    ortho_grid_z = numpy.array([min_axis_z, max_axis_z])
+    ortho_grid_y = coefficients[0]*ortho_grid_x*ortho_grid_x + \
+        coefficients[1]*ortho_grid_x + coefficients[2]
+    vertex = []
+    face = []
+    grid_point = numpy.zeros(
+        (ortho_grid_x.shape[0] * ortho_grid_z.shape[0], 3), dtype=numpy.float32)
+    for i in range(ortho_grid_x.shape[0]):
+        for j in range(ortho_grid_z.shape[0]):
+            grid_point[i*ortho_grid_z.shape[0] + j, :] = numpy.array(
+                [ortho_grid_x[i], ortho_grid_z[j], ortho_grid_y[i]])
+    original_grid_point = numpy.matmul(grid_point, inverse_matrix) + centroid
+    original_grid_point = numpy.reshape(
+        original_grid_point, (ortho_grid_x.shape[0], ortho_grid_z.shape[0], 3))
+    flag = original_grid_point[0, 0, 0] < original_grid_point[0, 1, 0]
+    for i in range(ortho_grid_x.shape[0]):
+        for j in range(ortho_grid_z.shape[0]):
+            vertex.append((original_grid_point[i, j, 0], original_grid_point[i, j, 1],
+                           original_grid_point[i, j, 2]))
+            image_point = utils.ProjectPoint(projection_model,
+                                             [original_grid_point[i, j, 0] + center_of_mess[0],
+                                              original_grid_point[i, j, 1] + center_of_mess[1]])
+            image_point[1] = min(max(image_point[1], 0), dtm.shape[0] - 1)
+            image_point[0] = min(max(image_point[0], 0), dtm.shape[1] - 1)
+            height = dtm[image_point[1], image_point[0]] - center_of_mess[2]
+            vertex.append((original_grid_point[i, j, 0], original_grid_point[i, j, 1], height))
+        if i != 0:
+            if flag:
+                face.append(([start_point+4*i - 4,
+                              start_point+4*i,  start_point+4*i-2], 255, 255, 255))
+                face.append(([start_point+4 *
+                              i, start_point+4*i+2,  start_point+4*i-2], 255, 255, 255))
+            else:
+                face.append(([start_point+4*i, start_point+4*i -
+                              4, start_point+4*i-2], 255, 255, 255))
+                face.append(([start_point+4*i+2, start_point+4 *
+                              i, start_point+4*i-2], 255, 255, 255))
+    return vertex, face
+
+
+def get_sphere_volume_loop(centroid, r, theta_min, theta_max, start_point):
+    u, v = numpy.mgrid[0:2*numpy.pi:20j, theta_min:theta_max:10j]
+    x = numpy.cos(u)*numpy.sin(v)*r + centroid[0]
+    y = numpy.sin(u)*numpy.sin(v)*r + centroid[1]
+    z = numpy.cos(v)*r + centroid[2]
+    vertex = []
+    face = []
+    for i in range(z.shape[0]):
+        vertex.append((x[i, 0], y[i, 0], z[i, 0]))
+    for j in range(1, z.shape[1]):
+        for i in range(z.shape[0]):
+            vertex.append((x[i, j], y[i, j], z[i, j]))
+            if i > 0:
+                face.append(([start_point+(j-1)*z.shape[0]+i-1, start_point +
+                              j*z.shape[0]+i-1, start_point+j*z.shape[0]+i], 255, 255, 255))
+                face.append(([start_point+j*z.shape[0]+i, start_point+(j-1) *
+                              z.shape[0]+i, start_point+(j-1)*z.shape[0]+i-1], 255, 255, 255))
+    return vertex, face
+
+
+def projection_model():
+    # 0.5 m north-up grid anchored at (1000, 2000)
+    gt = [1000., 0.5, 0, 2000., 0, -0.5]
+    return {'corners': [1000., 2000., 1100., 1900.], 'project_model': gt, 'scale': 1.0}
+
+
+def test_project_and_label_points():
+    model = projection_model()
+    rng = numpy.random.RandomState(0)
+    image = rng.randint(0, 5, (201, 201))
+    pc = numpy.column_stack([rng.uniform(1000, 1100, 500), rng.uniform(1900, 2000, 500),
+                             rng.uniform(0, 10, 500)])
+    numpy.testing.assert_array_equal(
+        utils.project_points(model, pc), [utils.ProjectPoint(model, p) for p in pc])
+    numpy.testing.assert_array_equal(utils.label_point_shape(model, image, pc),
+                                     label_point_shape_loop(model, image, pc))
+    pixels = rng.randint(0, 200, (50, 2))
+    numpy.testing.assert_allclose(utils.back_project_points(model, pixels),
+                                  [utils.BackProjectPoint(model, p) for p in pixels])
+
+
+def assert_same_mesh(result, expected):
+    numpy.testing.assert_array_equal(numpy.array(result[0]), numpy.array(expected[0]))
+    assert result[1] == expected[1]
+
+
+def test_poly_ply_volume():
+    model = projection_model()
+    dtm = numpy.random.RandomState(1).uniform(190, 200, (200, 200))
+    center_of_mess = numpy.array([1050., 1950., 200.])
+    ex = numpy.array([0.6, 0.8, 0.])
+    ey = numpy.array([0., 0., 1.])
+    for sign in (1, -1):
+        args = (dtm, model, numpy.array([1., -2., 5.]), sign * ex, ey, [-0.05, 0.1, 4.],
+                -30, 30, -20, 20, 17, center_of_mess)
+        assert_same_mesh(utils.get_poly_ply_volume(*args), get_poly_ply_volume_loop(*args))
+
+
+def test_sphere_volume():
+    expected = get_sphere_volume_loop([1., 2., 3.], 8., 0.1, 2.5, 40)
+    result = utils.get_sphere_volume(None, None, [1., 2., 3.], 8., 0.1, 2.5, 40, None)
+    assert_same_mesh(result, expected)
+
+
+def test_volume_round_trip():
+    rng = numpy.random.RandomState(2)
+    clouds = rng.uniform(-1, 0.999, (3, 200, 3))
+    vol = pc_util.point_cloud_to_volume_batch(clouds, vsize=12, flatten=False)
+    for b in range(3):
+        expected = pc_util.point_cloud_to_volume(clouds[b], 12)
+        numpy.testing.assert_array_equal(vol[b, :, :, :, 0], expected)
+        occupied = [[a, b_, c] for a in range(12) for b_ in range(12) for c in range(12)
+                    if expected[a, b_, c] == 1]
+        numpy.testing.assert_array_equal(pc_util.volume_to_point_cloud(expected), occupied)
+    assert pc_util.point_cloud_to_volume_batch(clouds).shape == (3, 12 ** 3)
@@ -0,0 +1,125 @@
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+import os
+import pickle
+
+import numpy
+import pytest
+
+cv2 = pytest.importorskip('cv2')
+from danesfield.segmentation.semantic.dataset.abstract_image_type import (  # noqa: E402
+    AbstractImageType)
+from danesfield.segmentation.semantic.dataset.image_provider import ImageProvider  # noqa: E402
+from danesfield.segmentation.semantic.dataset.memmap_provider import (  # noqa: E402
+    MemmapImageProvider)
+from danesfield.segmentation.semantic.dataset.multiband_image import (  # noqa: E402
+    MultibandImageType)
+
+
+class NpyImageType(AbstractImageType):
+    # 4 band image whose last band is the alpha, with a reflected border
+    def __init__(self, paths, fn, border, has_alpha):
+        super().__init__(paths, fn, None, has_alpha)
+        self.border = border
+
+    def data(self, name):
+        return numpy.load(os.path.join(self.paths[name], self.fn))
+
+    def read_image(self):
+        return self.finalyze(numpy.ascontiguousarray(self.data('images')[..., :3]))
+
+    def read_mask(self):
+        return self.finalyze(self.data('masks'))
+
+    def read_alpha(self):
+        return self.finalyze(numpy.ascontiguousarray(self.data('images')[..., 3]))
+
+    def finalyze(self, data):
+        return self.reflect_border(data, b=self.border)
+
+
+def write_images(root, names, suffix, rng):
+    paths = {}
+    for band, channels in [('images', 4), ('masks', None), ('ndsms', None), ('ndvis', None)]:
+        paths[band] = str(root / band)
+        os.makedirs(paths[band])
+        for name in names:
+            shape = (23, 31, channels) if channels else (23, 31)
+            data = rng.randint(0, 255, shape).astype(numpy.uint8)
+            if suffix == '.npy':
+                numpy.save(os.path.join(paths[band], name), data)
+            else:
+                cv2.imwrite(os.path.join(paths[band], name), data)
+    return paths
+
+
+def assert_same_items(cached, provider, names):
+    assert len(cached) == len(provider)
+    for item in range(len(provider)):
+        expected = provider[item]
+        image = cached[item]
+        assert image.fn == expected.fn
+        for name in names:
+            result = getattr(image, name)
+            assert isinstance(result, numpy.memmap)
+            assert result.dtype == getattr(expected, name).dtype
+            numpy.testing.assert_array_equal(result, getattr(expected, name))
+
+
+def test_memmap_provider_items(tmp_path):
+    rng = numpy.random.RandomState(0)
+    paths = write_images(tmp_path / 'npy', ['a.npy', 'b.npy'], '.npy', rng)
+    provider = ImageProvider(NpyImageType, paths, border=5, has_alpha=True)
+    cached = MemmapImageProvider(provider, str(tmp_path / 'cache'))
+    assert cached.has_alpha and cached.border == 5
+    assert_same_items(cached, provider, ['image', 'mask', 'alpha'])
+    assert cached[0].image.shape == (33, 41, 3)
+
+    paths = write_images(tmp_path / 'png', ['a.png', 'b.png', 'c.png'], '.png', rng)
+    provider = ImageProvider(MultibandImageType, paths, border=12)
+    cached = MemmapImageProvider(provider, str(tmp_path / 'cache'))
+    assert_same_items(cached, provider, ['image', 'mask'])
+    assert len(os.listdir(str(tmp_path / 'cache'))) == 2 * 3 + 3 * 2
+
+
+def test_memmap_provider_invalidation(tmp_path):
+    rng = numpy.random.RandomState(1)
+    paths = write_images(tmp_path, ['a.npy', 'b.npy'], '.npy', rng)
+    provider = ImageProvider(NpyImageType, paths, border=2, has_alpha=True)
+    cache_dir = str(tmp_path / 'cache')
+    first = MemmapImageProvider(provider, cache_dir)
+    files = sorted(os.listdir(cache_dir))
+
+    # the same sources are not decoded again
+    assert MemmapImageProvider(provider, cache_dir).files == first.files
+    assert sorted(os.listdir(cache_dir)) == files
+
+    # a source with a new modification time gets new cache files
+    source = os.path.join(paths['masks'], 'b.npy')
+    numpy.save(source, rng.randint(0, 255, (23, 31)).astype(numpy.uint8))
+    mtime = os.path.getmtime(source) + 10
+    os.utime(source, (mtime, mtime))
+    second = MemmapImageProvider(provider, cache_dir)
+    assert second.files[0] == first.files[0]
+    assert set(second.files[1].values()).isdisjoint(first.files[1].values())
+    assert_same_items(second, provider, ['image', 'mask', 'alpha'])
+
+
+def test_memmap_provider_pickle(tmp_path):
+    rng = numpy.random.RandomState(2)
+    paths = write_images(tmp_path, ['a.npy', 'b.npy'], '.npy', rng)
+    provider = ImageProvider(NpyImageType, paths, border=3, has_alpha=True)
+    cached = MemmapImageProvider(provider, str(tmp_path / 'cache'))
+    expected = numpy.array(cached[1].image)
+    assert cached._arrays
+
+    # what DataLoader workers receive: no open memory map, mapped again on use
+    worker = pickle.loads(pickle.dumps(cached))
+    assert worker._arrays == {}
+    assert cached._arrays
+    numpy.testing.assert_array_equal(worker[1].image, expected)
+    assert set(worker._arrays) == {(1, 'image')}
@@ -0,0 +1,118 @@
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+import numpy
+
+from danesfield import mesh_raster
+
+GEO_TRANSFORM = (435000.0, 0.5, 0.0, 3355000.0, 0.0, -0.5)
+
+
+def rasterize_loop(vertices, triangles, values, shape):
+    # pixel by pixel z-buffer
+    pixels = mesh_raster.world_to_pixel(vertices, GEO_TRANSFORM)
+    out = numpy.full(shape, numpy.nan)
+    depth = numpy.full(shape, -numpy.inf)
+    for t, (i, j, k) in enumerate(triangles):
+        (ax, ay), (bx, by), (cx, cy) = pixels[i], pixels[j], pixels[k]
+        area = (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+        if area == 0:
+            continue
+        for row in range(shape[0]):
+            for col in range(shape[1]):
+                px, py = col + 0.5, row + 0.5
+                l1 = ((px - ax) * (cy - ay) - (py - ay) * (cx - ax)) / area
+                l2 = ((bx - ax) * (py - ay) - (by - ay) * (px - ax)) / area
+                l0 = 1 - l1 - l2
+                if min(l0, l1, l2) >= 0:
+                    d = l0 * vertices[i, 2] + l1 * vertices[j, 2] + l2 * vertices[k, 2]
+                    if d > depth[row, col]:
+                        depth[row, col] = d
+                        out[row, col] = values[t]
+    return out, depth
+
+
+def city(rng, nb_buildings, extent):
+    # box buildings with flat roofs as polygons: roof, walls and no floor
+    vertices = []
+    faces = []
+    for i in range(nb_buildings):
+        x, y = rng.uniform(0, extent, 2)
+        w, h = rng.uniform(5, 30, 2)
+        z = rng.uniform(5, 40)
+        corners = numpy.array([[x, y], [x + w, y], [x + w, y + h], [x, y + h]])
+        corners = corners * [1, -1] + [GEO_TRANSFORM[0], GEO_TRANSFORM[3]]
+        n = len(vertices) * 8
+        vertices.append(numpy.concatenate((numpy.c_[corners, numpy.zeros(4)],
+                                           numpy.c_[corners, numpy.full(4, z)])))
+        faces.append([n + 4, n + 5, n + 6, n + 7])
+        faces += [[n + k, n + (k + 1) % 4, n + 4 + (k + 1) % 4, n + 4 + k] for k in range(4)]
+    offsets = numpy.arange(len(faces) + 1) * 4
+    return numpy.concatenate(vertices), numpy.array(faces).ravel(), offsets
+
+
+def test_rasterize_triangles_matches_loop():
+    rng = numpy.random.RandomState(0)
+    shape = (37, 45)
+    vertices = numpy.stack((rng.uniform(GEO_TRANSFORM[0] - 3, GEO_TRANSFORM[0] + 25, 60),
+                            rng.uniform(GEO_TRANSFORM[3] - 20, GEO_TRANSFORM[3] + 3, 60),
+                            rng.uniform(0, 30, 60)), axis=1)
+    triangles = rng.randint(0, 60, (40, 3))
+    triangles[0] = [1, 1, 2]
+    values = rng.uniform(0, 1, 40)
+    expected, expected_depth = rasterize_loop(vertices, triangles, values, shape)
+    assert (~numpy.isnan(expected)).sum() > shape[0] * shape[1] / 2
+    for tile_size in [None, 8, 13]:
+        result, depth = mesh_raster.rasterize_triangles(vertices, triangles, values,
+                                                        GEO_TRANSFORM, shape, tile_size)
+        numpy.testing.assert_array_equal(depth, expected_depth)
+        numpy.testing.assert_array_equal(result, expected)
+
+
+def test_triangulate_polygon():
+    # U shaped roof, in both orientations and with a collinear vertex
+    u_shape = numpy.array([[0, 0], [5, 0], [10, 0], [10, 10], [6, 10], [6, 4],
+                           [3, 4], [3, 10], [0, 10]], dtype=numpy.float64)
+    for polygon in [u_shape, u_shape[::-1], u_shape[[0, 2, 3, 8]]]:
+        triangles = mesh_raster.triangulate_polygon(polygon)
+        assert len(triangles) == len(polygon) - 2
+        p = polygon[triangles]
+        areas = ((p[:, 1, 0] - p[:, 0, 0]) * (p[:, 2, 1] - p[:, 0, 1]) -
+                 (p[:, 1, 1] - p[:, 0, 1]) * (p[:, 2, 0] - p[:, 0, 0])) / 2
+        expected = 100 if len(polygon) == 4 else 82
+        assert numpy.abs(areas).sum() == expected
+        assert (areas > 0).all() or (areas < 0).all()
+    assert len(mesh_raster.triangulate_polygon([[0, 0], [1, 1], [2, 2], [1, 1]])) == 0
+
+
+def test_rasterize_buildings():
+    rng = numpy.random.RandomState(1)
+    vertices, indices, offsets = city(rng, 20, 60)
+    triangles, polygon = mesh_raster.polygon_triangles(vertices, indices, offsets)
+    # walls have no area seen from above, roofs are split in two
+    numpy.testing.assert_array_equal(polygon, numpy.repeat(numpy.arange(0, 100, 5), 2))
+    values = vertices[triangles, 2].mean(axis=1)
+    shape = (180, 190)
+    result, depth = mesh_raster.rasterize_triangles(vertices, triangles, values,
+                                                    GEO_TRANSFORM, shape, 64)
+    # flat roofs: the value is the height of the highest building seen
+    covered = ~numpy.isnan(result)
+    numpy.testing.assert_allclose(result[covered], depth[covered], rtol=1e-12)
+    assert covered.sum() > 1000
+
+
+if __name__ == '__main__':
+    import time
+    rng = numpy.random.RandomState(0)
+    for nb_buildings, size in [(1000, 2000), (10000, 4000)]:
+        vertices, indices, offsets = city(rng, nb_buildings, size * GEO_TRANSFORM[1])
+        now = time.time()
+        triangles, polygon = mesh_raster.polygon_triangles(vertices, indices, offsets)
+        values = vertices[triangles, 2].mean(axis=1)
+        mesh_raster.rasterize_triangles(vertices, triangles, values, GEO_TRANSFORM,
+                                        (size, size), 2048)
+        print('{} buildings, {} x {} pixels: {:.2f}s'.format(
+            nb_buildings, size, size, time.time() - now))
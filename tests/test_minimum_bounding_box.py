@@ -0,0 +1,72 @@
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+from math import atan2
+
+import numpy
+import pytest
+from scipy.spatial import ConvexHull
+
+from danesfield.surface import MinimumBoundingBox as mbb
+
+
+def minimum_bounding_box_loop(points):
+    # edge by edge rotating calipers the vectorized version replaced
+    hull_ordered = [points[index] for index in ConvexHull(points).vertices]
+    hull_ordered.append(hull_ordered[0])
+    hull_ordered = tuple(hull_ordered)
+
+    min_rectangle = mbb.bounding_area(0, hull_ordered)
+    for i in range(1, len(hull_ordered)-1):
+        rectangle = mbb.bounding_area(i, hull_ordered)
+        if rectangle['area'] < min_rectangle['area']:
+            min_rectangle = rectangle
+
+    min_rectangle['unit_vector_angle'] = atan2(
+        min_rectangle['unit_vector'][1], min_rectangle['unit_vector'][0])
+    min_rectangle['rectangle_center'] = mbb.to_xy_coordinates(
+        min_rectangle['unit_vector_angle'], min_rectangle['rectangle_center'])
+    return mbb.BoundingBox(
+        area=min_rectangle['area'],
+        length_parallel=min_rectangle['length_parallel'],
+        length_orthogonal=min_rectangle['length_orthogonal'],
+        rectangle_center=min_rectangle['rectangle_center'],
+        unit_vector=min_rectangle['unit_vector'],
+        unit_vector_angle=min_rectangle['unit_vector_angle'],
+        corner_points=mbb.rectangle_corners(min_rectangle)
+    )
+
+
+def footprints():
+    rng = numpy.random.RandomState(0)
+    yield rng.uniform(-50, 50, (200, 2))
+    yield rng.normal(0, [30, 5], (500, 2)) + [4e5, 3e6]
+    # rotated rectangles with the corners and some interior roof points
+    for angle in rng.uniform(0, numpy.pi, 5):
+        corners = numpy.array([[0, 0], [23, 0], [23, 11], [0, 11.]])
+        inside = rng.uniform([0, 0], [23, 11], (30, 2))
+        rotation = numpy.array([[numpy.cos(angle), -numpy.sin(angle)],
+                                [numpy.sin(angle), numpy.cos(angle)]])
+        yield numpy.concatenate([corners, inside]).dot(rotation.T) + [7e5, 4e6]
+    yield [(5, 2), (3, 4), (6, 8), (1, 1)]
+
+
+def test_minimum_bounding_box_matches_loop():
+    for points in footprints():
+        result = mbb.MinimumBoundingBox(points)
+        expected = minimum_bounding_box_loop(points)
+        assert result._fields == expected._fields
+        for r, e in zip(result, expected):
+            numpy.testing.assert_allclose(r, e, rtol=1e-9, atol=1e-9)
+
+
+def test_minimum_bounding_box_rectangle():
+    box = mbb.MinimumBoundingBox(numpy.array([[0, 0], [4, 0], [4, 2], [0, 2], [1, 1.]]))
+    assert box.area == pytest.approx(8)
+    assert sorted([box.length_parallel, box.length_orthogonal]) == pytest.approx([2, 4])
+    assert box.rectangle_center == pytest.approx((2, 1))
+    with pytest.raises(ValueError):
+        mbb.MinimumBoundingBox([(0, 0), (1, 1)])
@@ -0,0 +1,176 @@
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+import io
+
+import numpy
+import pytest
+
+from danesfield import obj_io
+
+
+def test_format_rows_matches_str():
+    rng = numpy.random.RandomState(0)
+    vertices = numpy.concatenate([rng.uniform(-1e6, 1e6, (500, 3)),
+                                  10.0 ** rng.uniform(-8, 18, (500, 3)),
+                                  [[0.0, -0.0, 1e16]]])
+    expected = ''.join('v ' + ' '.join(str(x) for x in v) + '\n' for v in vertices.tolist())
+    assert obj_io.format_rows('v', vertices) == expected
+
+    # float32 values are written with their own shortest repr
+    single = vertices.astype(numpy.float32)
+    expected = ''.join('v ' + ' '.join(map(str, v)) + '\n' for v in single)
+    assert obj_io.format_rows('v', single) == expected
+
+    faces = rng.randint(0, 1000, (300, 4))
+    expected = ''.join('f ' + ' '.join(str(i) for i in f) + '\n' for f in faces.tolist())
+    assert obj_io.format_rows('f', faces) == expected
+    assert obj_io.format_rows('f', numpy.arange(1, 5)) == 'f 1 2 3 4\n'
+    assert obj_io.format_rows('f', numpy.zeros((0, 3), dtype=int)) == ''
+
+
+def test_write_obj(monkeypatch):
+    monkeypatch.setattr(obj_io, 'CHUNK_ROWS', 7)
+    rng = numpy.random.RandomState(1)
+    vertices = rng.uniform(0, 100, (50, 3))
+    faces = rng.randint(0, 50, (40, 3))
+    out = io.StringIO()
+    obj_io.write_obj(out, vertices, faces, offset=[1.5, 2, 3], header=['# ground\n'])
+    lines = out.getvalue().splitlines()
+    assert lines[:4] == ['#x offset: 1.5', '#y offset: 2', '#z offset: 3', '# ground']
+    assert len(lines) == 4 + 50 + 40
+    parsed = numpy.array([line.split()[1:] for line in lines[4:54]], dtype=float)
+    numpy.testing.assert_array_equal(parsed, vertices)
+    parsed = numpy.array([line.split()[1:] for line in lines[54:]], dtype=int)
+    numpy.testing.assert_array_equal(parsed, faces + 1)
+
+
+def building_obj(fp, rng, offset, nb_vertices):
+    vertices = rng.uniform(-50, 50, (nb_vertices, 3))
+    faces = rng.randint(0, nb_vertices, (2 * nb_vertices, 3))
+    obj_io.write_obj(fp, vertices, faces, offset=offset)
+    return vertices, faces
+
+
+def test_merge_obj(tmp_path):
+    rng = numpy.random.RandomState(2)
+    offset = [435516.5, 3354093.25, 210.0]
+    files = [str(tmp_path / '{}.obj'.format(i)) for i in range(4)]
+    meshes = [building_obj(fp, rng, offset, n) for fp, n in zip(files, [10, 1, 37, 5])]
+
+    # the offset of the first mesh and the meshes one after another
+    output = str(tmp_path / 'merged.obj')
+    assert obj_io.merge_obj(files, output, check_offsets=True, chunk_lines=7) == 53
+    expected = obj_io.offset_header(offset)
+    start = 0
+    for vertices, faces in meshes:
+        expected += obj_io.format_rows('v', vertices) + obj_io.format_rows('f', faces + 1 + start)
+        start += len(vertices)
+    assert open(output).read() == expected
+
+    # vertices of meshes with another offset move to the first offset
+    other = [435500.0, 3354100.0, 200.5]
+    vertices, faces = building_obj(files[2], rng, other, 37)
+    with pytest.raises(ValueError):
+        obj_io.merge_obj(files, output, check_offsets=True)
+    obj_io.merge_obj(files, output, chunk_lines=7)
+    lines = open(output).read().splitlines(True)
+    assert ''.join(lines[:3]) == obj_io.offset_header(offset)
+    merged = numpy.array([line.split()[1:] for line in lines if line[0] == 'v'], dtype=float)
+    numpy.testing.assert_allclose(merged[11:48], vertices + other - numpy.array(offset),
+                                  rtol=0, atol=1e-9)
+    numpy.testing.assert_array_equal(merged[:11], numpy.concatenate([m[0] for m in meshes[:2]]))
+
+    # the texture mapping occlusion mesh: buildings with offsets and the
+    # ground of dtm_to_mesh, written without header but already translated
+    ground = rng.uniform(0, 100, (12, 3))
+    obj_io.write_obj(files[0], ground, rng.randint(0, 12, (8, 3)))
+    with pytest.raises(ValueError):
+        obj_io.merge_obj(files, output, check_offsets=True)
+    obj_io.merge_obj(files, output, chunk_lines=7)
+    lines = open(output).read().splitlines(True)
+    assert ''.join(lines[:3]) == obj_io.offset_header(offset)
+    merged = numpy.array([line.split()[1:] for line in lines if line[0] == 'v'], dtype=float)
+    numpy.testing.assert_array_equal(merged[:12], ground)
+    numpy.testing.assert_array_equal(merged[12], meshes[1][0][0])
+    numpy.testing.assert_allclose(merged[13:50], vertices + other - numpy.array(offset),
+                                  rtol=0, atol=1e-9)
+
+
+def test_read_offset_header():
+    assert obj_io.read_offset_header(['#x offset: 1.5\n', '#y offset: -2e3\n',
+                                      '#z offset: .25\n', 'v 1 2 3\n']) == ([1.5, -2000, 0.25], 3)
+    assert obj_io.read_offset_header(['#x offset: 1\n', '#z offset: 3\n']) == ([1, 0, 0], 1)
+    assert obj_io.read_offset_header(['v 1 2 3\n']) == (None, 0)
+    cs = ('# coordinate_system: {"parameters": ["wgs84", "UTM zone 16N", 747594.5, '
+          '4407371.25, 225.0, 0, 0, 0, 0, 0], "type": "EPSG"}\n')
+    assert obj_io.read_offset_header(['ply\n'] + ['comment\n'] * 6 + [cs]) == \
+        ([747594.5, 4407371.25, 225.0], 0)
+
+
+def test_shift_lines():
+    assert obj_io.shift_lines('f', ['f 1 2 3\n', 'f 4 5 6 7\n', 'f -1 -2 -3\n'], None, 10) == \
+        'f 11 12 13\nf 14 15 16 17\nf -1 -2 -3\n'
+    assert obj_io.shift_lines('f', ['f 1/1 2/2 3/3\n', 'f 4//1 5//2 6//3\n'], None, 10) == \
+        'f 11/1 12/2 13/3\nf 14//1 15//2 16//3\n'
+    assert obj_io.shift_lines('v', ['v 1.5 2 3\n', 'v 4 5 6\n'], [1, 0.5, 0], 0) == \
+        'v 2.5 2.5 3.0\nv 5.0 5.5 6.0\n'
+    assert obj_io.shift_lines('v', ['v 1 2 3 0.5 0.5 0.5\n'], [1, 1, 1], 0) == \
+        'v 2.0 3.0 4.0 0.5 0.5 0.5\n'
+
+
+def test_read_obj(tmp_path):
+    fp = str(tmp_path / 'building.obj')
+    with open(fp, 'w') as f:
+        f.write('#x offset: 1\n#y offset: 2\n#z offset: 3\nmtllib a.mtl\n'
+                'v 0 0 1\nv 1 0 1\nv 1 1 1.5\nvt 0 0\nv 0 1 1\n'
+                'f 1 2 3 4\nf 1/1 2/1 3/1\nf -4 -3 -1\n')
+    vertices, indices, offsets = obj_io.read_obj(fp)
+    numpy.testing.assert_array_equal(vertices, [[0, 0, 1], [1, 0, 1], [1, 1, 1.5], [0, 1, 1]])
+    numpy.testing.assert_array_equal(indices, [0, 1, 2, 3, 0, 1, 2, 0, 1, 3])
+    numpy.testing.assert_array_equal(offsets, [0, 4, 7, 10])
+
+
+def test_load_obj_cache(tmp_path, monkeypatch):
+    rng = numpy.random.RandomState(3)
+    fp = str(tmp_path / '12.obj')
+    offset = [435516.5, 3354093.25, 210.0]
+    vertices, faces = building_obj(fp, rng, offset, 20)
+    loaded = obj_io.load_obj(fp)
+    numpy.testing.assert_array_equal(loaded[0], vertices + offset)
+    numpy.testing.assert_array_equal(loaded[1], faces.ravel())
+    assert obj_io.cache_path(fp) == str(tmp_path / '12.npz')
+
+    # the second load does not parse the OBJ file
+    def read_obj(fp):
+        raise AssertionError('parsed again')
+    monkeypatch.setattr(obj_io, 'read_obj', read_obj)
+    for r, e in zip(obj_io.load_obj(fp), loaded):
+        numpy.testing.assert_array_equal(r, e)
+    monkeypatch.undo()
+
+    # a cache of another version is parsed again and replaced
+    calls = []
+
+    def read_obj_counted(fp, read_obj=obj_io.read_obj):
+        calls.append(fp)
+        return read_obj(fp)
+    monkeypatch.setattr(obj_io, 'read_obj', read_obj_counted)
+    monkeypatch.setattr(obj_io, 'CACHE_VERSION', obj_io.CACHE_VERSION + 1)
+    obj_io.load_obj(fp)
+    obj_io.load_obj(fp)
+    assert calls == [fp]
+    with numpy.load(obj_io.cache_path(fp)) as data:
+        assert data['source'][0] == obj_io.CACHE_VERSION
+    monkeypatch.undo()
+
+    # a changed OBJ file is parsed again, without cache nothing is written
+    vertices, faces = building_obj(fp, rng, offset, 30)
+    numpy.testing.assert_array_equal(obj_io.load_obj(fp)[0], vertices + offset)
+    other = str(tmp_path / 'Road1.obj')
+    building_obj(other, rng, None, 5)
+    obj_io.load_obj(other, cache=False)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['12.npz', '12.obj', 'Road1.obj']
@@ -0,0 +1,145 @@
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+import importlib
+import json
+import os
+
+import numpy
+import pytest
+
+from danesfield.surface import scene
+
+TOOLS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools')
+
+
+@pytest.fixture
+def ply2obj(monkeypatch):
+    # pool workers import the tool by name, so it goes through sys.path
+    monkeypatch.syspath_prepend(TOOLS_DIR)
+    return importlib.import_module('ply2obj')
+
+
+def write_ply(fp, vertices, faces):
+    with open(fp, 'w') as f:
+        f.write('ply\nformat ascii 1.0\nelement vertex {}\n'
+                'property double x\nproperty double y\nproperty double z\n'
+                'element face {}\nproperty list uchar int vertex_indices\n'
+                'end_header\n'.format(len(vertices), len(faces)))
+        for v in vertices:
+            f.write('{} {} {}\n'.format(*v))
+        for face in faces:
+            f.write('{} {}\n'.format(len(face), ' '.join(str(i) for i in face)))
+
+
+def gable_building(x, y, width, depth, height):
+    # two sloped roof planes meeting at a ridge along x
+    vertices = [[x, y, height], [x + width, y, height],
+                [x + width, y + depth / 2, height + 3], [x, y + depth / 2, height + 3],
+                [x + width, y + depth, height], [x, y + depth, height]]
+    return vertices, [[0, 1, 2, 3], [3, 2, 4, 5]]
+
+
+def ply_dir(root):
+    path = str(root / 'buildings')
+    os.makedirs(path)
+    rng = numpy.random.RandomState(0)
+    for i in range(5):
+        x, y = 435000 + rng.uniform(0, 80), 3354000 + rng.uniform(0, 80)
+        write_ply(os.path.join(path, '{}.ply'.format(i)),
+                  *gable_building(x, y, rng.uniform(8, 15), rng.uniform(8, 15), 215 + i))
+    write_ply(os.path.join(path, 'flat.ply'),
+              [[435010, 3354010, 220], [435020, 3354010, 220], [435015, 3354020, 220]],
+              [[0, 1, 2]])
+    with open(os.path.join(path, 'corrupt.ply'), 'w') as f:
+        f.write('ply\nformat ascii 1.0\nelement vertex 3\nproperty double x\n'
+                'property double y\nproperty double z\nend_header\n1 2\n')
+    return path
+
+
+def dem_parameter():
+    return [434990.0, 3354110.0, 1.0, -1.0, numpy.full((130, 130), 210.0, dtype=numpy.float32)]
+
+
+def read_outputs(path):
+    outputs = {}
+    for folder in [path + '_obj', path + '_surface']:
+        for name in sorted(os.listdir(folder)):
+            if name.endswith('.obj'):
+                with open(os.path.join(folder, name)) as f:
+                    outputs[(os.path.basename(folder), name)] = f.read()
+    return outputs
+
+
+def test_convert_buildings(tmp_path, ply2obj):
+    path = ply_dir(tmp_path)
+    files = sorted(os.listdir(path))
+    results = []
+    for workers in [1, 2]:
+        manifest, manifest_path = ply2obj.convert_ply_dir(path, dem_parameter(), workers=workers)
+        with open(manifest_path) as f:
+            assert json.load(f) == manifest
+        assert manifest_path == os.path.join(path + '_obj', 'manifest.json')
+        outputs = read_outputs(path)
+        assert not [name for name in os.listdir(path + '_obj') if '.tmp' in name]
+        results.append((manifest, outputs))
+
+    # the pool writes what the serial loop writes, records in file order
+    (serial, serial_outputs), (pool, pool_outputs) = results
+    assert serial_outputs == pool_outputs
+    assert sorted(serial_outputs) == sorted(
+        (folder, name.replace('.ply', '.obj')) for folder in ['buildings_obj', 'buildings_surface']
+        for name in files if name != 'corrupt.ply')
+    for manifest in [serial, pool]:
+        assert [record['ply'] for record in manifest['buildings']] == \
+            [os.path.join(path, name) for name in files]
+        assert manifest['failed'] == ['corrupt']
+        assert manifest['workers'] in [1, 2]
+    for a, b in zip(serial['buildings'], pool['buildings']):
+        for key in ['name', 'status', 'surface_num', 'wall_num', 'edge_num', 'vertex_num',
+                    'surface_info']:
+            assert a[key] == b[key]
+    corrupt = serial['buildings'][files.index('corrupt.ply')]
+    assert corrupt['status'] == 'failed' and corrupt['error'].startswith('load failed:')
+    assert all(record['surface_num'] == 2 for record in serial['buildings'][:5])
+
+    # every building OBJ file starts with the shared offset
+    offset = serial['offset']
+    assert offset == [min(v) for v in zip(*[
+        numpy.min(scene.read_ply(os.path.join(path, name))[0], axis=0)
+        for name in files if name != 'corrupt.ply'])]
+    for (folder, _), text in serial_outputs.items():
+        assert text.startswith(scene.offset_header(offset)) == (folder == 'buildings_obj')
+
+
+def test_model_logs(tmp_path, ply2obj):
+    path = ply_dir(tmp_path)
+    manifest, _ = ply2obj.convert_ply_dir(path, dem_parameter(), workers=1)
+    converted = [record for record in manifest['buildings'] if record['status'] == 'ok']
+    with open(path + '_obj_model_log.txt') as f:
+        assert f.read().split('\n######\n')[1].startswith('Generate model time:')
+    with open(os.path.join(path + '_obj', 'model_log.txt')) as f:
+        log = f.read()
+    top = sum(record['surface_num'] for record in converted)
+    wall = sum(record['wall_num'] for record in converted)
+    assert 'Total top surface num: {}\n'.format(top) in log
+    assert 'Total surface num: {}\n'.format(2 * top + wall) in log
+    assert 'Total vertex num: {}\n'.format(
+        sum(record['vertex_num'] for record in converted)) in log
+    assert log.count('surface #') == top
+    assert ''.join(record['surface_info'] for record in converted) in log
+
+
+def test_write_atomic(tmp_path):
+    fp = str(tmp_path / 'a.obj')
+    scene.write_atomic(fp, 'v 1 2 3\n')
+
+    # the temporary file of a failed write is removed, the old file kept
+    with pytest.raises(TypeError):
+        scene.write_atomic(fp, 1)
+    assert os.listdir(str(tmp_path)) == ['a.obj']
+    with open(fp) as f:
+        assert f.read() == 'v 1 2 3\n'
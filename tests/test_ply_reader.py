@@ -0,0 +1,98 @@
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+import re
+
+import numpy
+import pytest
+
+from danesfield.surface.poly_functions import ply_parser
+from danesfield.surface.ply_reader import face_list, read_ply
+
+plyfile = pytest.importorskip('plyfile')
+
+
+def ply_parser_regex(fp):
+    # line by line parser that read_ply replaced
+    lines = open(fp).readlines()
+    flag = 0
+    for line in lines:
+        if re.search(r"\s*element\s*vertex\s*\d*", line) is not None:
+            vertex_num = int(re.findall(r"\d+\.?\d*", line)[0])
+        if re.search(r"\s*element\s*face\s*\d*", line) is not None:
+            face_num = int(re.findall(r"\d+\.?\d*", line)[0])
+        if re.search("end_header", line) is not None:
+            begin_num = flag + 1
+        flag += 1
+    vertex_lines = lines[begin_num:begin_num + vertex_num]
+    cor = numpy.asarray([[float(v) for v in re.findall(r"-*\d+\.?\d*", line)[:3]]
+                         for line in vertex_lines])
+    f = [re.findall(r"\d+\.?\d*", line)
+         for line in lines[begin_num + vertex_num:begin_num + vertex_num + face_num]]
+    return cor, f
+
+
+def building_mesh(rng, triangles, coordinate_type):
+    vertex = numpy.zeros(300, dtype=[('x', coordinate_type), ('y', coordinate_type),
+                                     ('z', coordinate_type), ('red', 'u1')])
+    vertex['x'] = rng.uniform(4e5, 4e5 + 100, 300)
+    vertex['y'] = rng.uniform(3e6, 3e6 + 100, 300)
+    vertex['z'] = rng.uniform(200, 230, 300)
+    vertex['red'] = rng.randint(0, 255, 300)
+    sizes = numpy.full(200, 3) if triangles else rng.randint(3, 9, 200)
+    face = numpy.empty(200, dtype=[('vertex_indices', 'O'), ('label', 'i4')])
+    face['vertex_indices'] = [rng.randint(0, 300, n).astype('i4') for n in sizes]
+    face['label'] = rng.randint(0, 10, 200)
+    return vertex, face
+
+
+@pytest.mark.parametrize('text', [True, False])
+@pytest.mark.parametrize('byte_order', ['<', '>'])
+@pytest.mark.parametrize('triangles', [True, False])
+@pytest.mark.parametrize('coordinate_type', ['f4', 'f8'])
+def test_read_ply_matches_plyfile(tmp_path, text, byte_order, triangles, coordinate_type):
+    vertex, face = building_mesh(numpy.random.RandomState(0), triangles, coordinate_type)
+    fp = str(tmp_path / 'building.ply')
+    plyfile.PlyData([plyfile.PlyElement.describe(vertex, 'vertex'),
+                     plyfile.PlyElement.describe(face, 'face')],
+                    text=text, byte_order=byte_order).write(fp)
+
+    expected = plyfile.PlyData.read(fp)
+    cor, indices, offsets = read_ply(fp)
+    expected_cor = numpy.vstack((expected['vertex']['x'],
+                                 expected['vertex']['y'],
+                                 expected['vertex']['z'])).transpose()
+    assert cor.dtype == expected_cor.dtype
+    numpy.testing.assert_array_equal(cor, expected_cor)
+    faces = face_list(indices, offsets)
+    assert len(faces) == len(face)
+    for r, e in zip(faces, expected['face']['vertex_indices']):
+        numpy.testing.assert_array_equal(r, e)
+
+
+def test_ply_parser_compatible(tmp_path):
+    vertex, face = building_mesh(numpy.random.RandomState(1), False, 'f8')
+    fp = str(tmp_path / 'building.ply')
+    indices = numpy.empty(len(face), dtype=[('vertex_indices', 'O')])
+    indices['vertex_indices'] = face['vertex_indices']
+    plyfile.PlyData([plyfile.PlyElement.describe(vertex, 'vertex'),
+                     plyfile.PlyElement.describe(indices, 'face')],
+                    text=True).write(fp)
+    cor, f = ply_parser(fp)
+    expected_cor, expected_f = ply_parser_regex(fp)
+    numpy.testing.assert_array_equal(cor, expected_cor)
+    assert f == expected_f
+
+
+def test_read_ply_empty(tmp_path):
+    fp = str(tmp_path / 'empty.ply')
+    with open(fp, 'w') as f:
+        f.write('ply\nformat ascii 1.0\nelement vertex 0\nproperty float x\n'
+                'property float y\nproperty float z\nelement face 0\n'
+                'property list uchar int vertex_indices\nend_header\n')
+    cor, indices, offsets = read_ply(fp)
+    assert cor.shape == (0, 3)
+    assert face_list(indices, offsets) == []
@@ -0,0 +1,68 @@
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+import numpy
+import scipy.spatial
+
+from danesfield.geon_fitting.tensorflow import clustering
+from danesfield.geon_fitting.tensorflow import roof_type_inference
+
+
+def clustered_cloud(seed=0):
+    rng = numpy.random.RandomState(seed)
+    points = numpy.concatenate([rng.uniform(0, 10, (500, 3)),
+                                rng.uniform(0, 20, (900, 3)) * [1, 1, 0.2] + [40, 0, 0],
+                                rng.uniform(0, 10, (300, 3)) + [0, 40, 0],
+                                [[100., 100., 100.]]])
+    labels = clustering.euclidean_cluster_labels(points, tolerance=2, min_size=100,
+                                                 use_pcl=False)
+    return points, labels
+
+
+def roof_side(batch):
+    # fake model: class 1 where the normalized x is positive
+    return numpy.stack([-batch[:, :, 0], batch[:, :, 0]], axis=2)
+
+
+def test_sample_clusters():
+    points, labels = clustered_cloud()
+    sample_index, samples = roof_type_inference.sample_clusters(
+        points, labels, 64, numpy.random.RandomState(1))
+    assert sample_index.shape == (3, 64) and samples.shape == (3, 64, 3)
+    for j in range(3):
+        assert (labels[sample_index[j]] == j).all()
+        cluster = points[labels == j]
+        scale = numpy.max(cluster.max(axis=0) - cluster.min(axis=0))
+        numpy.testing.assert_allclose(
+            samples[j], (points[sample_index[j]] - cluster.mean(axis=0)) / scale * 2,
+            rtol=1e-5, atol=1e-6)
+
+
+def test_classify_clusters_matches_per_building_loop():
+    points, labels = clustered_cloud()
+    calls = []
+
+    def predict(batch):
+        calls.append(batch.shape)
+        return roof_side(batch)
+    point_labels, sample_index, sample_labels, points_per_second = \
+        roof_type_inference.classify_clusters(predict, points, labels, 64, 2,
+                                              numpy.random.RandomState(1))
+    # full batches only, the last one padded
+    assert calls == [(2, 64, 3), (2, 64, 3)]
+    assert points_per_second > 0
+    assert point_labels[-1] == -1
+
+    _, samples = roof_type_inference.sample_clusters(points, labels, 64,
+                                                     numpy.random.RandomState(1))
+    for j in range(3):
+        # the previous per building path: model on one cloud, nearest sample
+        expected = numpy.argmax(roof_side(samples[j:j + 1]), axis=2)[0]
+        numpy.testing.assert_array_equal(sample_labels[j], expected)
+        cluster = numpy.nonzero(labels == j)[0]
+        distance = scipy.spatial.distance_matrix(points[cluster], points[sample_index[j]])
+        best = numpy.argmin(distance, axis=1)
+        numpy.testing.assert_array_equal(point_labels[cluster], expected[best])
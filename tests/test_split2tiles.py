@@ -0,0 +1,117 @@
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+import numpy
+import pytest
+
+from danesfield.segmentation.semantic.utils import split2tiles
+
+
+def split_windows_loop(transform, cols, rows, sqwidth):
+    # the window arithmetic of split(), on the extent get_extent() returns
+    extent = {
+        "minX": str(transform[0]),
+        "maxX": str(transform[0] + cols * transform[1] + rows * transform[2]),
+        "minY": str(transform[3] + cols * transform[4] + rows * transform[5]),
+        "maxY": str(transform[3])}
+    minx = float(extent["minX"])
+    maxx = float(extent["maxX"])
+    miny = float(extent["minY"])
+    maxy = float(extent["maxY"])
+    xOrigin = transform[0]
+    yOrigin = transform[3]
+    pixelWidth = transform[1]
+    pixelHeight = -transform[5]
+    txlen = sqwidth*pixelWidth
+    tylen = sqwidth*pixelHeight
+    tiles = split2tiles.create_square_tiles(minx, miny, maxx, maxy, txlen, tylen)
+    windows = []
+    for tile in tiles:
+        minx = tile[0][0]
+        maxx = tile[1][0]
+        miny = tile[1][1]
+        maxy = tile[0][1]
+        i1 = int((minx - xOrigin) / pixelWidth)
+        j1 = int((yOrigin - maxy) / pixelHeight)
+        i2 = int((maxx - xOrigin) / pixelWidth)
+        while i2-i1 != sqwidth:
+            if i2-i1 > sqwidth:
+                maxx -= 0.5*pixelWidth
+            else:
+                maxx += 0.5*pixelWidth
+            i2 = int((maxx - xOrigin) / pixelWidth)
+        j2 = int((yOrigin - miny) / pixelHeight)
+        while j2-j1 != sqwidth:
+            if j2-j1 > sqwidth:
+                miny += 0.5*pixelHeight
+            else:
+                miny -= 0.5*pixelHeight
+            j2 = int((yOrigin - miny) / pixelHeight)
+        windows.append((i1, j1, i2-i1, j2-j1))
+    return windows
+
+
+def test_square_tile_windows_match_split():
+    rng = numpy.random.RandomState(0)
+    cases = [((435000.0, 0.5, 0, 3355000.0, 0, -0.5), 5000, 5001),
+             ((435000.0, 0.3, 0, 3355000.0, 0, -0.3), 5000, 5000),
+             ((747594.25, 0.5, 0, 4407371.75, 0, -0.5), 2048, 4096)]
+    for _ in range(20):
+        gsd = rng.choice([0.25, 0.3, 0.5, 0.7, 1.0])
+        transform = (rng.uniform(2e5, 8e5), gsd, 0, rng.uniform(1e6, 5e6), 0, -gsd)
+        cases.append((transform, rng.randint(100, 5000), rng.randint(100, 5000)))
+    for transform, cols, rows in cases:
+        expected = split_windows_loop(transform, cols, rows, 1024)
+        assert split2tiles.square_tile_windows(transform, cols, rows, 1024) == expected
+    # split() centers in whole geographic units from the bottom, not in pixels
+    assert split2tiles.square_tile_windows(*cases[0], 2048)[0][:2] == (452, 453)
+    assert split2tiles.square_tile_windows(*cases[1], 2048)[0][:2] == (450, 454)
+
+
+def test_square_tile_windows_cover():
+    transform = (435000.0, 0.3, 0, 3355000.0, 0, -0.3)
+    for cols, rows, sqwidth in [(5000, 5000, 2048), (700, 2100, 1024), (5000, 3000, 1000)]:
+        windows = split2tiles.square_tile_windows(transform, cols, rows, sqwidth)
+        covering = split2tiles.square_tile_windows(transform, cols, rows, sqwidth, cover=True)
+        assert set(windows) <= set(covering)
+        count = numpy.zeros((rows, cols), dtype=int)
+        for xoff, yoff, xsize, ysize in covering:
+            assert xoff >= 0 and yoff >= 0
+            assert xoff + xsize <= cols and yoff + ysize <= rows
+            assert (xsize, ysize) == (min(sqwidth, cols), min(sqwidth, rows))
+            count[yoff:yoff + ysize, xoff:xoff + xsize] += 1
+        assert count.min() >= 1
+
+
+def test_merge_windows_averages_overlaps(tmp_path):
+    gdal = pytest.importorskip('osgeo.gdal')
+    pytest.importorskip('tqdm')
+    from danesfield.segmentation.semantic.utils import merge_preds
+
+    rows, cols = 70, 90
+    ref_path = str(tmp_path / 'ref.tif')
+    ref = gdal.GetDriverByName('GTiff').Create(ref_path, cols, rows, 1, gdal.GDT_Byte)
+    ref.SetGeoTransform((435000.0, 0.5, 0, 3355000.0, 0, -0.5))
+    ref = None
+
+    rng = numpy.random.RandomState(1)
+    windows = split2tiles.square_tile_windows((435000.0, 0.5, 0, 3355000.0, 0, -0.5),
+                                              cols, rows, 32, cover=True)
+    windows = windows[:-1]
+    predictions = [rng.uniform(0, 1, (w[3], w[2])).astype(numpy.float32) for w in windows]
+    total = numpy.zeros((rows, cols))
+    count = numpy.zeros((rows, cols))
+    for (xoff, yoff, xsize, ysize), p in zip(windows, predictions):
+        total[yoff:yoff + ysize, xoff:xoff + xsize] += p
+        count[yoff:yoff + ysize, xoff:xoff + xsize] += 1
+    assert count.max() > 1 and count.min() == 0
+
+    out_path = str(tmp_path / 'merged.tif')
+    merge_preds.merge_windows(out_path, ref_path, zip(windows, predictions), block_size=16)
+    merged = gdal.Open(out_path).ReadAsArray()
+    numpy.testing.assert_allclose(merged[count > 0], (total / count)[count > 0], rtol=1e-6)
+    assert (merged[count == 0] == -1).all()
+    assert not (tmp_path / 'merged.tif.acc.tif').exists()
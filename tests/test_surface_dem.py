@@ -0,0 +1,65 @@
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+import numpy
+
+from danesfield.surface import poly_functions
+
+
+def get_height_from_dem_loop(cor, dem_parameter):
+    # per point lookup with the border pixel search the batched version replaced
+    xOrigin, yOrigin, pixelWidth, pixelHeight, data = dem_parameter
+    r1 = [[0, i] for i in range(data.shape[1])]
+    r2 = [[data.shape[0] - 1, i] for i in range(data.shape[1])]
+    r3 = [[i, 0] for i in range(data.shape[0])]
+    r4 = [[i, data.shape[1] - 1] for i in range(data.shape[0])]
+    r = numpy.r_[r1, r2, r3, r4]
+    base_height = []
+    for i in range(cor.shape[0]):
+        xOffset = int((cor[i, 0] - xOrigin) / pixelWidth)
+        yOffset = int((cor[i, 1] - yOrigin) / pixelHeight)
+        try:
+            base_height.append(data[yOffset][xOffset])
+        except IndexError:
+            dist_2 = numpy.sum((r - numpy.array([yOffset, xOffset])) ** 2, axis=1)
+            index = numpy.argmin(dist_2)
+            base_height.append(data[r[index, 0]][r[index, 1]])
+    return numpy.array(base_height)
+
+
+def test_get_height_from_dem():
+    rng = numpy.random.RandomState(0)
+    data = rng.uniform(0, 50, (40, 60)).astype(numpy.float32)
+    dem_parameter = [1000.0, 2000.0, 0.5, -0.5, data]
+    # footprints inside the DEM and past its right and bottom borders
+    cor = numpy.stack([rng.uniform(1000, 1040, 5000),
+                       rng.uniform(1975, 2000, 5000),
+                       rng.uniform(0, 20, 5000)], axis=1)
+    numpy.testing.assert_array_equal(
+        poly_functions.get_height_from_dem(cor, dem_parameter),
+        get_height_from_dem_loop(cor, dem_parameter))
+
+    # left and top of the DEM clamp to the border instead of wrapping around
+    outside = numpy.array([[990.0, 1990.0], [1010.0, 2010.0]])
+    numpy.testing.assert_array_equal(
+        poly_functions.get_height_from_dem(outside, dem_parameter),
+        [data[20, 0], data[0, 20]])
+
+
+def test_fill_invalid_heights():
+    data = numpy.arange(25, dtype=numpy.float32).reshape(5, 5)
+    data[1:4, 1:3] = -9999
+    data[4, 4] = numpy.nan
+    filled = poly_functions.fill_invalid_heights(data, -9999)
+    valid = (data != -9999) & numpy.isfinite(data)
+    numpy.testing.assert_array_equal(filled[valid], data[valid])
+    # every filled pixel takes the value of its nearest valid pixel
+    rows, cols = numpy.nonzero(valid)
+    for y, x in zip(*numpy.nonzero(~valid)):
+        d = (rows - y) ** 2 + (cols - x) ** 2
+        nearest = data[rows[d == d.min()], cols[d == d.min()]]
+        assert filled[y, x] in nearest
+    assert poly_functions.fill_invalid_heights(data[valid].reshape(1, -1)).dtype == data.dtype
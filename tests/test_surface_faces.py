@@ -0,0 +1,63 @@
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+import numpy
+
+from danesfield.surface.poly_functions import cluster_faces, list_intersect, list_union
+
+
+def cluster_faces_loop(fi):
+    # list merging of load_from_curved_ply that cluster_faces replaced
+    c_cor_index = []
+    t_fi = fi
+    while (len(t_fi) > 0):
+        t = t_fi[0]
+        del_i = []
+        for i in range(0, len(t_fi)):
+            if len(list_intersect(t, t_fi[i])) > 0:
+                t = list_union(t, t_fi[i])
+                del_i.append(i)
+        t_fi = numpy.delete(numpy.array(t_fi), tuple(del_i), 0)
+        si = []
+        for i in range(0, len(fi)):
+            if len(list_intersect(t, fi[i])) > 0:
+                si.append(i)
+        c_cor_index.append(si)
+    return c_cor_index
+
+
+def grid_triangles(rows, cols, start):
+    # triangulated height field, faces in row major order
+    index = start + numpy.arange((rows + 1) * (cols + 1)).reshape(rows + 1, cols + 1)
+    a, b = index[:-1, :-1].ravel(), index[:-1, 1:].ravel()
+    c, d = index[1:, :-1].ravel(), index[1:, 1:].ravel()
+    return numpy.stack([numpy.stack([a, b, d], 1), numpy.stack([a, d, c], 1)], 1).reshape(-1, 3)
+
+
+def curved_roofs():
+    return numpy.concatenate([grid_triangles(6, 9, 0), grid_triangles(4, 4, 70),
+                              grid_triangles(1, 1, 100), grid_triangles(8, 3, 110)])
+
+
+def test_cluster_faces_matches_loop():
+    fi = curved_roofs()
+    expected = cluster_faces_loop(fi)
+    result = cluster_faces(fi)
+    assert len(result) == len(expected) == 4
+    for r, e in zip(result, expected):
+        numpy.testing.assert_array_equal(r, e)
+
+
+def test_cluster_faces_any_order():
+    fi = curved_roofs()
+    groups = set(frozenset(g.tolist()) for g in cluster_faces(fi))
+    order = numpy.random.RandomState(0).permutation(len(fi))
+    result = cluster_faces(fi[order])
+    # groups follow their first face and list their faces in order
+    assert [g[0] for g in result] == sorted(g[0] for g in result)
+    assert all(numpy.all(numpy.diff(g) > 0) for g in result)
+    assert set(frozenset(order[g].tolist()) for g in result) == groups
+    assert cluster_faces(numpy.zeros((0, 3))) == []
@@ -0,0 +1,75 @@
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+import copy
+
+import numpy
+
+from danesfield.surface import base_surface
+from danesfield.surface.poly_functions import check_relation, fix_height, get_difference_plane
+
+
+def split_surface_pairwise(building):
+    # every pair of planes, the version the bounding box search replaced
+    for i in range(0, building.surface_num):
+        for j in range(0, building.surface_num):
+            if i != j:
+                relationship_flag = check_relation(
+                    building.topsurface[i].point_cor[:, 0:2],
+                    building.topsurface[j].point_cor[:, 0:2])
+                if relationship_flag == 2:
+                    try:
+                        rst = get_difference_plane(
+                            building.topsurface[i].point_cor, building.topsurface[j].point_cor)
+                        if rst[0]:
+                            building.topsurface[j].point_cor = \
+                                fix_height(building.topsurface[j].point_cor, rst[1])
+                            building.topsurface.append(
+                                base_surface.Surface(fix_height(building.topsurface[j].point_cor,
+                                                                rst[2])))
+                            building.surface_num += 1
+                    except Exception as e:
+                        print(e)
+
+
+def roof_building(rows, cols, seed=0):
+    # a grid of sloped roof planes, some of them overlapping their neighbours
+    rng = numpy.random.RandomState(seed)
+    building = base_surface.Building()
+    for r in range(rows):
+        for c in range(cols):
+            x0, y0 = c * 10 + rng.uniform(-1, 1), r * 10 + rng.uniform(-1, 1)
+            w, h = rng.uniform(6, 14, 2)
+            xy = numpy.array([[x0, y0], [x0 + w, y0], [x0 + w, y0 + h], [x0, y0 + h]])
+            a, b = rng.uniform(-0.3, 0.3, 2)
+            z = 20 + a * xy[:, 0] + b * xy[:, 1]
+            building.add_topsurface(base_surface.Surface(numpy.c_[xy, z] + [5e5, 4e6, 0]))
+    return building
+
+
+def test_split_surface_matches_pairwise():
+    for seed in range(3):
+        building = roof_building(8, 8, seed)
+        expected = copy.deepcopy(building)
+        split_surface_pairwise(expected)
+        building.split_surface()
+        assert building.surface_num == expected.surface_num > 64
+        for surf, expected_surf in zip(building.topsurface, expected.topsurface):
+            numpy.testing.assert_array_equal(surf.point_cor, expected_surf.point_cor)
+
+
+if __name__ == '__main__':
+    import time
+    for rows, cols in [(10, 10), (15, 20), (20, 30)]:
+        building = roof_building(rows, cols)
+        expected = copy.deepcopy(building)
+        now = time.time()
+        split_surface_pairwise(expected)
+        pairwise = time.time() - now
+        now = time.time()
+        building.split_surface()
+        print('{} planes: pairwise {:.2f}s, box candidates {:.2f}s'.format(
+            rows * cols, pairwise, time.time() - now))
@@ -0,0 +1,106 @@
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+import numpy
+
+from danesfield.geon_fitting.tf_ops import cpu_ops
+
+
+# Straight ports of the CUDA kernels, used as the reference semantics
+
+def fps_kernel(npoint, xyz):
+    b, n, _ = xyz.shape
+    idx = numpy.zeros((b, npoint), dtype=numpy.int32)
+    for i in range(b):
+        temp = numpy.full(n, 1e38, dtype=numpy.float32)
+        old = 0
+        for j in range(1, npoint):
+            best, besti = -1, 0
+            for k in range(n):
+                d = numpy.float32(numpy.sum((xyz[i, k] - xyz[i, old]) ** 2))
+                temp[k] = min(d, temp[k])
+                if temp[k] > best:
+                    best, besti = temp[k], k
+            old = besti
+            idx[i, j] = old
+    return idx
+
+
+def ball_query_kernel(radius, nsample, xyz1, xyz2):
+    b, m, _ = xyz2.shape
+    idx = numpy.zeros((b, m, nsample), dtype=numpy.int32)
+    cnt = numpy.zeros((b, m), dtype=numpy.int32)
+    for i in range(b):
+        for j in range(m):
+            c = 0
+            for k in range(xyz1.shape[1]):
+                if c == nsample:
+                    break
+                d = max(numpy.sqrt(numpy.sum((xyz2[i, j] - xyz1[i, k]) ** 2)), 1e-20)
+                if d < radius:
+                    if c == 0:
+                        idx[i, j, :] = k
+                    idx[i, j, c] = k
+                    c += 1
+            cnt[i, j] = c
+    return idx, cnt
+
+
+def three_nn_kernel(xyz1, xyz2):
+    b, n, _ = xyz1.shape
+    dist = numpy.zeros((b, n, 3), dtype=numpy.float32)
+    idx = numpy.zeros((b, n, 3), dtype=numpy.int32)
+    for i in range(b):
+        for j in range(n):
+            d = numpy.sum((xyz2[i] - xyz1[i, j]) ** 2, axis=-1)
+            order = numpy.argsort(d, kind='stable')[:3]
+            idx[i, j] = order
+            dist[i, j] = d[order]
+    return dist, idx
+
+
+def fixture(b=2, n=64, m=16, seed=0):
+    rng = numpy.random.RandomState(seed)
+    return (rng.random_sample((b, n, 3)).astype(numpy.float32),
+            rng.random_sample((b, m, 3)).astype(numpy.float32))
+
+
+def test_farthest_point_sample():
+    xyz, _ = fixture()
+    numpy.testing.assert_array_equal(cpu_ops.farthest_point_sample(12, xyz),
+                                     fps_kernel(12, xyz))
+
+
+def test_query_ball_point():
+    xyz1, xyz2 = fixture()
+    for radius, nsample in [(0.2, 8), (0.35, 4), (0.01, 4)]:
+        idx, cnt = cpu_ops.query_ball_point(radius, nsample, xyz1, xyz2)
+        ref_idx, ref_cnt = ball_query_kernel(radius, nsample, xyz1, xyz2)
+        numpy.testing.assert_array_equal(idx, ref_idx)
+        numpy.testing.assert_array_equal(cnt, ref_cnt)
+
+
+def test_group_and_gather_point():
+    xyz1, xyz2 = fixture()
+    idx, _ = cpu_ops.query_ball_point(0.3, 8, xyz1, xyz2)
+    grouped = cpu_ops.group_point(xyz1, idx)
+    assert grouped.shape == (2, 16, 8, 3)
+    numpy.testing.assert_array_equal(grouped[1, 3, 5], xyz1[1, idx[1, 3, 5]])
+    gathered = cpu_ops.gather_point(xyz1, idx[:, :, 0])
+    numpy.testing.assert_array_equal(gathered[0, 7], xyz1[0, idx[0, 7, 0]])
+
+
+def test_three_nn_and_interpolate():
+    xyz1, xyz2 = fixture()
+    dist, idx = cpu_ops.three_nn(xyz1, xyz2)
+    ref_dist, ref_idx = three_nn_kernel(xyz1, xyz2)
+    numpy.testing.assert_array_equal(idx, ref_idx)
+    numpy.testing.assert_allclose(dist, ref_dist, rtol=1e-5)
+
+    points = numpy.arange(2 * 16 * 2, dtype=numpy.float32).reshape(2, 16, 2)
+    weight = numpy.full(idx.shape, 1 / 3., dtype=numpy.float32)
+    out = cpu_ops.three_interpolate(points, idx, weight)
+    numpy.testing.assert_allclose(out[1, 10], points[1, idx[1, 10]].mean(axis=0), rtol=1e-6)
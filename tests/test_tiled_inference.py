@@ -0,0 +1,113 @@
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+import numpy
+import pytest
+
+torch = pytest.importorskip('torch')
+from danesfield.segmentation.semantic.tasks import tiled_inference  # noqa: E402
+
+
+def conv_model(kernel_size, seed=0):
+    torch.manual_seed(seed)
+    model = torch.nn.Conv2d(3, 2, kernel_size, padding=kernel_size // 2)
+    model.eval()
+    return model
+
+
+def predict_loop(model, batch, flips):
+    # one forward pass per flip variant, like seval.predict
+    def lr(x):
+        return x.flip(3)
+
+    def ud(x):
+        return x.flip(2)
+    masks = [model(batch)]
+    if flips > tiled_inference.flip.FLIP_NONE:
+        masks.append(lr(model(lr(batch))))
+        if flips > tiled_inference.flip.FLIP_LR:
+            masks.append(ud(model(ud(batch))))
+            masks.append(ud(lr(model(ud(lr(batch))))))
+    return torch.sigmoid(torch.mean(torch.stack(masks, 0), 0)).numpy()
+
+
+def test_tile_origins():
+    for length in [1, 16, 17, 40, 100, 1000]:
+        for tile_size, overlap in [(16, 0), (16, 5), (16, 15), (64, 8)]:
+            origins = tiled_inference.tile_origins(length, tile_size, overlap)
+            assert origins[0] == 0
+            if length <= tile_size:
+                assert origins == [0]
+                continue
+            assert origins[-1] == length - tile_size
+            starts = numpy.array(origins)
+            assert (numpy.diff(starts) > 0).all()
+            # neighbours share at least overlap pixels, so every pixel is covered
+            assert (starts[:-1] + tile_size - starts[1:] >= overlap).all()
+    with pytest.raises(ValueError):
+        tiled_inference.tile_origins(100, 16, 16)
+
+
+def test_blend_window_partition_of_unity():
+    rows, cols, tile_size, overlap = 70, 45, 16, 6
+    origins = [(r, c) for r in tiled_inference.tile_origins(rows, tile_size, overlap)
+               for c in tiled_inference.tile_origins(cols, tile_size, overlap)]
+    for kind in ['cosine', 'gaussian', 'none']:
+        window = tiled_inference.blend_window(tile_size, kind)
+        assert window.shape == (tile_size, tile_size) and (window > 0).all()
+        weights = numpy.zeros((rows, cols))
+        for r, c in origins:
+            weights[r:r + tile_size, c:c + tile_size] += window
+        assert (weights > 0).all()
+        total = numpy.zeros((rows, cols))
+        for r, c in origins:
+            total[r:r + tile_size, c:c + tile_size] += (
+                window / weights[r:r + tile_size, c:c + tile_size])
+        numpy.testing.assert_allclose(total, 1, rtol=1e-6)
+
+
+def test_tta_forward_matches_predict():
+    model = conv_model(3)
+    batch = torch.from_numpy(numpy.random.RandomState(1).normal(size=(2, 3, 12, 17))
+                             .astype(numpy.float32))
+    try:
+        from danesfield.segmentation.semantic.tasks import seval
+    except ImportError:
+        seval = None
+    with torch.no_grad():
+        for flips in [0, 1, 2]:
+            result = tiled_inference.tta_forward(model, batch, flips).numpy()
+            numpy.testing.assert_allclose(result, predict_loop(model, batch, flips),
+                                          rtol=1e-5, atol=1e-6)
+            if seval is not None:
+                numpy.testing.assert_allclose(result, seval.predict(model, batch, flips),
+                                              rtol=1e-5, atol=1e-6)
+        # flips change the result of a model that is not flip invariant
+        assert not numpy.allclose(result, predict_loop(model, batch, 0))
+
+
+def test_tiled_predictor_pointwise_model():
+    # with a per pixel model every tile agrees, blending gives the full image
+    model = conv_model(1)
+    image = numpy.random.RandomState(2).normal(size=(3, 50, 37)).astype(numpy.float32)
+    with torch.no_grad():
+        expected = torch.sigmoid(model(torch.from_numpy(image[None]))).numpy()[0]
+    for tile_size, overlap, batch_size in [(16, 5, 3), (20, 0, 1), (64, 8, 4)]:
+        predictor = tiled_inference.TiledPredictor(model, tile_size, overlap, batch_size,
+                                                   flips=0, device='cpu')
+        result = predictor.predict(image)
+        assert result.shape == expected.shape
+        numpy.testing.assert_allclose(result, expected, rtol=1e-5, atol=1e-6)
+        assert predictor.throughput > 0
+
+
+if __name__ == '__main__':
+    from danesfield.segmentation.semantic.models import resnet_unet
+    image = numpy.random.RandomState(0).rand(5, 2048, 2048).astype(numpy.float32)
+    model = resnet_unet.ResnetUNet(num_classes=1, num_channels=5)
+    for flips, batch_size in [(0, 1), (0, 4), (2, 1)]:
+        print('flips {}, {} tiles per batch'.format(flips, batch_size))
+        tiled_inference.benchmark(model, image, flips=flips, batch_size=batch_size)
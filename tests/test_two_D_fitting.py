@@ -0,0 +1,147 @@
+###############################################################################
+# Copyright Kitware Inc. and Contributors
+# Distributed under the Apache License, 2.0 (apache.org/licenses/LICENSE-2.0)
+# See accompanying Copyright.txt and LICENSE files for details
+###############################################################################
+
+import numpy
+
+from danesfield.geon_fitting.tensorflow import two_D_fitting
+
+
+# Per-point versions the vectorized routines replaced
+
+def interval_cluster_1d_loop(points_1d, max_interval):
+    sorted_index = numpy.argsort(points_1d)
+    indices_list = []
+    start = 0
+    for i in range(1, sorted_index.shape[0]):
+        if abs(points_1d[sorted_index[i]] - points_1d[sorted_index[i-1]]) > max_interval:
+            indices_list.append(sorted_index[start:i])
+            start = i
+    indices_list.append(sorted_index[start:len(points_1d)])
+    return indices_list
+
+
+def get_z_length_loop(points_z, fitted_indices):
+    start = int(numpy.floor(min(points_z)))
+    hist, bin_edges = numpy.histogram(points_z, bins=range(
+        start, int(numpy.ceil(max(points_z))), 5))
+    survivors = numpy.asarray([i for i in range(len(points_z))
+                               if two_D_fitting.survive(points_z[i], hist, bin_edges, start, 5,
+                                                        cut_threshold_ratio=0.1)])
+    indices_lst = interval_cluster_1d_loop(points_z[survivors], 10)
+    min_lst = [min(points_z[survivors[indices]]) for indices in indices_lst]
+    max_lst = [max(points_z[survivors[indices]]) for indices in indices_lst]
+    fitted_indices_lst = [fitted_indices[survivors[indices]] for indices in indices_lst]
+    return min_lst, max_lst, fitted_indices_lst
+
+
+def roof_segment_z(seed=0):
+    # two dense runs of points along the axis, a sparse bridge and outliers
+    rng = numpy.random.RandomState(seed)
+    return numpy.concatenate([rng.uniform(-40, -5, 3000),
+                              rng.uniform(20, 60, 4000),
+                              rng.uniform(-5, 20, 15),
+                              rng.uniform(80, 200, 10)])
+
+
+def test_interval_cluster_1d():
+    points_z = roof_segment_z()
+    expected = interval_cluster_1d_loop(points_z, 2)
+    result = two_D_fitting.interval_cluster_1d(points_z, 2)
+    assert len(result) == len(expected)
+    for r, e in zip(result, expected):
+        numpy.testing.assert_array_equal(r, e)
+
+
+def test_get_z_length():
+    for seed in range(3):
+        points_z = roof_segment_z(seed)
+        fitted_indices = numpy.arange(len(points_z)) * 2
+        expected = get_z_length_loop(points_z, fitted_indices)
+        result = two_D_fitting.get_z_length(points_z, fitted_indices)
+        numpy.testing.assert_array_equal(result[0], expected[0])
+        numpy.testing.assert_array_equal(result[1], expected[1])
+        assert len(result[2]) == len(expected[2])
+        for r, e in zip(result[2], expected[2]):
+            numpy.testing.assert_array_equal(r, e)
+
+
+def test_check_2D_curve_extent():
+    rng = numpy.random.RandomState(1)
+    x = numpy.concatenate([rng.uniform(-10, 10, 2000), rng.uniform(10, 30, 20)])
+    y = 0.05 * x ** 2 + rng.normal(0, 0.1, len(x))
+    z = rng.uniform(-5, 5, len(x))
+    points = numpy.stack([x, y, z], axis=1)
+    fitted, x_max, x_min, error = two_D_fitting.check_2D_curve(
+        numpy.array([1., 0, 0]), numpy.array([0, 1., 0]), numpy.array([0, 0, 1.]),
+        [0.05, 0, 0], numpy.zeros(3), points, -10, 10)
+    assert len(fitted) == len(x)
+    # the sparse tail past x=10 is cut by the 20% histogram threshold
+    assert -10.5 < x_min < -9 and 9 < x_max < 11
+
+
+def nearest_on_curve(curve, point, lo, hi):
+    # dense sampling of a parametric curve, then golden section refinement
+    from scipy.optimize import minimize_scalar
+    t = numpy.linspace(lo, hi, 20001)
+    xy = curve(t)
+    d = numpy.hypot(xy[0] - point[0], xy[1] - point[1])
+    i = numpy.argmin(d)
+    step = (hi - lo) / 20000
+    res = minimize_scalar(lambda s: numpy.hypot(*(curve(s) - point)),
+                          bounds=(t[i] - step, t[i] + step), method='bounded',
+                          options={'xatol': 1e-13})
+    return res.fun
+
+
+def test_ellipse_distance():
+    rng = numpy.random.RandomState(2)
+    center = numpy.array([0.5, -1.0])
+    points = center + rng.uniform(-8, 8, (200, 2))
+    # points on the axes and at the center take the special cases
+    points = numpy.concatenate([points, center + [[0, 0], [1.5, 0], [-7, 0], [0, 1], [0, -6]]])
+    for width, height in [(5., 2.), (2., 5.), (3., 3.)]:
+        def curve(t):
+            return numpy.array([center[0] + width * numpy.cos(t),
+                                center[1] + height * numpy.sin(t)])
+        dist = two_D_fitting.ellipse_distance(points, center, width, height)
+        expected = [nearest_on_curve(curve, p, 0, 2 * numpy.pi) for p in points]
+        numpy.testing.assert_allclose(dist, expected, rtol=0, atol=1e-6)
+
+
+def test_parabola_distance():
+    rng = numpy.random.RandomState(3)
+    points = rng.uniform(-6, 6, (200, 2))
+    for coefficients in [(0.3, -0.2, 1.0), (-1.5, 0.5, 0.0), (0, 0.5, 1.0)]:
+        def curve(t):
+            return numpy.array([t, numpy.polyval(coefficients, t)])
+        dist = two_D_fitting.parabola_distance(points, coefficients)
+        expected = [nearest_on_curve(curve, p, -20, 20) for p in points]
+        numpy.testing.assert_allclose(dist, expected, rtol=0, atol=1e-6)
+
+
+def test_ellipse_residual_matches_cobyla():
+    rng = numpy.random.RandomState(4)
+    t = rng.uniform(0, 2 * numpy.pi, 40)
+    center, width, height = numpy.array([1., 2.]), 4., 2.5
+    points = numpy.stack([center[0] + width * numpy.cos(t),
+                          center[1] + height * numpy.sin(t)], axis=1)
+    points += rng.normal(0, 0.05, points.shape)
+
+    def elip(X, P):
+        P_cond = (P[0] - center[0]) ** 2 / width ** 2 + \
+            (P[1] - center[1]) ** 2 / height ** 2 - 1
+        X_cond = (X[0] - center[0]) ** 2 / width ** 2 + \
+            (X[1] - center[1]) ** 2 / height ** 2 - 1
+        if P_cond >= 0:
+            return -1 * X_cond
+        return X_cond
+    residual, indices = two_D_fitting.dist_residual(
+        two_D_fitting.ellipse_distance(points, center, width, height), 0.05)
+    expected_residual, expected_indices = two_D_fitting.find_min_dist_residual(
+        elip, points, 0.05)
+    # cobyla stops at its own tolerance, points right at the threshold may flip
+    assert len(set(indices) ^ set(expected_indices)) <= 2
+    assert abs(residual - expected_residual) < 1e-3
@@ -8,161 +8,30 @@
 
 
 import argparse
-import gdal
 import numpy
 import logging
 import os
 import re
-import vtk
-from vtk.numpy_interface import dataset_adapter as dsa
-from vtk.util import numpy_support
-from danesfield import gdal_utils
-
-
-def main(args):
-    parser = argparse.ArgumentParser(
-        description='Render a DSM from a DTM and polygons representing buildings.')
-    parser.add_argument("--input_vtp_path", type=str,
-                        help="Input buildings polygonal file (.vtp)")
-    parser.add_argument("--input_obj_paths", nargs="*",
-                        help="List of input building (.obj) file paths.  "
-                             "Building object files start "
-                             "with a digit, road object files start with \"Road\". "
-                             "All obj files start with comments specifying the offsets "
-                             "that are added the coordinats. There are three comment lines, "
-                             "one for each coordinate: \"#c offset: value\" where c is x, y and z.")
-    parser.add_argument("input_dtm", help="Input digital terain model (DTM)")
-    parser.add_argument("output_dsm", help="Output digital surface model (DSM)")
-    parser.add_argument("--render_png", action="store_true",
-                        help="Do not save the DSM, render into a PNG instead.")
-    parser.add_argument("--render_cls", action="store_true",
-                        help="Render a buildings mask: render buildings label (6), "
-                             "background (2) and no DTM.")
-    parser.add_argument("--buildings_only", action="store_true",
-                        help="Do not use the DTM, use only the buildings.")
-    parser.add_argument("--debug", action="store_true",
-                        help="Save intermediate results")
-    args = parser.parse_args(args)
-
-    # open the DTM
-    dtm = gdal.Open(args.input_dtm, gdal.GA_ReadOnly)
-    if not dtm:
-        raise RuntimeError("Error: Failed to open DTM {}".format(args.input_dtm))
-
-    dtmDriver = dtm.GetDriver()
-    dtmDriverMetadata = dtmDriver.GetMetadata()
-    dsm = None
-    dtmBounds = [0.0, 0.0, 0.0, 0.0]
-    if dtmDriverMetadata.get(gdal.DCAP_CREATE) == "YES":
-        print("Create destination image "
-              "size:({}, {}) ...".format(dtm.RasterXSize,
-                                         dtm.RasterYSize))
-        # georeference information
-        projection = dtm.GetProjection()
-        transform = dtm.GetGeoTransform()
-        gcpProjection = dtm.GetGCPProjection()
-        gcps = dtm.GetGCPs()
-        options = ["COMPRESS=DEFLATE"]
-        # ensure that space will be reserved for geographic corner coordinates
-        # (in DMS) to be set later
-        if (dtmDriver.ShortName == "NITF" and not projection):
-            options.append("ICORDS=G")
-        if args.render_cls:
-            eType = gdal.GDT_Byte
-        else:
-            eType = gdal.GDT_Float32
-        dsm = dtmDriver.Create(
-            args.output_dsm, xsize=dtm.RasterXSize,
-            ysize=dtm.RasterYSize, bands=1, eType=eType,
-            options=options)
-        if (projection):
-            # georeference through affine geotransform
-            dsm.SetProjection(projection)
-            dsm.SetGeoTransform(transform)
-        else:
-            # georeference through GCPs
-            dsm.SetGCPs(gcps, gcpProjection)
-            gdal.GCPsToGeoTransform(gcps, transform)
-        corners = [[0, 0], [0, dtm.RasterYSize],
-                   [dtm.RasterXSize, dtm.RasterYSize], [dtm.RasterXSize, 0]]
-        geoCorners = numpy.zeros((4, 2))
-        for i, corner in enumerate(corners):
-            geoCorners[i] = [
-                transform[0] + corner[0] * transform[1] +
-                corner[1] * transform[2],
-                transform[3] + corner[0] * transform[4] +
-                corner[1] * transform[5]]
-        dtmBounds[0] = numpy.min(geoCorners[:, 0])
-        dtmBounds[1] = numpy.max(geoCorners[:, 0])
-        dtmBounds[2] = numpy.min(geoCorners[:, 1])
-        dtmBounds[3] = numpy.max(geoCorners[:, 1])
-
-        if args.render_cls:
-            # label for no building
-            dtmRaster = numpy.full([dtm.RasterYSize, dtm.RasterXSize], 2)
-            nodata = 0
-        else:
-            print("Reading the DTM {} size: ({}, {})\n"
-                  "\tbounds: ({}, {}), ({}, {})...".format(
-                      args.input_dtm, dtm.RasterXSize, dtm.RasterYSize,
-                      dtmBounds[0], dtmBounds[1],
-                      dtmBounds[2], dtmBounds[3]))
-            dtmRaster = dtm.GetRasterBand(1).ReadAsArray()
-            nodata = dtm.GetRasterBand(1).GetNoDataValue()
-        print("Nodata: {}".format(nodata))
-    else:
-        raise RuntimeError("Driver {} does not supports Create().".format(dtmDriver))
-
-    # read the buildings polydata, set Z as a scalar and project to XY plane
-    print("Reading the buildings ...")
-    # labels for buildings and elevated roads
-    labels = [6, 17]
-    if (args.input_vtp_path and os.path.isfile(args.input_vtp_path)):
-        polyReader = vtk.vtkXMLPolyDataReader()
-        polyReader.SetFileName(args.input_vtp_path)
-        polyReader.Update()
-        polyVtkList = [polyReader.GetOutput()]
-    elif (args.input_obj_paths):
-        # buildings start with numbers
-        # optional elevated roads start with Road*.obj
-        bldg_re = re.compile(".*/?[0-9][^/]*\\.obj")
-        bldg_files = [f for f in args.input_obj_paths
-                      if bldg_re.match(f)]
-        print(bldg_files)
-        road_re = re.compile(".*/?Road[^/]*\\.obj")
-        road_files = [f for f in args.input_obj_paths
-                      if road_re.match(f)]
-        files = [bldg_files,
-                 road_files]
-        files = [x for x in files if x]
-        print(road_files)
-        if len(files) >= 2:
-            print("Found {} buildings and {} roads".format(len(files[0]), len(files[1])))
-        elif len(files) == 1:
-            print("Found {} buildings".format(len(files[0])))
-        else:
-            raise RuntimeError("No OBJ files found in {}".format(args.input_obj_paths))
-        polyVtkList = []
-        for category in range(len(files)):
-            append = vtk.vtkAppendPolyData()
-            for i, fileName in enumerate(files[category]):
-                offset = [0.0, 0.0, 0.0]
-                gdal_utils.read_offset(fileName, offset)
-                print("Offset: {}".format(offset))
-                transform = vtk.vtkTransform()
-                transform.Translate(offset[0], offset[1], offset[2])
-
-                objReader = vtk.vtkOBJReader()
-                objReader.SetFileName(fileName)
-                transformFilter = vtk.vtkTransformFilter()
-                transformFilter.SetTransform(transform)
-                transformFilter.SetInputConnection(objReader.GetOutputPort())
-                append.AddInputConnection(transformFilter.GetOutputPort())
-            append.Update()
-            polyVtkList.append(append.GetOutput())
-    else:
-        raise RuntimeError("Must provide either --input_vtp_path, or --input_obj_paths")
-
+import time
+try:
+    import gdal
+except ImportError:
+    gdal = None
+try:
+    import vtk
+    from vtk.numpy_interface import dataset_adapter as dsa
+    from vtk.util import numpy_support
+except ImportError:
+    vtk = None
+from danesfield import mesh_raster
+from danesfield import obj_io
+
+
+def render_vtk(args, polyVtkList, labels, dtm, dtmBounds):
+    """Render the buildings with VTK: into a PNG with --render_png, else
+    into a floating point buffer with vtkValuePass, returned as the
+    elevation (or label) raster with NaN where there is no building.
+    """
     arrayName = "Elevation"
     append = vtk.vtkAppendPolyData()
     for category in range(len(polyVtkList)):
@@ -290,7 +159,9 @@ def main(args):
         camera.SetPosition(position)
 
         valuePass = vtk.vtkValuePass()
-        valuePass.SetRenderingMode(vtk.vtkValuePass.FLOATING_POINT)
+        if hasattr(valuePass, "SetRenderingMode"):
+            # VTK 9 always renders floating point values
+            valuePass.SetRenderingMode(vtk.vtkValuePass.FLOATING_POINT)
         # use the default scalar for point data
         valuePass.SetInputComponentToProcess(0)
         valuePass.SetInputArrayToProcess(vtk.VTK_SCALAR_MODE_USE_POINT_FIELD_DATA,
@@ -319,14 +190,317 @@ def main(args):
         elevation = numpy.transpose(elevationTranspose)
         # numpy rows increase as you go down, Y for VTK images increases as you go up
         elevation = numpy.flip(elevation, 0)
-        if args.buildings_only:
-            dsmElevation = elevation
+        return elevation
+
+
+def legacy_cell_offsets(cells):
+    """Offsets of the cells of a legacy cell array (n, i_1, ..., i_n, n, ...)
+    and the positions of their point ids in it. The start of each cell is
+    found by pointer doubling: every position jumps to the next cell start
+    as if a cell started there, and the jumps are composed until the chain
+    from position 0 has been followed to the end.
+    """
+    size = len(cells)
+    # jump[p]: next cell start if a cell starts at p, size past the end
+    index_type = numpy.int32 if size < 2 ** 31 - 1 else numpy.int64
+    jump = numpy.empty(size + 1, dtype=index_type)
+    numpy.minimum(numpy.arange(1, size + 1) + numpy.maximum(cells, 0), size, out=jump[:-1],
+                  casting='unsafe')
+    jump[-1] = size
+    # the first 2**k starts, extended by the 2**k that follow them
+    starts = numpy.zeros(1 if size else 0, dtype=index_type)
+    while True:
+        reached = jump[starts]
+        reached = reached[reached < size]
+        if not len(reached):
+            break
+        starts = numpy.concatenate((starts, reached))
+        jump = jump[jump]
+    starts = numpy.sort(starts).astype(numpy.int64)
+    counts = cells[starts]
+    offsets = numpy.zeros(len(starts) + 1, dtype=numpy.int64)
+    numpy.cumsum(counts, out=offsets[1:])
+    # positions of the point ids: cell start + 1 + rank in the cell
+    positions = numpy.arange(offsets[-1]) + numpy.repeat(starts + 1 - offsets[:-1], counts)
+    return offsets, positions
+
+
+def polydata_mesh(poly):
+    """Vertices and polygons of a vtkPolyData, as (vertices, indices, offsets)"""
+    vertices = numpy_support.vtk_to_numpy(poly.GetPoints().GetData()).astype(numpy.float64)
+    polys = poly.GetPolys()
+    if hasattr(polys, "GetOffsetsArray"):
+        # VTK 9: offsets and connectivity arrays
+        offsets = numpy_support.vtk_to_numpy(polys.GetOffsetsArray()).astype(numpy.int64)
+        indices = numpy_support.vtk_to_numpy(polys.GetConnectivityArray()).astype(numpy.int64)
+        if not len(offsets):
+            offsets = numpy.zeros(1, dtype=numpy.int64)
+        return vertices, indices, offsets
+    cells = numpy_support.vtk_to_numpy(polys.GetData()).astype(numpy.int64)
+    offsets, positions = legacy_cell_offsets(cells)
+    return vertices, cells[positions], offsets
+
+
+def read_obj_meshes(file_names, cache=True):
+    """Vertices and polygons of OBJ files translated by their offset,
+    as one (vertices, indices, offsets) mesh. Each file is parsed once,
+    then loaded from its .npz cache (see obj_io.load_obj).
+    """
+    vertices = []
+    indices = []
+    offsets = [numpy.zeros(1, dtype=numpy.int64)]
+    nb_vertices = 0
+    for fileName in file_names:
+        mesh_vertices, mesh_indices, mesh_offsets = obj_io.load_obj(fileName, cache)
+        vertices.append(mesh_vertices)
+        indices.append(mesh_indices + nb_vertices)
+        offsets.append(mesh_offsets[1:] + offsets[-1][-1])
+        nb_vertices += len(mesh_vertices)
+    if not file_names:
+        return numpy.zeros((0, 3)), numpy.zeros(0, dtype=numpy.int64), offsets[0]
+    return (numpy.concatenate(vertices), numpy.concatenate(indices),
+            numpy.concatenate(offsets))
+
+
+def mesh_polydata(vertices, indices, offsets):
+    """vtkPolyData with the polygons of a (vertices, indices, offsets) mesh"""
+    points = vtk.vtkPoints()
+    points.SetData(numpy_support.numpy_to_vtk(vertices, deep=1))
+    polys = vtk.vtkCellArray()
+    if hasattr(polys, "GetOffsetsArray"):
+        # VTK 9: offsets and connectivity arrays
+        polys.SetData(
+            numpy_support.numpy_to_vtkIdTypeArray(offsets.astype(numpy.int64), deep=1),
+            numpy_support.numpy_to_vtkIdTypeArray(indices.astype(numpy.int64), deep=1))
+    else:
+        # legacy cell array layout: n, i_1, ..., i_n, n, ...
+        counts = numpy.diff(offsets)
+        cells = numpy.insert(indices, offsets[:-1], counts).astype(numpy.int64)
+        polys.SetCells(len(counts), numpy_support.numpy_to_vtkIdTypeArray(cells, deep=1))
+    poly = vtk.vtkPolyData()
+    poly.SetPoints(points)
+    poly.SetPolys(polys)
+    return poly
+
+
+def render_numpy(meshes, labels, render_cls, geo_transform, shape, tile_size):
+    """Render the buildings with the numpy rasterizer like render_vtk: each
+    pixel gets the mean vertex elevation (or the label) of the highest
+    triangle at its center, NaN where there is no building.
+    """
+    vertices = []
+    triangles = []
+    values = []
+    nb_vertices = 0
+    for category, (mesh_vertices, indices, offsets) in enumerate(meshes):
+        mesh_triangles, polygon = mesh_raster.polygon_triangles(mesh_vertices, indices, offsets)
+        if render_cls:
+            # like render_vtk, the label is also the height used for the
+            # depth test, so roads are drawn over buildings
+            mesh_vertices = mesh_vertices.copy()
+            mesh_vertices[:, 2] = labels[category]
+            values.append(numpy.full(len(mesh_triangles), labels[category], dtype=numpy.float64))
         else:
-            # elevation has nans in places other than buildings
-            dsmElevation = numpy.fmax(dtmRaster, elevation)
-        dsm.GetRasterBand(1).WriteArray(dsmElevation)
-        if nodata:
-            dsm.GetRasterBand(1).SetNoDataValue(nodata)
+            values.append(mesh_vertices[mesh_triangles, 2].mean(axis=1))
+        vertices.append(mesh_vertices)
+        triangles.append(mesh_triangles + nb_vertices)
+        nb_vertices += len(mesh_vertices)
+    print("Rasterizing {} triangles ...".format(sum(len(t) for t in triangles)))
+    elevation, depth = mesh_raster.rasterize_triangles(
+        numpy.concatenate(vertices), numpy.concatenate(triangles), numpy.concatenate(values),
+        geo_transform, shape, tile_size)
+    return elevation.astype(numpy.float32)
+
+
+def compare_elevations(reference, elevation):
+    """Print the differences between two rendered rasters"""
+    both = ~numpy.isnan(reference) & ~numpy.isnan(elevation)
+    only = numpy.isnan(reference) != numpy.isnan(elevation)
+    difference = numpy.abs(reference[both] - elevation[both])
+    print("Pixels covered by one rasterizer only: {} ({:.3%})".format(
+        only.sum(), only.mean()))
+    if difference.size:
+        print("Pixels with different values: {} ({:.3%}), max difference {}".format(
+            (difference > 1e-3).sum(), (difference > 1e-3).mean(), difference.max()))
+
+
+def main(args):
+    parser = argparse.ArgumentParser(
+        description='Render a DSM from a DTM and polygons representing buildings.')
+    parser.add_argument("--input_vtp_path", type=str,
+                        help="Input buildings polygonal file (.vtp)")
+    parser.add_argument("--input_obj_paths", nargs="*",
+                        help="List of input building (.obj) file paths.  "
+                             "Building object files start "
+                             "with a digit, road object files start with \"Road\". "
+                             "All obj files start with comments specifying the offsets "
+                             "that are added the coordinats. There are three comment lines, "
+                             "one for each coordinate: \"#c offset: value\" where c is x, y and z.")
+    parser.add_argument("input_dtm", help="Input digital terain model (DTM)")
+    parser.add_argument("output_dsm", help="Output digital surface model (DSM)")
+    parser.add_argument("--render_png", action="store_true",
+                        help="Do not save the DSM, render into a PNG instead.")
+    parser.add_argument("--render_cls", action="store_true",
+                        help="Render a buildings mask: render buildings label (6), "
+                             "background (2) and no DTM.")
+    parser.add_argument("--buildings_only", action="store_true",
+                        help="Do not use the DTM, use only the buildings.")
+    parser.add_argument("--debug", action="store_true",
+                        help="Save intermediate results")
+    parser.add_argument("--rasterizer", choices=["vtk", "numpy"], default="vtk",
+                        help="Render the buildings with VTK (needs an OpenGL context) "
+                             "or with the numpy software rasterizer.")
+    parser.add_argument("--tile_size", type=int, default=2048,
+                        help="Tile size in pixels of the numpy rasterizer")
+    parser.add_argument("--no_mesh_cache", action="store_true",
+                        help="Do not read or write the .npz files caching the "
+                             "parsed OBJ meshes next to them.")
+    parser.add_argument("--compare_rasterizers", action="store_true",
+                        help="Render with both rasterizers, report their time and "
+                             "differences, save the --rasterizer result.")
+    args = parser.parse_args(args)
+    use_vtk = (args.rasterizer == "vtk" or args.render_png or args.compare_rasterizers)
+    if use_vtk and vtk is None:
+        raise RuntimeError("VTK is not available, use --rasterizer numpy")
+
+    # open the DTM
+    dtm = gdal.Open(args.input_dtm, gdal.GA_ReadOnly)
+    if not dtm:
+        raise RuntimeError("Error: Failed to open DTM {}".format(args.input_dtm))
+
+    dtmDriver = dtm.GetDriver()
+    dtmDriverMetadata = dtmDriver.GetMetadata()
+    dsm = None
+    dtmBounds = [0.0, 0.0, 0.0, 0.0]
+    if dtmDriverMetadata.get(gdal.DCAP_CREATE) == "YES":
+        print("Create destination image "
+              "size:({}, {}) ...".format(dtm.RasterXSize,
+                                         dtm.RasterYSize))
+        # georeference information
+        projection = dtm.GetProjection()
+        transform = dtm.GetGeoTransform()
+        gcpProjection = dtm.GetGCPProjection()
+        gcps = dtm.GetGCPs()
+        options = ["COMPRESS=DEFLATE"]
+        # ensure that space will be reserved for geographic corner coordinates
+        # (in DMS) to be set later
+        if (dtmDriver.ShortName == "NITF" and not projection):
+            options.append("ICORDS=G")
+        if args.render_cls:
+            eType = gdal.GDT_Byte
+        else:
+            eType = gdal.GDT_Float32
+        dsm = dtmDriver.Create(
+            args.output_dsm, xsize=dtm.RasterXSize,
+            ysize=dtm.RasterYSize, bands=1, eType=eType,
+            options=options)
+        if (projection):
+            # georeference through affine geotransform
+            dsm.SetProjection(projection)
+            dsm.SetGeoTransform(transform)
+        else:
+            # georeference through GCPs
+            dsm.SetGCPs(gcps, gcpProjection)
+            gdal.GCPsToGeoTransform(gcps, transform)
+        corners = [[0, 0], [0, dtm.RasterYSize],
+                   [dtm.RasterXSize, dtm.RasterYSize], [dtm.RasterXSize, 0]]
+        geoCorners = numpy.zeros((4, 2))
+        for i, corner in enumerate(corners):
+            geoCorners[i] = [
+                transform[0] + corner[0] * transform[1] +
+                corner[1] * transform[2],
+                transform[3] + corner[0] * transform[4] +
+                corner[1] * transform[5]]
+        dtmBounds[0] = numpy.min(geoCorners[:, 0])
+        dtmBounds[1] = numpy.max(geoCorners[:, 0])
+        dtmBounds[2] = numpy.min(geoCorners[:, 1])
+        dtmBounds[3] = numpy.max(geoCorners[:, 1])
+
+        if args.render_cls:
+            # label for no building
+            dtmRaster = numpy.full([dtm.RasterYSize, dtm.RasterXSize], 2)
+            nodata = 0
+        else:
+            print("Reading the DTM {} size: ({}, {})\n"
+                  "\tbounds: ({}, {}), ({}, {})...".format(
+                      args.input_dtm, dtm.RasterXSize, dtm.RasterYSize,
+                      dtmBounds[0], dtmBounds[1],
+                      dtmBounds[2], dtmBounds[3]))
+            dtmRaster = dtm.GetRasterBand(1).ReadAsArray()
+            nodata = dtm.GetRasterBand(1).GetNoDataValue()
+        print("Nodata: {}".format(nodata))
+    else:
+        raise RuntimeError("Driver {} does not supports Create().".format(dtmDriver))
+
+    # read the buildings polydata, set Z as a scalar and project to XY plane
+    print("Reading the buildings ...")
+    # labels for buildings and elevated roads
+    labels = [6, 17]
+    polyVtkList = []
+    meshes = []
+    if (args.input_vtp_path and os.path.isfile(args.input_vtp_path)):
+        if vtk is None:
+            raise RuntimeError("VTK is needed to read {}".format(args.input_vtp_path))
+        polyReader = vtk.vtkXMLPolyDataReader()
+        polyReader.SetFileName(args.input_vtp_path)
+        polyReader.Update()
+        polyVtkList = [polyReader.GetOutput()]
+        if args.rasterizer == "numpy" or args.compare_rasterizers:
+            meshes = [polydata_mesh(polyReader.GetOutput())]
+    elif (args.input_obj_paths):
+        # buildings start with numbers
+        # optional elevated roads start with Road*.obj
+        bldg_re = re.compile(".*/?[0-9][^/]*\\.obj")
+        bldg_files = [f for f in args.input_obj_paths
+                      if bldg_re.match(f)]
+        print(bldg_files)
+        road_re = re.compile(".*/?Road[^/]*\\.obj")
+        road_files = [f for f in args.input_obj_paths
+                      if road_re.match(f)]
+        files = [bldg_files,
+                 road_files]
+        files = [x for x in files if x]
+        print(road_files)
+        if len(files) >= 2:
+            print("Found {} buildings and {} roads".format(len(files[0]), len(files[1])))
+        elif len(files) == 1:
+            print("Found {} buildings".format(len(files[0])))
+        else:
+            raise RuntimeError("No OBJ files found in {}".format(args.input_obj_paths))
+        for category in range(len(files)):
+            meshes.append(read_obj_meshes(files[category], not args.no_mesh_cache))
+            if use_vtk:
+                polyVtkList.append(mesh_polydata(*meshes[-1]))
+    else:
+        raise RuntimeError("Must provide either --input_vtp_path, or --input_obj_paths")
+
+    elevations = {}
+    for rasterizer in ["vtk", "numpy"]:
+        if rasterizer != args.rasterizer and not args.compare_rasterizers:
+            continue
+        start = time.time()
+        if rasterizer == "vtk":
+            elevations[rasterizer] = render_vtk(args, polyVtkList, labels, dtm, dtmBounds)
+            if args.render_png:
+                return
+        else:
+            print("Render with the numpy rasterizer ...")
+            elevations[rasterizer] = render_numpy(
+                meshes, labels, args.render_cls, dtm.GetGeoTransform(),
+                (dtm.RasterYSize, dtm.RasterXSize), args.tile_size)
+        print("{} rendering time: {:.2f}s".format(rasterizer, time.time() - start))
+    if args.compare_rasterizers:
+        compare_elevations(elevations["vtk"], elevations["numpy"])
+    elevation = elevations[args.rasterizer]
+
+    if args.buildings_only:
+        dsmElevation = elevation
+    else:
+        # elevation has nans in places other than buildings
+        dsmElevation = numpy.fmax(dtmRaster, elevation)
+    dsm.GetRasterBand(1).WriteArray(dsmElevation)
+    if nodata:
+        dsm.GetRasterBand(1).SetNoDataValue(nodata)
 
 
 if __name__ == '__main__':
@@ -17,6 +17,9 @@ import scipy.ndimage
 import sys
 import cv2
 
+from danesfield import dtm_mesh
+from danesfield.obj_io import write_obj
+
 # This script generates a mesh from a DTM.
 # The DTM is downsampled by the parameter --downsample (40 by default)
 
@@ -30,6 +33,9 @@ def main(args):
                         help="Offset used to re-center the mesh")
     parser.add_argument("--downsample", action="store", type=int, default=40,
                         help="Downsampling factor for the DTM")
+    parser.add_argument("--max_error", action="store", type=float,
+                        help="Simplify the mesh, keeping it within this height "
+                        "of the downsampled DTM")
     args = parser.parse_args(args)
 
     dtm_file = args.dtm_file
@@ -44,51 +50,43 @@ def main(args):
     # read DTM image
     dtm = cv2.imread(dtm_file, cv2.IMREAD_LOAD_GDAL)
 
-    # smooth and downsample the DTM
+    # read DTM origin, scale and nodata value
+    gdal.AllRegister()
+    dataset = gdal.Open(dtm_file, gdalconst.GA_ReadOnly)
+    geo_transform = dataset.GetGeoTransform()
+    nodata = dataset.GetRasterBand(1).GetNoDataValue()
+
+    # smooth and downsample the DTM, samples smoothed with nodata pixels
+    # are left out of the mesh
     smooth_size = int(reduction_factor / 4)
     smooth_kernel = np.full((smooth_size, smooth_size),
                             1.0 / (smooth_size * smooth_size))
+    invalid = None
+    if nodata is not None:
+        invalid = scipy.ndimage.filters.convolve(
+            (dtm == nodata).astype(np.float32), smooth_kernel) > 0
     dtm = scipy.ndimage.filters.convolve(dtm, smooth_kernel)
     nb_u_samples = int(dtm.shape[1] / reduction_factor)
     nb_v_samples = int(dtm.shape[0] / reduction_factor)
     downsampled_u = np.linspace(0, dtm.shape[1] - 1, nb_u_samples)
     downsampled_v = np.linspace(0, dtm.shape[0] - 1, nb_v_samples)
-    dtm = dtm[downsampled_v.astype(int), :]
-    dtm = dtm[:, downsampled_u.astype(int)]
-
-    # read DTM origin and scale
-    gdal.AllRegister()
-    dataset = gdal.Open(dtm_file, gdalconst.GA_ReadOnly)
-    geo_transform = dataset.GetGeoTransform()
-    origin = np.array([geo_transform[0], geo_transform[3]])
-    scale = np.array([geo_transform[1], geo_transform[5]])
-
-    # build array of 3D points in utm world coordinates
-    x = np.tile(downsampled_u, nb_v_samples) * scale[0] + origin[0]
-    y = np.repeat(downsampled_v, nb_u_samples) * scale[1] + origin[1]
-    z = dtm.ravel()
-    xyz = np.vstack((x, y, z)).T
-
-    # translate points with the same offset
+    sample_rows = downsampled_v.astype(int)[:, None]
+    sample_cols = downsampled_u.astype(int)
+    dtm = dtm[sample_rows, sample_cols].astype(np.float64)
+    if invalid is not None:
+        dtm[invalid[sample_rows, sample_cols]] = np.nan
+
+    # build the grid mesh in utm world coordinates, translated by the offset
+    if args.max_error is None:
+        xyz, faces = dtm_mesh.grid_mesh(dtm, geo_transform, downsampled_u, downsampled_v)
+    else:
+        xyz, faces = dtm_mesh.simplified_grid_mesh(dtm, geo_transform, args.max_error,
+                                                   downsampled_u, downsampled_v)
+        print("Simplified mesh: {} triangles".format(len(faces)))
     xyz -= mesh_offset
 
-    # build list of faces
-    faces = []
-    for j in range(nb_v_samples-1):
-        for i in range(nb_u_samples-1):
-            id0 = j * nb_u_samples + i
-            id1 = id0 + 1
-            id2 = id0 + nb_u_samples
-            id3 = id2 + 1
-            faces.append([id0, id2, id1])
-            faces.append([id2, id3, id1])
-
     # write DTM mesh to OBJ file
-    with open(output_file, "w") as file:
-        for pt in xyz:
-            file.write("v " + str(pt[0]) + " " + str(pt[1]) + " " + str(pt[2]) + "\n")
-        for f in faces:
-            file.write("f " + str(f[0]+1) + " " + str(f[1]+1) + " " + str(f[2]+1) + "\n")
+    write_obj(output_file, xyz, faces)
     print("Done.")
 
 
@@ -9,21 +9,42 @@
 
 import sys
 import pickle
-import copy
 import argparse
+import multiprocessing
 
 from danesfield.geon_fitting.tensorflow import two_D_fitting
 from danesfield.geon_fitting.tensorflow import utils
 import numpy as np
-import pcl
-import matplotlib as mpl
-mpl.use('Agg')
-import matplotlib.pyplot as plt  # noqa: E402
+try:
+    import pcl
+except ImportError:
+    pcl = None
+
+geon_type_number = 4
+cylinder_index = 2
+sphere_index = 3
+point_number_scale = 1
+
+# columns of the geon table, in the order of the pickled 'model' lists
+GEON_COLUMNS = {
+    'poly_cylinder': ['centroid', 'ex', 'ey', 'coefficients', 'min_axis_z', 'max_axis_z',
+                      'ortho_x_min', 'ortho_x_max', 'num_points', 'mean_diff'],
+    'sphere': ['center', 'radius', 'min_z', 'max_z', 'num_points'],
+}
+
+
+def make_cloud(points):
+    cloud = pcl.PointCloud()
+    cloud.from_array(np.ascontiguousarray(points, dtype=np.float32))
+    return cloud
+
+
+def cloud_points(cloud):
+    return np.ascontiguousarray(cloud.to_array(), dtype=np.float32)
 
 
 def fit_cylinder(points, max_r=80, min_r=40):
-    section_pc = pcl.PointCloud()
-    section_pc.from_array(points)
+    section_pc = make_cloud(points)
 
     cylinder_seg = section_pc.make_segmenter_normals(ksearch=50)
     cylinder_seg.set_optimize_coefficients(True)
@@ -39,8 +60,7 @@ def fit_cylinder(points, max_r=80, min_r=40):
 
 
 def fit_sphere(points):
-    section_pc = pcl.PointCloud()
-    section_pc.from_array(points)
+    section_pc = make_cloud(points)
 
     sphere_seg = section_pc.make_segmenter_normals(ksearch=50)
     sphere_seg.set_optimize_coefficients(True)
@@ -105,6 +125,254 @@ def draw_sphere(ax, c, r, z_min, z_max):
     ax.plot_wireframe(x, y, z, color='r', alpha=0.5)
 
 
+def fit_cylinders(building_points, points, geon_model, fitted_index, plot_items):
+    current_cloud = make_cloud(points)
+
+    num_building_points = building_points.shape[0]
+    num_current_cylinder_point = current_cloud.size
+    if num_building_points > 15000:
+        vg = current_cloud.make_voxel_grid_filter()
+        vg.set_leaf_size(1, 1, 1)
+        current_cloud = vg.filter()
+
+    num_filtered_building_points = current_cloud.size
+    current_points = cloud_points(current_cloud)
+
+    if num_current_cylinder_point > 10000:
+        max_r = 80
+        min_r = 40
+    else:
+        max_r = 30
+        min_r = 10
+
+    while True:
+        cylinder_indices, cylinder_coefficients = fit_cylinder(
+            current_points, max_r, min_r)
+
+        if len(cylinder_indices) < 1000*point_number_scale:
+            break
+
+        cylinder_points = current_points[np.asarray(cylinder_indices)]
+
+        (centroid,
+         ex,
+         ey,
+         ez,
+         fitted_indices,
+         coefficients,
+         min_axis_z,
+         max_axis_z,
+         mean_diff) = two_D_fitting.fit_2D_curve(cylinder_coefficients[3:-1],
+                                                 cylinder_points,
+                                                 fit_type='poly2',
+                                                 dist_threshold=10)
+
+        for i in range(len(fitted_indices)):
+
+            if len(fitted_indices[i]) < max(500, 0.05*num_filtered_building_points):
+                continue
+
+            plot_items.append(('points', cylinder_points[fitted_indices[i]], 2))
+
+            (all_fitted_indices,
+             ortho_x_max,
+             ortho_x_min,
+             error) = two_D_fitting.check_2D_curve(ex,
+                                                   ey,
+                                                   ez,
+                                                   coefficients,
+                                                   centroid,
+                                                   building_points,
+                                                   min_axis_z[i],
+                                                   max_axis_z[i],
+                                                   fit_type='poly2')
+            fitted_index[all_fitted_indices] = True
+
+            geon_model.append({'name': 'poly_cylinder', 'model':
+                               [centroid, ex, ey, coefficients, min_axis_z[i],
+                                max_axis_z[i], ortho_x_min, ortho_x_max,
+                                len(fitted_indices[i]), mean_diff]})
+
+        current_cloud = current_cloud.extract(cylinder_indices, True)
+        if current_cloud.size < max(500, 0.1*num_filtered_building_points):
+            break
+        current_points = cloud_points(current_cloud)
+
+
+def fit_spheres(building_points, points, geon_model, fitted_index, plot_items):
+    current_cloud = make_cloud(points)
+
+    if building_points.shape[0] > 10000:
+        vg = current_cloud.make_voxel_grid_filter()
+        vg.set_leaf_size(1, 1, 1)
+        current_cloud = vg.filter()
+
+    current_points = cloud_points(current_cloud)
+
+    while True:
+        sphere_indices, sphere_coefficients, min_lst, max_lst = fit_sphere(
+            current_points)
+        if len(sphere_indices) < 200*point_number_scale:
+            break
+
+        if sphere_coefficients[-1] > 0:
+            plot_items.append(('sphere', (sphere_coefficients[0:3], sphere_coefficients[-1],
+                                          min_lst[0], max_lst[0]), 'r'))
+
+        plot_items.append(('points', current_points[np.asarray(sphere_indices)], 3))
+
+        geon_model.append({'name': 'sphere', 'model': [sphere_coefficients[0:3],
+                                                       sphere_coefficients[-1],
+                                                       min_lst[0],
+                                                       max_lst[0],
+                                                       len(sphere_indices)]})
+
+        all_fitted_indices, error = check_sphere(
+            building_points, sphere_coefficients[0:3], sphere_coefficients[-1])
+        fitted_index[all_fitted_indices] = True
+
+        current_cloud = current_cloud.extract(sphere_indices, True)
+        if current_cloud.size < 1000*point_number_scale:
+            break
+        current_points = cloud_points(current_cloud)
+
+
+def fit_building(task):
+    '''
+    fits cylinders and spheres to one building cluster.
+    task is (building label, points, geon labels, seed); returns the
+    building label, its geons, a mask of the fitted points and the items
+    to draw. The seed makes numpy's global RNG reproducible per cluster, and
+    pcl's RANSAC restarts from its fixed seed in every segment() call, so
+    the result does not depend on which worker runs the cluster.
+    '''
+    building, building_points, geon_labels, seed = task
+    np.random.seed(seed)
+    building_points = np.ascontiguousarray(building_points, dtype=np.float32)
+
+    geon_model = []
+    plot_items = []
+    fitted_index = np.zeros(building_points.shape[0], dtype=bool)
+    geon_count = np.bincount(geon_labels, minlength=geon_type_number)
+
+    if geon_count[cylinder_index] > 0.1*len(geon_labels):
+        fit_cylinders(building_points, building_points[geon_labels == cylinder_index],
+                      geon_model, fitted_index, plot_items)
+
+    if geon_count[sphere_index] > 0.3*len(geon_labels):
+        fit_spheres(building_points, building_points[geon_labels == sphere_index],
+                    geon_model, fitted_index, plot_items)
+
+    for geon in geon_model:
+        geon['building'] = building
+    return building, geon_model, fitted_index, plot_items
+
+
+def building_tasks(point_list, building_label_list, geon_label_list, seed=0, min_points=300):
+    '''
+    splits the cloud into per building clusters, in label order.
+    Yields (indices, task) with task None for clusters too small to fit.
+    '''
+    order = np.argsort(building_label_list, kind='stable')
+    counts = np.bincount(building_label_list)
+    for building, indices in enumerate(np.split(order, np.cumsum(counts)[:-1])):
+        if len(indices) < min_points:
+            yield indices, None
+        else:
+            yield indices, (building, point_list[indices], geon_label_list[indices],
+                            seed + building)
+
+
+def fit_buildings(point_list, building_label_list, geon_label_list, workers=1, seed=0):
+    '''
+    fits all building clusters, on a pool of workers processes when
+    workers > 1. Returns the geons, the indices of the points no geon
+    covers and the items to draw, all in building order.
+    '''
+    point_list = np.ascontiguousarray(point_list, dtype=np.float32)
+    all_indices = []
+    tasks = []
+    for indices, task in building_tasks(point_list, building_label_list,
+                                        geon_label_list, seed):
+        all_indices.append(indices)
+        if task is not None:
+            tasks.append(task)
+
+    if workers > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(min(workers, len(tasks)))
+        try:
+            results = dict((r[0], r[1:]) for r in pool.imap(fit_building, tasks))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = dict((task[0], fit_building(task)[1:]) for task in tasks)
+
+    geon_model = []
+    plot_items = []
+    all_remaining_index = []
+    for building, indices in enumerate(all_indices):
+        if building not in results:
+            all_remaining_index.append(indices)
+            continue
+        building_geons, fitted_index, building_plot = results[building]
+        geon_model.extend(building_geons)
+        plot_items.extend(building_plot)
+        all_remaining_index.append(indices[~fitted_index])
+    all_remaining_index = np.concatenate(all_remaining_index) if all_remaining_index \
+        else np.zeros(0, dtype=np.int64)
+    return geon_model, all_remaining_index, plot_items
+
+
+def write_geon_table(filename, geon_model):
+    '''
+    columnar copy of the geons: one array per parameter, prefixed by the
+    geon name, e.g. sphere_radius or poly_cylinder_centroid
+    '''
+    columns = {}
+    for name, fields in GEON_COLUMNS.items():
+        geons = [geon for geon in geon_model if geon['name'] == name]
+        columns[name + '_building'] = np.asarray([geon.get('building', -1) for geon in geons],
+                                                 dtype=np.int32)
+        for i, field in enumerate(fields):
+            values = [geon['model'][i] for geon in geons]
+            if field == 'mean_diff':
+                # per point errors of the 2D fit, keep their mean
+                values = [np.mean(value) for value in values]
+            values = np.asarray(values, dtype=np.float64)
+            if len(geons) == 0 and field in ('centroid', 'ex', 'ey', 'coefficients', 'center'):
+                values = values.reshape(0, 3)
+            columns[name + '_' + field] = values
+    np.savez(filename, **columns)
+
+
+def save_png(filename, plot_items, remaining_points):
+    import matplotlib as mpl
+    mpl.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure()
+    ax = fig.add_subplot(111, projection='3d')
+    for kind, item, color in plot_items:
+        if kind == 'sphere':
+            draw_sphere(ax, *item)
+        else:
+            ax.scatter(item[:, 0], item[:, 1], item[:, 2],
+                       zdir='z', s=1, c='C{}'.format(color), rasterized=True, alpha=0.5)
+
+    if len(remaining_points) > 0:
+        show_cloud = make_cloud(remaining_points)
+        vg = show_cloud.make_voxel_grid_filter()
+        vg.set_leaf_size(2, 2, 2)
+        show_points = cloud_points(vg.filter())
+        ax.scatter(show_points[:, 0], show_points[:, 1], show_points[:, 2],
+                   zdir='z', s=1, c='C{}'.format(9), alpha=0.01)
+
+    utils.axisEqual3D(ax)
+    plt.savefig(filename, bbox_inches='tight')
+    plt.close()
+
+
 def main(args):
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -112,7 +380,7 @@ def main(args):
         # default='/home/xuzhang/project/Core3D/danesfield_gitlab/danesfield/geon_fitting/outlas/out_D4.txt',
         type=str,
         help='Input labelled point cloud. The point cloud should has geon type label, \
-        output txt from roof_segmentation.py. ')
+        output txt (or .npy/.npz) from roof_segmentation.py. ')
     parser.add_argument(
         '--output_png',
         # default='../segmentation_graph/out.png',
@@ -122,296 +390,54 @@ def main(args):
         '--output_txt',
         # default='../outlas/remain_D4.txt',
         type=str,
-        help='Output txt result file includes all planar points for Purdue to process.')
+        help='Output txt result file includes all planar points for Purdue to process. '
+        'A .npy/.npz name writes the binary point cloud instead.')
     parser.add_argument(
         '--output_geon',
         # default='../out_geon/D4_Curve_Geon.npy',
         type=str,
         help='Output geon file.')
+    parser.add_argument(
+        '--output_geon_table',
+        type=str,
+        help='Optional columnar (npz) copy of the geon parameters.')
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help='Number of processes fitting building clusters in parallel.')
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        help='Base seed, cluster i is fitted with seed + i.')
     args = parser.parse_args(args)
 
     point_list, building_label_list, geon_label_list = utils.read_geon_type_pc(
         args.input_pc)
     center_of_mess = np.mean(point_list, axis=0)
     point_list = point_list - center_of_mess
-    point_list = point_list.astype(np.float32)
-    cloud_filtered = pcl.PointCloud()
-    cloud_filtered.from_array(point_list)
+    point_list = np.ascontiguousarray(point_list, dtype=np.float32)
 
-    print(cloud_filtered.size)
+    print(point_list.shape[0])
 
-    fig = plt.figure()
-    ax = fig.add_subplot(111, projection='3d')
+    geon_model, all_remaining_index, plot_items = fit_buildings(
+        point_list, building_label_list, geon_label_list,
+        workers=args.workers, seed=args.seed)
 
-    geon_model = []
-    # all_vertex = []
-    # all_face = []
-    all_remaining_index = []
-    index = 0
-
-    building_index_list = []
-    building_max_index = np.max(building_label_list)
-    total_list = np.arange(building_label_list.shape[0])
-    for i in range(building_max_index+1):
-        current_list = total_list[building_label_list == i]
-        building_index_list.append(current_list)
-
-    geon_type_number = 4
-    cylinder_index = 2
-    sphere_index = 3
-
-    point_number_scale = 1
-    # c_index = 0
-    for indices in building_index_list:
-        if len(indices) < 300:
-            if len(all_remaining_index) == 0:
-                all_remaining_index = copy.copy(indices)
-            else:
-                all_remaining_index = np.concatenate(
-                    (all_remaining_index, indices), axis=None)
-            continue
+    remaining_point_list = point_list[all_remaining_index]
+    remaining_geon_list = geon_label_list[all_remaining_index]
 
-        geon_index_list = []
-        for i in range(geon_type_number):
-            geon_index_list.append([])
-
-        building_points = np.zeros((len(indices), 3), dtype=np.float32)
-        num_building_points = len(indices)
-
-        for i, indice in enumerate(indices):
-            building_points[i][0] = cloud_filtered[indice][0]
-            building_points[i][1] = cloud_filtered[indice][1]
-            building_points[i][2] = cloud_filtered[indice][2]
-
-        for i, indice in enumerate(indices):
-            geon_index_list[geon_label_list[indice]].append(indice)
-
-        fitted_index = np.zeros(len(indices), dtype=np.int32)
-        fitted_index = fitted_index == 1
-
-        if len(geon_index_list[cylinder_index]) > 0.1*len(indices):
-            points = np.zeros(
-                (len(geon_index_list[cylinder_index]), 3), dtype=np.float32)
-            for i, indice in enumerate(geon_index_list[cylinder_index]):
-                points[i][0] = cloud_filtered[indice][0]
-                points[i][1] = cloud_filtered[indice][1]
-                points[i][2] = cloud_filtered[indice][2]
-
-            current_cloud = pcl.PointCloud()
-            current_cloud.from_array(points)
-
-            num_current_cylinder_point = current_cloud.size
-            if num_building_points > 15000:
-                vg = current_cloud.make_voxel_grid_filter()
-                vg.set_leaf_size(1, 1, 1)
-                current_cloud = vg.filter()
-
-            num_filtered_building_points = current_cloud.size
-
-            current_points = np.zeros((current_cloud.size, 3), dtype=np.float32)
-            for i in range(current_cloud.size):
-                current_points[i] = current_cloud[i]
-
-            max_r = 80
-            min_r = 40
-            if num_current_cylinder_point > 10000:
-                max_r = 80
-                min_r = 40
-            else:
-                max_r = 30
-                min_r = 10
-
-            while True:
-                cylinder_indices, cylinder_coefficients = fit_cylinder(
-                    current_points, max_r, min_r)
-
-                if len(cylinder_indices) < 1000*point_number_scale:
-                    break
-
-                cylinder_points = np.zeros(
-                    (len(cylinder_indices), 3), dtype=np.float32)
-                for i, indice in enumerate(cylinder_indices):
-                    cylinder_points[i][0] = current_points[indice][0]
-                    cylinder_points[i][1] = current_points[indice][1]
-                    cylinder_points[i][2] = current_points[indice][2]
-
-                (centroid,
-                 ex,
-                 ey,
-                 ez,
-                 fitted_indices,
-                 coefficients,
-                 min_axis_z,
-                 max_axis_z,
-                 mean_diff) = two_D_fitting.fit_2D_curve(cylinder_coefficients[3:-1],
-                                                         cylinder_points,
-                                                         fit_type='poly2',
-                                                         dist_threshold=10)
-
-                for i in range(len(fitted_indices)):
-
-                    if len(fitted_indices[i]) < max(500, 0.05*num_filtered_building_points):
-                        continue
-
-                    fitted_points = np.zeros(
-                        (len(fitted_indices[i]), 3), np.float32)
-                    for j, tmp_idx in enumerate(fitted_indices[i]):
-                        fitted_points[j, :] = cylinder_points[tmp_idx, :]
-
-                    # fitted_wire = utils.draw_poly_curve(
-                    #     ax,
-                    #     centroid,
-                    #     ex,
-                    #     ey,
-                    #     fitted_points,
-                    #     coefficients,
-                    #     min_axis_z[i],
-                    #     max_axis_z[i],
-                    #     'C{}'.format(2))
-                    ax.scatter(fitted_points[:, 0], fitted_points[:, 1], fitted_points[:, 2],
-                               zdir='z', s=1, c='C{}'.format(2), rasterized=True, alpha=0.5)
-
-                    (all_fitted_indices,
-                     ortho_x_max,
-                     ortho_x_min,
-                     error) = two_D_fitting.check_2D_curve(ex,
-                                                           ey,
-                                                           ez,
-                                                           coefficients,
-                                                           centroid,
-                                                           building_points,
-                                                           min_axis_z[i],
-                                                           max_axis_z[i],
-                                                           fit_type='poly2')
-                    fitted_index[all_fitted_indices] = True
-
-                    # ortho_x = np.matmul(fitted_points - centroid, ex)
-                    geon_model.append({'name': 'poly_cylinder', 'model':
-                                       [centroid, ex, ey, coefficients, min_axis_z[i],
-                                        max_axis_z[i], ortho_x_min, ortho_x_max,
-                                        len(fitted_indices[i]), mean_diff]})
-
-                current_cloud = current_cloud.extract(cylinder_indices, True)
-                if current_cloud.size < max(500, 0.1*num_filtered_building_points):
-                    break
-
-                current_points = np.zeros(
-                    (current_cloud.size, 3), dtype=np.float32)
-                for i in range(current_cloud.size):
-                    current_points[i][0] = current_cloud[i][0]
-                    current_points[i][1] = current_cloud[i][1]
-                    current_points[i][2] = current_cloud[i][2]
-
-        # print([len(x) for x in geon_index_list])
-        if len(geon_index_list[sphere_index]) > 0.3*len(indices):
-            points = np.zeros(
-                (len(geon_index_list[sphere_index]), 3), dtype=np.float32)
-            for i, indice in enumerate(geon_index_list[sphere_index]):
-                points[i][0] = cloud_filtered[indice][0]
-                points[i][1] = cloud_filtered[indice][1]
-                points[i][2] = cloud_filtered[indice][2]
-
-            current_cloud = pcl.PointCloud()
-            current_cloud.from_array(points)
-
-            if num_building_points > 10000:
-                vg = current_cloud.make_voxel_grid_filter()
-                vg.set_leaf_size(1, 1, 1)
-                current_cloud = vg.filter()
-
-            current_points = np.zeros((current_cloud.size, 3), dtype=np.float32)
-            for i in range(current_cloud.size):
-                current_points[i] = current_cloud[i]
-
-            while True:
-                sphere_indices, sphere_coefficients, min_lst, max_lst = fit_sphere(
-                    current_points)
-                if len(sphere_indices) < 200*point_number_scale:
-                    break
-
-                if sphere_coefficients[-1] > 0:
-                    draw_sphere(
-                        ax,
-                        sphere_coefficients[0:3],
-                        sphere_coefficients[-1],
-                        min_lst[0],
-                        max_lst[0])
-
-                sphere_points = np.zeros(
-                    (len(sphere_indices), 3), dtype=np.float32)
-                for i, indice in enumerate(sphere_indices):
-                    sphere_points[i][0] = current_points[indice][0]
-                    sphere_points[i][1] = current_points[indice][1]
-                    sphere_points[i][2] = current_points[indice][2]
-
-                ax.scatter(sphere_points[:, 0], sphere_points[:, 1], sphere_points[:, 2],
-                           zdir='z', s=1, c='C{}'.format(3), rasterized=True, alpha=0.5)
-
-                geon_model.append({'name': 'sphere', 'model': [sphere_coefficients[0:3],
-                                                               sphere_coefficients[-1],
-                                                               min_lst[0],
-                                                               max_lst[0],
-                                                               len(sphere_indices)]})
-
-                all_fitted_indices, error = check_sphere(
-                    building_points, sphere_coefficients[0:3], sphere_coefficients[-1])
-                fitted_index[all_fitted_indices] = True
-
-                current_cloud = current_cloud.extract(sphere_indices, True)
-                if current_cloud.size < 1000*point_number_scale:
-                    break
-
-                current_points = np.zeros(
-                    (current_cloud.size, 3), dtype=np.float32)
-                for i in range(current_cloud.size):
-                    current_points[i][0] = current_cloud[i][0]
-                    current_points[i][1] = current_cloud[i][1]
-                    current_points[i][2] = current_cloud[i][2]
-
-        remaining_index_list = indices[fitted_index == False]  # noqa: E712
-
-        if len(all_remaining_index) == 0:
-            all_remaining_index = copy.copy(remaining_index_list)
-        else:
-            all_remaining_index = np.concatenate(
-                (all_remaining_index, remaining_index_list), axis=None)
-
-    remaining_point_list = []
-    remaining_geon_list = []
-    for index in all_remaining_index:
-        remaining_point_list.append(point_list[index, :])
-        remaining_geon_list.append(geon_label_list[index])
-
-    remaining_point_list = np.asarray(remaining_point_list)
-
-    show_cloud = pcl.PointCloud()
-    show_cloud.from_array(remaining_point_list)
-
-    vg = show_cloud.make_voxel_grid_filter()
-    vg.set_leaf_size(2, 2, 2)
-    show_cloud = vg.filter()
-    show_points = np.zeros((show_cloud.size, 3), dtype=np.float32)
-    for i in range(show_cloud.size):
-        show_points[i, :] = show_cloud[i]
-
-    ax.scatter(show_points[:, 0], show_points[:, 1], show_points[:, 2],
-               zdir='z', s=1, c='C{}'.format(9), alpha=0.01)
+    if args.output_png:
+        save_png(args.output_png, plot_items, remaining_point_list)
 
     remaining_point_list = remaining_point_list + center_of_mess
 
-    fout = open('{}'.format(args.output_txt), mode='w')
-
-    for point_idx in range(remaining_point_list.shape[0]):
-        fout.write('{} {} {} {}\n'.format(remaining_point_list[point_idx, 0],
-                                          remaining_point_list[point_idx, 1],
-                                          remaining_point_list[point_idx, 2],
-                                          remaining_geon_list[point_idx]))
-
-    utils.axisEqual3D(ax)
-    plt.savefig(args.output_png, bbox_inches='tight')
-    plt.close()
+    utils.write_label_pc(args.output_txt, remaining_point_list, remaining_geon_list)
 
     pickle.dump([center_of_mess, geon_model], open(args.output_geon, "wb"))
+    if args.output_geon_table:
+        write_geon_table(args.output_geon_table, geon_model)
 
 
 if __name__ == "__main__":
@@ -26,7 +26,8 @@ sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
                              "../danesfield/segmentation/semantic"))
 
 
-def predict(rgbpath, dsmpath, dtmpath, msipath, outdir, outfname, config):
+def predict(rgbpath, dsmpath, dtmpath, msipath, outdir, outfname, config,
+            device=None, tile_batch_size=4):
     img_data = np.transpose(gdal.Open(rgbpath).ReadAsArray(), (1, 2, 0))
 
     dsm_data = gdal.Open(dsmpath).ReadAsArray()
@@ -49,7 +50,7 @@ def predict(rgbpath, dsmpath, dtmpath, msipath, outdir, outfname, config):
     input_data = input_data.astype(np.float32)
     input_data = (input_data - 0.5)*2
 
-    keval = Evaluator(config)
+    keval = Evaluator(config, device=device, tile_batch_size=tile_batch_size)
     keval.onepredict(input_data, dsmpath, outdir, outfname)
 
 
@@ -63,6 +64,10 @@ def main(args):
     parser.add_argument('msipath', help='8-band float MSI file path')
     parser.add_argument('outdir', help='directory in which to write output files')
     parser.add_argument('outfname', help='out filename for prediction probability and class mask')
+    parser.add_argument('--device', choices=['cpu', 'cuda'],
+                        help='Device used for inference; defaults to cuda when available.')
+    parser.add_argument('--tile_batch_size', type=int, default=4,
+                        help='Number of 1024x1024 tiles evaluated per forward pass.')
     args = parser.parse_args(args)
 
     with open(args.config_path, 'r') as f:
@@ -79,7 +84,8 @@ def main(args):
     config = Config(**cfg)
     config = update_config(config, img_rows=2048, img_cols=2048, target_rows=2048,
                            target_cols=2048, num_channels=5)
-    predict(rgbpath, dsmpath, dtmpath, msipath, args.outdir, outfname, config)
+    predict(rgbpath, dsmpath, dtmpath, msipath, args.outdir, outfname, config,
+            device=args.device, tile_batch_size=args.tile_batch_size)
 
 
 if __name__ == "__main__":
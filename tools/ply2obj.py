@@ -6,12 +6,158 @@
 # See accompanying Copyright.txt and LICENSE files for details
 ###############################################################################
 
+'''
+Generate OBJ files from building PLY files. Buildings are converted
+independently in a process pool; every OBJ is written atomically and a
+JSON manifest records the time spent on each building and any failure.
+The model logs of Model.initialize and Model.write_model are written
+too, with the totals of the converted buildings.
+'''
 
 import os
 import sys
+import json
 import time
 import argparse
-from danesfield.surface.scene import Model
+import traceback
+from multiprocessing import Pool
+from danesfield.surface.scene import (Model, get_dem_parameter, get_model_log, get_obj_text,
+                                      get_surface_info, write_atomic)
+
+try:
+    from osgeo import gdal
+except ImportError:
+    gdal = None
+
+# DEM heights of the worker process, set once by init_worker
+dem_parameter = None
+
+
+def init_worker(parameter):
+    global dem_parameter
+    dem_parameter = parameter
+
+
+def convert_building(task):
+    '''
+    load, split, close and write one building; returns its manifest record
+    '''
+    fp, obj_path, surface_path, model_offset = task
+    name = os.path.splitext(os.path.basename(fp))[0]
+    record = dict(name=name, ply=fp, status='ok', error=None, surface_num=0, wall_num=0,
+                  edge_num=0, vertex_num=0, surface_info='', seconds={})
+    start_time = time.time()
+    stage_time = start_time
+    stage = 'load'
+    try:
+        building = Model().load_building(fp)
+        record['seconds']['load'] = time.time() - stage_time
+        stage, stage_time = 'split', time.time()
+        building.split_surface()
+        record['seconds']['split'] = time.time() - stage_time
+        stage, stage_time = 'bottom', time.time()
+        building.get_bottomsurface(dem_parameter)
+        building.get_flatsurface()
+        record['seconds']['bottom'] = time.time() - stage_time
+        stage, stage_time = 'write', time.time()
+        write_atomic(os.path.join(obj_path, name + '.obj'),
+                     get_obj_text(building, model_offset))
+        write_atomic(os.path.join(surface_path, name + '.obj'),
+                     ''.join(building.get_top_string(model_offset)))
+        record['seconds']['write'] = time.time() - stage_time
+        record['surface_num'] = building.surface_num
+        record['wall_num'] = building.wall_num
+        record['edge_num'] = building.edge_num
+        record['vertex_num'] = building.vertex_num
+        record['surface_info'] = get_surface_info(name, building)
+    except Exception:
+        record['status'] = 'failed'
+        record['error'] = '{} failed:\n{}'.format(stage, traceback.format_exc())
+    record['seconds']['total'] = time.time() - start_time
+    return record
+
+
+def convert_buildings(tasks, parameter, workers):
+    '''
+    manifest records of all tasks in task order, computed by workers
+    processes; buildings are handed out one at a time so slow ones do not
+    hold back a whole chunk
+    '''
+    records = []
+    if workers > 1 and len(tasks) > 1:
+        with Pool(workers, initializer=init_worker, initargs=(parameter,)) as pool:
+            for record in pool.imap_unordered(convert_building, tasks):
+                records.append(record)
+                print('{} {} {:.2f}s'.format(record['name'], record['status'],
+                                             record['seconds']['total']))
+    else:
+        init_worker(parameter)
+        for task in tasks:
+            records.append(convert_building(task))
+            print('{} {} {:.2f}s'.format(records[-1]['name'], records[-1]['status'],
+                                         records[-1]['seconds']['total']))
+    order = {task[0]: i for i, task in enumerate(tasks)}
+    return sorted(records, key=lambda record: order[record['ply']])
+
+
+def write_model_logs(obj_path, records, generate_time):
+    '''
+    the generate time log next to the OBJ folder and the totals of the
+    converted buildings appended to model_log.txt in it
+    '''
+    with open(obj_path + "_model_log.txt", 'w') as log_file:
+        log_file.write(time.asctime() + '\n######\n')
+        log_file.write('Generate model time:')
+        log_file.write(str(generate_time) + 's' + '\n######\n')
+    converted = [record for record in records if record['status'] == 'ok']
+    surface_num = sum(record['surface_num'] for record in converted)
+    with open(os.path.join(obj_path, "model_log.txt"), 'a+') as log_file:
+        log_file.write(get_model_log(
+            sum(record['seconds']['write'] for record in converted),
+            surface_num, surface_num,
+            sum(record['wall_num'] for record in converted),
+            sum(record['edge_num'] for record in converted),
+            sum(record['vertex_num'] for record in converted),
+            ''.join(record['surface_info'] for record in converted)))
+
+
+def convert_ply_dir(ply_dir, parameter, offset=True, workers=1, manifest_path=None, dem=None):
+    '''
+    convert every PLY file of ply_dir to <ply_dir>_obj and <ply_dir>_surface,
+    write the manifest and the model logs; returns the manifest and its path
+    '''
+    start_time = time.time()
+    obj_path = ply_dir + "_obj"
+    surface_path = ply_dir + "_surface"
+    for path in [obj_path, surface_path]:
+        if not os.path.exists(path):
+            os.makedirs(path)
+    manifest_path = manifest_path or os.path.join(obj_path, 'manifest.json')
+
+    file_name = sorted(fp for fp in os.listdir(ply_dir) if fp.endswith('.ply'))
+    m = Model()
+    for fp in file_name:
+        try:
+            m.get_offset(os.path.join(ply_dir, fp))
+        except Exception as e:
+            # the conversion of this building fails too and is reported there
+            print("Failed to read {}: {}".format(fp, e))
+    if offset and m.x_offset is not None:
+        model_offset = [m.x_offset, m.y_offset, m.z_offset]
+    else:
+        model_offset = [0, 0, 0]
+
+    tasks = [(os.path.join(ply_dir, fp), obj_path, surface_path, model_offset)
+             for fp in file_name]
+    records = convert_buildings(tasks, parameter, max(1, workers))
+    write_model_logs(obj_path, records, time.time() - start_time)
+
+    failed = [record['name'] for record in records if record['status'] != 'ok']
+    manifest = dict(ply_dir=ply_dir, dem=dem, workers=workers,
+                    offset=[float(x) for x in model_offset], seconds=time.time() - start_time,
+                    failed=failed, buildings=records)
+    write_atomic(manifest_path, json.dumps(manifest, indent=2))
+    return manifest, manifest_path
 
 
 def main(args):
@@ -23,6 +169,11 @@ def main(args):
                         help='DEM file name to read', required=True)
     parser.add_argument('-o', '--offset', action='store_true', default=True,
                         help='Apply an offset', required=False)
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(),
+                        help='Number of buildings converted in parallel')
+    parser.add_argument('-m', '--manifest',
+                        help='Manifest JSON file to write, '
+                        'default is manifest.json in the OBJ folder')
     args = parser.parse_args(args)
 
     if not os.path.isdir(args.ply_dir):
@@ -32,16 +183,18 @@ def main(args):
     if not os.path.exists(args.dem):
         raise RuntimeError("Error: Failed to open DEM {}".format(args.dem))
 
-    start_time = time.time()
-    m = Model()
-    m.initialize(args.ply_dir, args.dem)
-    generate_model_time = time.time()
-    m.write_model(args.offset)
-    write_obj_time = time.time()
-    m.write_surface()
+    parameter = get_dem_parameter(gdal.Open(args.dem))
+    manifest, manifest_path = convert_ply_dir(args.ply_dir, parameter, args.offset, args.workers,
+                                              args.manifest, args.dem)
+    records = manifest['buildings']
+
+    slowest = sorted(records, key=lambda record: -record['seconds']['total'])[:5]
     print(args.ply_dir + " completed!")
-    print("generate time: " + str(generate_model_time - start_time))
-    print("write obj file time: " + str(write_obj_time - start_time))
+    print("{} buildings, {} failed, total time: {:.2f}s".format(
+        len(records), len(manifest['failed']), manifest['seconds']))
+    for record in slowest:
+        print("  slowest: {} {:.2f}s".format(record['name'], record['seconds']['total']))
+    print("manifest: " + manifest_path)
 
 
 if __name__ == "__main__":
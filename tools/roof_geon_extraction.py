@@ -18,6 +18,7 @@ geon JSON.
 
 import argparse
 import itertools
+import json
 import os
 import shutil
 import subprocess
@@ -26,6 +27,9 @@ import re
 
 from pathlib import Path
 
+import numpy as np
+
+from danesfield.geon_fitting.tensorflow import utils
 import roof_segmentation
 import fitting_curved_plane
 import geon_to_mesh
@@ -38,6 +42,30 @@ def convert_lastext_to_las(infile, outfile):
                    check=True)
 
 
+def convert_points_to_las(infile, outfile):
+    """
+    Write a LAS file from las text (through txt2las) or from a binary
+    point cloud (through PDAL), the label going to the classification.
+    """
+    if not utils.is_binary_pc(infile):
+        convert_lastext_to_las(infile, outfile)
+        return
+    import pdal
+    points, _, label = utils.read_binary_pc(infile)
+    array = np.zeros(points.shape[0], dtype=[('X', '<f8'), ('Y', '<f8'), ('Z', '<f8'),
+                                             ('Classification', 'u1')])
+    array['X'] = points[:, 0]
+    array['Y'] = points[:, 1]
+    array['Z'] = points[:, 2]
+    array['Classification'] = np.maximum(label, 0)
+    pipeline = json.dumps({'pipeline': [{'type': 'writers.las',
+                                         'filename': outfile,
+                                         'scale_x': 0.01,
+                                         'scale_y': 0.01,
+                                         'scale_z': 0.01}]})
+    pdal.Pipeline(pipeline, arrays=[array]).execute()
+
+
 def main(args):
     # Configure argument parser
     parser = argparse.ArgumentParser(description=__doc__)
@@ -71,6 +99,10 @@ def main(args):
         type=str,
         required=True,
         help='Directory containing the model files')
+    parser.add_argument(
+        '--text_pc',
+        action='store_true',
+        help='Pass point clouds between the steps as text instead of .npy')
 
     # Parse arguments
     args = parser.parse_args(args)
@@ -93,8 +125,9 @@ def main(args):
     # Run Columbia's roof segmentation script
     print("* Running Columbia's roof segmentation")
     roof_segmentation_png = os.path.join(args.output_dir, "roof_seg.png")
+    pc_ext = "txt" if args.text_pc else "npy"
     roof_segmentation_txt = os.path.join(args.output_dir,
-                                         "roof_seg_outlas.txt")
+                                         "roof_seg_outlas.{}".format(pc_ext))
     roof_segmentation.main(['--model_prefix', args.model_prefix,
                             '--model_dir', args.model_dir,
                             '--input_pc', building_segmentation_txt,
@@ -109,7 +142,7 @@ def main(args):
                                       "curve_fitting_output_geon.geon")
     curve_fitting_remaining_txt = \
         os.path.join(args.output_dir,
-                     "curve_fitting_remaining_outlas.txt")
+                     "curve_fitting_remaining_outlas.{}".format(pc_ext))
     fitting_curved_plane.main(['--input_pc', roof_segmentation_txt,
                                '--output_png', curve_fitting_png,
                                '--output_txt', curve_fitting_remaining_txt,
@@ -130,12 +163,12 @@ def main(args):
     # leftover from Columbia's roof segmentation
     # Purdue's Segmentation code expects a binary LAS file, so we
     # first convert it
-    print("* Converting remaining points from las text to las")
+    print("* Converting remaining points to las")
     curve_fitting_remaining_las = \
         os.path.join(args.output_dir,
                      "curve_fitting_remaining_outlas.las")
-    convert_lastext_to_las(curve_fitting_remaining_txt,
-                           curve_fitting_remaining_las)
+    convert_points_to_las(curve_fitting_remaining_txt,
+                          curve_fitting_remaining_las)
 
     print("* Running Purdue's segmentation on remaining points las")
     subprocess.run(['segmentation', curve_fitting_remaining_las], check=True)
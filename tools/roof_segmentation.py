@@ -14,13 +14,11 @@ import os
 import sys
 # from Loggers import Logger
 
-from tqdm import tqdm
-
-from danesfield.geon_fitting.tensorflow import roof_type_segmentation
+from danesfield.geon_fitting.tensorflow import utils
+from danesfield.geon_fitting.tensorflow import clustering
+from danesfield.geon_fitting.tensorflow import roof_type_inference
 
 from mpl_toolkits.mplot3d import Axes3D
-import pcl
-import scipy.spatial
 import matplotlib as mpl
 # Force 'Agg' backend
 mpl.use('Agg')
@@ -28,6 +26,8 @@ import matplotlib.pyplot as plt  # noqa: E402
 
 
 def read_txt_pc(filename):
+    if utils.is_binary_pc(filename):
+        return utils.read_binary_pc(filename)[0]
     point_list = []
     with open(filename, 'r') as pc_file:
         for line in pc_file:
@@ -113,7 +113,7 @@ def main(args):
     parser.add_argument(
         '--output_txt',
         type=str,
-        help='Output txt result file.')
+        help='Output txt result file, binary for a .npy/.npz name.')
     parser.add_argument(
         '--num_point',
         type=int,
@@ -124,6 +124,14 @@ def main(args):
         type=int,
         default=32,
         help='Batch Size during training [default: 32]')
+    parser.add_argument(
+        '--cpu',
+        action='store_true',
+        help='Run on the CPU, with the numpy versions of the PointNet++ ops.')
+    parser.add_argument(
+        '--seed',
+        type=int,
+        help='Seed of the per building point resampling.')
     args = parser.parse_args(args)
 
     # Accept either combined model directory/prefix or separate directory and prefix
@@ -138,79 +146,24 @@ def main(args):
     BATCH_SIZE = args.batch_size
     NUM_POINT = args.num_point
 
-    os.environ['CUDA_VISIBLE_DEVICES'] = '{}'.format(args.gpu_id)
+    if args.cpu:
+        os.environ['CUDA_VISIBLE_DEVICES'] = ''
+        os.environ['TF_OPS_CPU'] = '1'
+    else:
+        os.environ['CUDA_VISIBLE_DEVICES'] = '{}'.format(args.gpu_id)
+    # imported here so the PointNet++ ops see TF_OPS_CPU when they load
+    from danesfield.geon_fitting.tensorflow import roof_type_segmentation
 
     NUM_CLASSES = 4
 
-    center_of_mess = np.array([0, 0, 0])
-
-    dataset_point_list = []
-    show_point_list = []
-    original_point_list = []
-    choice_list = []
-
     point_list = read_txt_pc('{}'.format(args.input_pc))
     point_list = point_list.astype(np.float32)
 
     center_of_mess = np.mean(point_list, axis=0)
     point_list = point_list - center_of_mess
 
-    cloud = pcl.PointCloud()
-    cloud.from_array(point_list)
-
-    remaining_cloud = cloud
-    # nr_points = remaining_cloud.size
-    tree = remaining_cloud.make_kdtree()
-
-    ec = remaining_cloud.make_EuclideanClusterExtraction()
-    ec.set_ClusterTolerance(2)
-    ec.set_MinClusterSize(100)
-    ec.set_MaxClusterSize(550000)
-    ec.set_SearchMethod(tree)
-    cluster_indices = ec.Extract()
-
-    tmp_point_list = []
-    tmp_show_point_list = []
-    tmp_original_point_list = []
-    tmp_choice_list = []
-
-    for j, indices in enumerate(cluster_indices):
-        points = np.zeros((len(indices), 3), dtype=np.float32)
-        # point_label = np.zeros((len(indices),), dtype=np.int32)
-
-        for i, indice in enumerate(indices):
-            points[i][0] = remaining_cloud[indice][0]
-            points[i][1] = remaining_cloud[indice][1]
-            points[i][2] = remaining_cloud[indice][2]
-
-        tmp_original_point_list.append((points+center_of_mess).copy())
-
-        point_data = points.copy()
-        max_x = np.amax(point_data[:, 0])
-        min_x = np.amin(point_data[:, 0])
-        max_y = np.amax(point_data[:, 1])
-        min_y = np.amin(point_data[:, 1])
-        max_z = np.amax(point_data[:, 2])
-        min_z = np.amin(point_data[:, 2])
-        max_scale = max((max_x-min_x), (max_y-min_y), (max_z-min_z))
-        center = np.mean(point_data, axis=0)
-        point_data[:, 0] = (point_data[:, 0]-center[0])/max_scale*2
-        point_data[:, 1] = (point_data[:, 1]-center[1])/max_scale*2
-        point_data[:, 2] = (point_data[:, 2]-center[2])/max_scale*2
-
-        choice = np.random.choice(points.shape[0], NUM_POINT, replace=True)
-        tmp_choice_list.append(choice.copy())
-
-        normed_points = point_data[choice, :]
-        show_point = points[choice, :]
-
-        tmp_point_list.append(normed_points)
-        tmp_show_point_list.append(show_point)
-
-    dataset_point_list.append(tmp_point_list)
-    show_point_list.append(tmp_show_point_list)
-    original_point_list.append(tmp_original_point_list)
-    choice_list.append(tmp_choice_list)
+    cluster_labels = clustering.euclidean_cluster_labels(
+        point_list, tolerance=2, min_size=100, max_size=550000)
 
     with tf.Graph().as_default():
         pointclouds_pl, labels_pl = roof_type_segmentation.placeholder_inputs(
@@ -220,7 +173,7 @@ def main(args):
         # Note the global_step=batch parameter to minimize.
         # That tells the optimizer to helpfully increment
         # the 'batch' parameter for you every time it trains.
-        batch = tf.Variable(0)
+        batch = tf.Variable(0)  # noqa: F841
 
         print("--- Get model and loss")
         # Get model and loss
@@ -232,106 +185,43 @@ def main(args):
         config.gpu_options.allow_growth = True
         config.allow_soft_placement = True
         config.log_device_placement = False
+        if args.cpu:
+            config.device_count['GPU'] = 0
         sess = tf.Session(config=config)
 
         # Add ops to save and restore all the variables.
         saver = tf.train.Saver()
         saver.restore(sess=sess, save_path='{}'.format(args.model_path))
 
-        # Init variables
-        ops = {'pointclouds_pl': pointclouds_pl,
-               'labels_pl': labels_pl,
-               'is_training_pl': is_training_pl,
-               'pred': pred,
-               'step': batch,
-               'end_points': end_points}
-        test_pc(sess,
-                ops,
-                dataset_point_list,
-                show_point_list,
-                original_point_list,
-                center_of_mess,
-                BATCH_SIZE,
-                NUM_POINT,
-                args.output_png,
-                args.output_txt)
-
-
-def get_pc_batch(dataset, start_idx, end_idx, NUM_POINT):
-    bsize = end_idx - start_idx
-    batch_data = np.zeros((bsize, NUM_POINT, 3))
-    for i in range(bsize):
-        batch_data[i, :] = dataset[start_idx+i]
-    return batch_data
-
-
-def test_pc(sess,
-            ops,
-            dataset_point_list,
-            show_point_list,
-            original_point_list,
-            center_of_mess,
-            BATCH_SIZE,
-            NUM_POINT,
-            output_png,
-            output_txt=None):
-    """ ops: dict mapping from string to tf ops """
-    is_training = False
-    for index in range(len(dataset_point_list)):
-
-        if output_txt:
-            fout = open('{}'.format(output_txt), mode='w')
-
-        fig = plt.figure()
-        ax = fig.add_subplot(111, projection='3d')
-
-        num_batches = int(len(dataset_point_list[index]) / BATCH_SIZE)+1
-        for batch_idx in range(num_batches):
-            start_idx = batch_idx * BATCH_SIZE
-            end_idx = min((batch_idx + 1) * BATCH_SIZE, len(dataset_point_list[index]))
-            if start_idx >= end_idx:
-                break
-
-            batch_data = get_pc_batch(dataset_point_list[index], start_idx, end_idx, NUM_POINT)
-            batch_show_data = get_pc_batch(show_point_list[index], start_idx, end_idx, NUM_POINT)
-
-            aug_data = batch_data
-            feed_dict = {ops['pointclouds_pl']: aug_data,
-                         ops['is_training_pl']: is_training}
-            step, pred_val = sess.run([ops['step'], ops['pred']], feed_dict=feed_dict)
-            pred_val = np.argmax(pred_val, 2)
-
-            for i in tqdm(range(end_idx-start_idx)):
-                draw_classification_result(ax, batch_show_data[i], pred_val[i, :])
-                if output_txt:
-                    tmp_original_points = original_point_list[index][start_idx+i]
-                    tmp_show_points = show_point_list[index][start_idx+i]
-                    tmp_label = np.zeros((tmp_original_points.shape[0],))
-                    matrix_distance = scipy.spatial.distance_matrix(
-                        tmp_original_points-center_of_mess,
-                        tmp_show_points)
-                    best_idx = np.argmin(matrix_distance, axis=1)
-                    # if np.sum(pred_val[i,:]==2)>200:
-                    #    print(start_idx+i)
-                    #    print(np.sum(pred_val[i,:]==2))
-                    #    print(tmp_original_points.shape)
-                    #    print(tmp_show_points.shape)
-                    #    print(best_idx[:100])
-                    for point_idx in range(tmp_original_points.shape[0]):
-                        tmp_label[point_idx] = pred_val[i, best_idx[point_idx]]
-                        fout.write('{} {} {} {} {}\n'.format(tmp_original_points[point_idx, 0],
-                                                             tmp_original_points[point_idx, 1],
-                                                             tmp_original_points[point_idx, 2],
-                                                             start_idx+i,
-                                                             pred_val[i, best_idx[point_idx]]))
-        if output_txt:
-            fout.close()
-
-        axisEqual3D(ax)
-        plt.savefig(output_png, bbox_inches='tight')
-        plt.close()
-
-    return
+        def predict(batch_data):
+            return sess.run(pred, feed_dict={pointclouds_pl: batch_data,
+                                             is_training_pl: False})
+
+        (point_labels,
+         sample_index,
+         sample_labels,
+         points_per_second) = roof_type_inference.classify_clusters(
+             predict, point_list, cluster_labels, NUM_POINT, BATCH_SIZE,
+             rng=np.random.RandomState(args.seed))
+    log_string('Labelled {} points of {} buildings, {:.0f} points/s'.format(
+        np.count_nonzero(cluster_labels >= 0), sample_index.shape[0], points_per_second))
+
+    fig = plt.figure()
+    ax = fig.add_subplot(111, projection='3d')
+    if sample_index.size > 0:
+        draw_classification_result(ax, point_list[sample_index.reshape(-1)],
+                                   sample_labels.reshape(-1))
+    axisEqual3D(ax)
+    plt.savefig(args.output_png, bbox_inches='tight')
+    plt.close()
+
+    if args.output_txt:
+        # clustered points grouped by building
+        order = np.argsort(cluster_labels, kind='stable')[np.count_nonzero(cluster_labels < 0):]
+        utils.write_geon_type_pc(args.output_txt,
+                                 point_list[order] + center_of_mess,
+                                 cluster_labels[order],
+                                 point_labels[order])
 
 
 if __name__ == "__main__":
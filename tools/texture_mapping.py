@@ -27,7 +27,8 @@ import sys
 import triangulate_mesh
 
 
-def texture_mapping(dsm_file, dtm_file, crops, output_dir, orig_meshes, occlusion_mesh):
+def texture_mapping(dsm_file, dtm_file, crops, output_dir, orig_meshes, occlusion_mesh,
+                    ground_max_error=None):
     dsm = gdal_utils.gdal_open(dsm_file)
     dsmProjection = dsm.GetProjection()
     dsmSrs = osr.SpatialReference(wkt=dsmProjection)
@@ -52,6 +53,8 @@ def texture_mapping(dsm_file, dtm_file, crops, output_dir, orig_meshes, occlusio
     logging.info("---- Generate ground mesh from DTM ----")
     ground_mesh = os.path.join(tri_meshes_dir, "ground.obj")
     cmd_args = [dtm_file, ground_mesh, "--offset"] + list(map(str, offset)) + ["--downsample", "40"]
+    if ground_max_error is not None:
+        cmd_args += ["--max_error", str(ground_max_error)]
     script_call = ["dtm_to_mesh.py"] + cmd_args
     print(*script_call)
     dtm_to_mesh.main(cmd_args)
@@ -144,6 +147,9 @@ def main(args):
                         nargs="+", required=True)
     parser.add_argument("--buildings", help="Source OBJ files representing buildings or roads",
                         nargs="+", required=True)
+    parser.add_argument("--ground_max_error", type=float,
+                        help="Simplify the ground mesh, keeping it within this height "
+                        "of the DTM")
     args = parser.parse_args(args)
 
     # Create the output directory if it doesn't already exist
@@ -153,7 +159,7 @@ def main(args):
         pass
 
     texture_mapping(args.dsm, args.dtm, args.crops, args.output_dir, args.buildings,
-                    args.occlusion_mesh)
+                    args.occlusion_mesh, args.ground_max_error)
 
 
 if __name__ == '__main__':
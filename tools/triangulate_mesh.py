@@ -15,6 +15,8 @@ import sys
 import vtk
 from vtk.util.numpy_support import vtk_to_numpy
 
+from danesfield.obj_io import write_obj
+
 """ This script triangulate a mesh using the VTK Triangle filter """
 
 
@@ -56,12 +58,7 @@ def main(args):
     faces = vtk_to_numpy(faces).reshape((-1, 4))
     vertices = mesh.GetPoints().GetData()
     vertices = vtk_to_numpy(vertices)
-    with open(output_mesh, "w") as out_f:
-        out_f.writelines(header)
-        for v in vertices:
-            out_f.write("v " + " ".join(map(str, v)) + "\n")
-        for f in faces[:, 1:]:
-            out_f.write("f " + " ".join(map(lambda x: str(x+1), f)) + "\n")
+    write_obj(output_mesh, vertices, faces[:, 1:], header=header)
 
 
 if __name__ == "__main__":